@@ -42,6 +42,22 @@ const double SMOOTHING = 0.1;     // 온도 변화 부드러움 정도 (0.0 ~ 1.
 const int LOOP_INTERVAL = 200;
 unsigned long lastLoopTime = 0;
 
+// =========================================================
+// 3. 바이너리 프로토콜 (Pi가 HELLO:BIN1 요청 시 전환)
+// =========================================================
+// [0xA5 0x5A][LEN][TYPE][SEQ][PAYLOAD...][CRC16 LE]
+// LEN = TYPE+SEQ+PAYLOAD 바이트 수, CRC16-CCITT(초기값 0xFFFF)는 LEN ~ PAYLOAD 끝
+const uint8_t FRAME_SYNC0 = 0xA5;
+const uint8_t FRAME_SYNC1 = 0x5A;
+const uint8_t FRAME_SENSORS = 0x01; // payload: [N][int16 LE x N] (0.01도 단위)
+const uint8_t FRAME_CMD = 0x02;     // payload: [그룹][모드][int16 LE 목표온도 0.01도]
+const uint8_t FRAME_ACK = 0x03;     // payload: [그룹][ACK 대상 CMD의 SEQ]
+const uint8_t MAX_RX_FRAME_LEN = 32;
+const int NUM_SENSORS = 5;
+
+bool binaryMode = false; // 협상 전에는 기존 텍스트 프로토콜 사용
+uint8_t txSeq = 0;
+
 void setup() {
   Serial.begin(9600);
   
@@ -64,10 +80,14 @@ void setup() {
 }
 
 void loop() {
-  // 1. 명령 수신 (CMD:GROUP:MODE:TEMP)
+  // 1. 명령 수신 (CMD:GROUP:MODE:TEMP 또는 바이너리 CMD 프레임)
   if (Serial.available() > 0) {
-    String cmd = Serial.readStringUntil('\n');
-    parseCommand(cmd);
+    if (Serial.peek() == FRAME_SYNC0) {
+      readBinaryFrame();
+    } else {
+      String cmd = Serial.readStringUntil('\n');
+      handleTextLine(cmd);
+    }
   }
 
   // 2. 제어 및 시뮬레이션 루프
@@ -171,20 +191,77 @@ void applyToDriver(int idx, int pwm) {
   }
 }
 
+// --- 텍스트 줄 처리 (프로토콜 협상 포함) ---
+void handleTextLine(String line) {
+  line.trim();
+  if (line == "HELLO:BIN1") {
+    // 협상 응답은 텍스트로 보내고, 이후 센서 데이터는 바이너리로 전송
+    Serial.println("HELLO:BIN1:OK");
+    binaryMode = true;
+    return;
+  }
+  parseCommand(line);
+}
+
+// --- CRC16-CCITT (Pi의 binascii.crc_hqx와 동일) ---
+uint16_t crc16(const uint8_t* data, int len) {
+  uint16_t crc = 0xFFFF;
+  for (int i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+// --- 바이너리 프레임 수신 ---
+void readBinaryFrame() {
+  uint8_t header[3];
+  if (Serial.readBytes(header, 3) != 3) return;
+  if (header[0] != FRAME_SYNC0 || header[1] != FRAME_SYNC1) return;
+
+  uint8_t len = header[2];
+  if (len < 2 || len > MAX_RX_FRAME_LEN) return;
+
+  uint8_t body[MAX_RX_FRAME_LEN + 1]; // LEN + TYPE + SEQ + PAYLOAD
+  body[0] = len;
+  if (Serial.readBytes(body + 1, len) != len) return;
+
+  uint8_t crcBytes[2];
+  if (Serial.readBytes(crcBytes, 2) != 2) return;
+  uint16_t crc = crcBytes[0] | ((uint16_t)crcBytes[1] << 8);
+  if (crc16(body, len + 1) != crc) return; // 손상된 프레임 무시
+
+  uint8_t type = body[1];
+  uint8_t* payload = body + 3;
+  int payloadLen = len - 2;
+
+  if (type == FRAME_CMD && payloadLen >= 4) {
+    int idx = (payload[0] == 0) ? 0 : 1;
+    uint8_t mode = payload[1];
+    int16_t centi = (int16_t)(payload[2] | ((uint16_t)payload[3] << 8));
+    groups[idx].mode = (mode == 1) ? "COOLING" : (mode == 2) ? "HEATING" : "OFF";
+    groups[idx].targetTemp = centi / 100.0;
+    sendAck(idx, body[2]);
+  }
+}
+
 // --- 명령 파싱 ---
 void parseCommand(String cmd) {
   cmd.trim(); // 전체 문자열 공백 제거
   if (!cmd.startsWith("CMD:")) return;
-  // CMD:A:COOLING:24
+  // CMD:A:COOLING:24 또는 CMD:A:COOLING:24:SEQ (SEQ가 있으면 ACK 응답)
   int first = cmd.indexOf(':');
   int second = cmd.indexOf(':', first + 1);
   int third = cmd.indexOf(':', second + 1);
 
   if (first == -1 || second == -1 || third == -1) return; // 파싱 오류 방지
+  int fourth = cmd.indexOf(':', third + 1);
 
   String groupChar = cmd.substring(first + 1, second);
   String modeStr = cmd.substring(second + 1, third);
-  String tempStr = cmd.substring(third + 1);
+  String tempStr = (fourth == -1) ? cmd.substring(third + 1) : cmd.substring(third + 1, fourth);
 
   groupChar.trim();
   modeStr.trim();
@@ -193,14 +270,68 @@ void parseCommand(String cmd) {
   int idx = (groupChar == "A") ? 0 : 1;
   groups[idx].mode = modeStr;
   groups[idx].targetTemp = tempStr.toDouble();
+
+  if (fourth != -1) {
+    String seqStr = cmd.substring(fourth + 1);
+    seqStr.trim();
+    sendAck(idx, (uint8_t)seqStr.toInt());
+  }
+}
+
+// --- 명령 수신 확인 (ACK) ---
+void sendAck(int idx, uint8_t seq) {
+  if (binaryMode) {
+    uint8_t frame[3 + 4 + 2];
+    frame[0] = FRAME_SYNC0;
+    frame[1] = FRAME_SYNC1;
+    frame[2] = 4; // TYPE + SEQ + 그룹 + 대상 SEQ
+    frame[3] = FRAME_ACK;
+    frame[4] = txSeq++;
+    frame[5] = idx;
+    frame[6] = seq;
+    uint16_t crc = crc16(frame + 2, 5);
+    frame[7] = crc & 0xFF;
+    frame[8] = (crc >> 8) & 0xFF;
+    Serial.write(frame, sizeof(frame));
+  } else {
+    Serial.print("ACK:");
+    Serial.print(idx == 0 ? "A" : "B");
+    Serial.print(":");
+    Serial.println(seq);
+  }
 }
 
 // --- 데이터 전송 ---
 void sendSensorData() {
+  if (binaryMode) {
+    sendBinarySensorData();
+    return;
+  }
   Serial.print("SENSORS:");
   for(int i=0; i<5; i++) {
     Serial.print((int)simulatedSensors[i]); // 정수로 보내기
     if(i < 4) Serial.print(",");
   }
   Serial.println();
-}
\ No newline at end of file
+}
+
+// --- 바이너리 센서 프레임 전송 (소수점 둘째 자리까지) ---
+void sendBinarySensorData() {
+  const uint8_t len = 2 + 1 + 2 * NUM_SENSORS; // TYPE + SEQ + N + 값
+  uint8_t frame[3 + len + 2];
+  frame[0] = FRAME_SYNC0;
+  frame[1] = FRAME_SYNC1;
+  frame[2] = len;
+  frame[3] = FRAME_SENSORS;
+  frame[4] = txSeq++;
+  frame[5] = NUM_SENSORS;
+  for (int i = 0; i < NUM_SENSORS; i++) {
+    int16_t centi = (int16_t)lround(simulatedSensors[i] * 100.0);
+    frame[6 + 2 * i] = centi & 0xFF;
+    frame[7 + 2 * i] = (centi >> 8) & 0xFF;
+  }
+  uint16_t crc = crc16(frame + 2, len + 1);
+  frame[3 + len] = crc & 0xFF;
+  frame[4 + len] = (crc >> 8) & 0xFF;
+  Serial.write(frame, sizeof(frame));
+}
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""컨트롤러 종단 간 지연/처리량 벤치마크 (Firebase 프로젝트, 아두이노 없이 실행).
+
+InMemoryBackend와 pty 가짜 아두이노(fake_arduino.py)에 실제 컨트롤러 코드를 연결해 측정한다.
+1. 제어 변경 -> 시리얼 쓰기: control/groups/group_1/target_temp 변경부터 아두이노가 CMD를 받을 때까지
+2. 시리얼 RX -> status 업로드: 센서 값이 바뀐 프레임 전송부터 status 리스너가 새 값을 볼 때까지
+3. 지속 처리량: 아두이노가 최대 속도로 보낼 때 초당 수신/처리 프레임 수
+
+사용 예:
+    python3 benchmark.py --runtime asyncio --json result.json
+    python3 benchmark.py --baseline result.json   # 기준 대비 악화되면 종료 코드 1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import wearable_controller as wc
+from cloud_backends import InMemoryBackend, MeteredBackend
+from fake_arduino import FakeArduino
+from storage import OutboundQueue
+
+DEVICE_ID = 'bench'
+WAIT_TIMEOUT = 5.0  # 한 번의 측정에서 결과를 기다리는 최대 시간 (초)
+
+
+def summarize(samples):
+    """지연 표본(초)을 ms 단위 p50/p95/p99/max로 요약."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pct(q):
+        return round(1000 * ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+    return {'n': len(ordered), 'p50_ms': pct(0.50), 'p95_ms': pct(0.95), 'p99_ms': pct(0.99),
+            'max_ms': round(1000 * ordered[-1], 2), 'mean_ms': round(1000 * statistics.fmean(ordered), 2)}
+
+
+def wait_for(predicate, timeout=WAIT_TIMEOUT, interval=0.0005):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def write_config(directory):
+    config = {
+        'device_id': DEVICE_ID,
+        'device_password': '0000',
+        'sensors_config': {f'sensor_{i:02d}': {'name': f'센서 {i}', 'posX': 0.5, 'posY': 0.5} for i in range(1, 6)},
+        'default_preset': 'preset_bench',
+        'edge_control': {'enabled': False},  # 목표 온도가 그대로 전달되는 지연을 재기 위해 로컬 보정은 끔
+        'presets': {'preset_bench': {'name': '벤치마크', 'global_mode': 'cooling',
+                                     'groups': {'group_1': {'target_temp': 24}, 'group_2': {'target_temp': 24}}}},
+    }
+    path = os.path.join(directory, 'config.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    return path
+
+
+class Harness:
+    """선택한 런타임으로 컨트롤러를 백그라운드에서 실행하고 종료한다."""
+
+    def __init__(self, runtime, dev):
+        self.runtime = runtime
+        self.dev = dev
+        self.threads = []
+        self.async_runtime = None
+
+    def start(self):
+        wc.main_loop_running = True
+        if self.runtime == 'asyncio':
+            self.async_runtime = wc.AsyncRuntime([self.dev])
+            self.threads = [threading.Thread(target=asyncio.run, args=(self.async_runtime.run(),))]
+        else:
+            self.threads = [threading.Thread(target=wc.firebase_thread_worker, args=([self.dev],)),
+                            threading.Thread(target=wc.write_scheduler_worker),
+                            threading.Thread(target=wc.arduino_thread_worker, args=(self.dev,))]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        wc.main_loop_running = False
+        rt = self.async_runtime
+        if rt is not None and rt.loop is not None:
+            rt.loop.call_soon_threadsafe(rt._stop.set)
+        for thread in self.threads:
+            thread.join(timeout=10)
+
+
+def bench_control_latency(cloud, fake, iterations):
+    samples = []
+    path = f'devices/{DEVICE_ID}/control/groups/group_1/target_temp'
+    for i in range(iterations):
+        target = 18 + i % 2  # 매번 값이 바뀌도록 번갈아 설정
+        seen = len(fake.received)
+        start = time.perf_counter()
+        cloud.set(path, target)
+        if not wait_for(lambda: any(group == 'A' and temp == target for _, group, _, temp in fake.received[seen:])):
+            continue
+        received_at = next(t for t, group, _, temp in fake.received[seen:] if group == 'A' and temp == target)
+        samples.append(received_at - start)
+        time.sleep(0.01)
+    return samples
+
+
+def bench_publish_latency(cloud, fake, iterations):
+    seen = {}  # sensor_01 값 -> 리스너가 처음 본 시각
+    last_event = [0.0]
+
+    def on_status(event):
+        last_event[0] = time.perf_counter()
+        if event.path == '/sensors/sensor_01/temp':
+            seen.setdefault(event.data, time.perf_counter())
+        elif isinstance(event.data, dict):
+            value = event.data.get('sensors/sensor_01/temp', event.data.get('sensors', {}).get('sensor_01', {}).get('temp'))
+            if value is not None:
+                seen.setdefault(value, time.perf_counter())
+
+    listener = cloud.listen(f'devices/{DEVICE_ID}/status', on_status)
+    last_event[0] = time.perf_counter()  # 직전 업로드가 언제였는지 모르므로 한 주기 기다린 뒤 시작
+    samples = []
+    try:
+        for i in range(iterations):
+            # 데드밴드는 넘고 스파이크 필터 임계값(wc.SENSOR_SPIKE_THRESHOLD)보다는 작게 변경
+            value = 25 + i % 4
+            # status 최소 업로드 간격이 지나야 다음 변경이 바로 업로드된다
+            time.sleep(max(0.0, last_event[0] + wc.TELEMETRY_MIN_INTERVAL + 0.05 - time.perf_counter()))
+            seen.pop(value, None)
+            fake.sent.pop(value, None)
+            fake.set_sensors([value, 24, 24, 24, 24])
+            if wait_for(lambda: value in seen) and value in fake.sent:
+                samples.append(seen[value] - fake.sent[value])
+    finally:
+        listener.close()
+    return samples
+
+
+def bench_throughput(dev, fake, duration):
+    reader = dev.reader
+    frames_before, processed_before = reader.frames_received, dev.counters['frames_processed']
+    sent_before = fake.frames_sent
+    fake.rate = 0  # 최대 속도로 전송
+    time.sleep(duration)
+    fake.rate = 5.0
+    return {
+        'duration_s': duration,
+        'frames_sent_per_s': round((fake.frames_sent - sent_before) / duration, 1),
+        'frames_received_per_s': round((reader.frames_received - frames_before) / duration, 1),
+        'frames_processed_per_s': round((dev.counters['frames_processed'] - processed_before) / duration, 1),
+    }
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='wc-bench-')
+    wc.SERIAL_SETTLE_TIME = 0.1  # pty는 리셋 대기가 필요 없음
+    wc.cloud = MeteredBackend(InMemoryBackend())
+    wc.outbox = OutboundQueue(os.path.join(workdir, 'outbox.db'))
+    wc.firebase_is_connected = False
+
+    fake = FakeArduino(rate=args.rate, binary=args.protocol == 'binary').start()
+    dev = wc.Device(write_config(workdir), fake.port)
+    wc.devices = [dev]
+
+    harness = Harness(args.runtime, dev)
+    log = sys.stdout if args.verbose else open(os.devnull, 'w')
+    log_listener = wc.setup_logging() if args.verbose else None  # 로그는 --verbose일 때만 출력
+    results = {'runtime': args.runtime, 'protocol': args.protocol}
+    try:
+        with contextlib.redirect_stdout(log):
+            wc.validate_and_load_config(dev)
+            harness.start()
+            if not wait_for(lambda: dev.listener is not None and dev.reader is not None and fake.frames_sent > 0, 15):
+                raise RuntimeError('컨트롤러가 시작되지 않았습니다.')
+            time.sleep(0.5)
+            results['control_to_serial'] = summarize(bench_control_latency(wc.cloud, fake, args.iterations))
+            results['rx_to_publish'] = summarize(bench_publish_latency(wc.cloud, fake, args.publish_iterations))
+            results['throughput'] = bench_throughput(dev, fake, args.duration)
+            results['device'] = dev.metrics()
+            results['histograms'] = wc.metrics.snapshot()['histograms']
+    finally:
+        with contextlib.redirect_stdout(log):
+            harness.stop()
+        fake.stop()
+        wc.outbox.close()
+        if log_listener is not None:
+            log_listener.stop()
+        if log is not sys.stdout:
+            log.close()
+    return results
+
+
+def compare(results, baseline, tolerance, slack_ms=1.0):
+    """기준 결과 대비 악화된 항목 목록. 지연은 p50/p95가 늘면, 처리량은 줄면 악화.
+
+    1 ms 미만의 지연 차이는 측정 잡음으로 보고 slack_ms만큼은 허용한다.
+    """
+    regressions = []
+    for key in ('control_to_serial', 'rx_to_publish'):
+        for stat in ('p50_ms', 'p95_ms'):
+            old, new = (baseline.get(key) or {}).get(stat), (results.get(key) or {}).get(stat)
+            if old and new and new > old * (1 + tolerance) + slack_ms:
+                regressions.append(f'{key}.{stat}: {old} -> {new}')
+    old = baseline.get('throughput', {}).get('frames_received_per_s')
+    new = results.get('throughput', {}).get('frames_received_per_s')
+    if old and new is not None and new < old * (1 - tolerance):
+        regressions.append(f'throughput.frames_received_per_s: {old} -> {new}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='웨어러블 컨트롤러 벤치마크')
+    parser.add_argument('--runtime', choices=['threads', 'asyncio'], default=wc.RUNTIME)
+    parser.add_argument('--protocol', choices=['binary', 'text'], default='binary',
+                        help="가짜 아두이노의 프로토콜 ('text'는 구버전 펌웨어)")
+    parser.add_argument('--rate', type=float, default=5.0, help='평상시 센서 프레임 속도 (Hz)')
+    parser.add_argument('--iterations', type=int, default=50, help='제어 지연 측정 횟수')
+    parser.add_argument('--publish-iterations', type=int, default=10, help='업로드 지연 측정 횟수')
+    parser.add_argument('--duration', type=float, default=3.0, help='처리량 측정 시간 (초)')
+    parser.add_argument('--json', metavar='FILE', help='결과를 JSON 파일로 저장')
+    parser.add_argument('--baseline', metavar='FILE', help='비교할 기준 결과 JSON')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='허용 악화 비율 (기본 0.2 = 20%%)')
+    parser.add_argument('--slack-ms', type=float, default=1.0, help='지연 비교 시 추가로 허용하는 절대 차이 (ms)')
+    parser.add_argument('--verbose', action='store_true', help='컨트롤러 출력 표시')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.slack_ms)
+        for line in regressions:
+            print(f"❌ 성능 저하: {line}")
+        if regressions:
+            return 1
+        print("✅ 기준 대비 성능 저하 없음")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
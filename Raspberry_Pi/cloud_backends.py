@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""클라우드 DB 백엔드: Firebase Realtime Database, 프로세스 내 대용(InMemoryBackend), 지표 래퍼.
+
+모든 백엔드는 같은 메서드(connect, get, get_with_etag, get_if_changed, set, update, listen)를
+제공하므로 컨트롤러 코드는 어느 백엔드인지 신경 쓰지 않는다.
+"""
+
+import copy
+import hashlib
+import itertools
+import json
+import queue
+import threading
+import time
+
+from log_metrics import cloud_log, metrics
+
+class FirebaseBackend:
+    """Firebase Realtime Database 백엔드. 경로는 모두 DB 루트 기준 ('devices/123/control').
+
+    다른 백엔드(InMemoryBackend 등)도 같은 메서드를 제공한다:
+    connect(), get(path, shallow=False), get_with_etag(path), get_if_changed(path, etag),
+    set(path, value), update(path, values), listen(path, callback).
+    shallow 조회는 자식 객체를 True로 잘라 키만 돌려준다. get_if_changed는 (변경 여부, 값, ETag)를
+    반환하며 바뀌지 않았으면 본문을 받지 않는다 (값은 None).
+    update()의 키는 path 기준 상대 경로이며 path='/'이면 다중 경로 update가 된다.
+    listen()은 close()를 가진 핸들을 반환하고, 콜백은 event_type/path/data 속성을 가진 이벤트를 받는다.
+    """
+
+    def __init__(self, key_path):
+        self.key_path = key_path
+        self.app = None
+        self.db = None
+
+    def connect(self):
+        if self.app is not None:
+            return
+        # SDK 로딩은 라즈베리파이에서 수백 ms가 걸리므로 시작 경로가 아닌 첫 연결 시점에 가져온다
+        with metrics.timer('cloud.sdk_import'):
+            import firebase_admin
+            from firebase_admin import credentials, db
+        cred = credentials.Certificate(self.key_path)
+        database_url = f'https://{cred.project_id}-default-rtdb.firebaseio.com/'
+        if not firebase_admin._apps:
+            self.app = firebase_admin.initialize_app(cred, {'databaseURL': database_url})
+        else:
+            self.app = firebase_admin.get_app()
+        self.db = db
+
+    def get(self, path, shallow=False):
+        return self.db.reference(path, app=self.app).get(shallow=shallow)
+
+    def get_with_etag(self, path):
+        return self.db.reference(path, app=self.app).get(etag=True)
+
+    def get_if_changed(self, path, etag):
+        return self.db.reference(path, app=self.app).get_if_changed(etag)
+
+    def set(self, path, value):
+        self.db.reference(path, app=self.app).set(value)
+
+    def update(self, path, values):
+        self.db.reference(path, app=self.app).update(values)
+
+    def listen(self, path, callback):
+        return self.db.reference(path, app=self.app).listen(callback)
+
+class MemoryEvent:
+    """firebase_admin.db.Event와 같은 모양의 리스너 이벤트."""
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+class InMemoryBackend:
+    """프로세스 안에서 동작하는 Realtime Database 대용 (--backend memory, 벤치마크용).
+
+    RTDB 리스너 의미를 흉내 낸다: listen() 직후 현재 값으로 put '/' 이벤트가 오고, 이후
+    set()은 put, update()는 patch 이벤트로 리스너 기준 상대 경로와 함께 전달된다. 콜백은 SDK처럼
+    별도 스레드 하나에서 순서대로 호출된다. 값은 JSON처럼 복사되며 None은 삭제를 뜻한다.
+    """
+
+    def __init__(self, data=None):
+        self._lock = threading.Lock()
+        self._root = copy.deepcopy(data) if data else {}
+        self._listeners = {}  # id -> (경로 파트, 콜백)
+        self._next_id = itertools.count()
+        self._events = queue.Queue()
+        self._dispatcher = None
+
+    @staticmethod
+    def _split(path):
+        return [part for part in path.split('/') if part]
+
+    @staticmethod
+    def _prune(value):
+        if isinstance(value, dict):
+            pruned = {k: InMemoryBackend._prune(v) for k, v in value.items()}
+            pruned = {k: v for k, v in pruned.items() if v is not None}
+            return pruned or None
+        return value
+
+    def _read(self, parts):
+        node = self._root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return copy.deepcopy(node) if node != {} else None
+
+    def _write(self, parts, value):
+        value = self._prune(copy.deepcopy(value))
+        if not parts:
+            self._root = value if isinstance(value, dict) else {}
+            return
+        node = self._root
+        trail = []
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                if value is None:
+                    return
+                node[part] = {}
+            trail.append((node, part))
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+            # 비어버린 부모 노드 정리
+            for parent, key in reversed(trail):
+                if parent[key]:
+                    break
+                del parent[key]
+        else:
+            node[parts[-1]] = value
+
+    def connect(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch, name='memory-db', daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            callback, event = self._events.get()
+            try:
+                callback(event)
+            except Exception as e:
+                cloud_log.exception("리스너 콜백 오류: %s", e)
+
+    def _notify(self, parts, written):
+        """parts 아래에 written({상대 파트 튜플: 값})이 쓰였을 때 리스너별 이벤트를 만든다 (잠금 상태에서 호출)."""
+        is_patch = len(written) != 1 or () not in written
+        for listen_parts, callback in list(self._listeners.values()):
+            depth = len(listen_parts)
+            if parts[:depth] == listen_parts and len(parts) >= depth:
+                # 쓰기 지점이 리스너 경로 안쪽: 리스너 기준 상대 경로로 그대로 전달
+                rel = '/' + '/'.join(parts[depth:])
+                if is_patch:
+                    data = {'/'.join(k): copy.deepcopy(v) for k, v in written.items()}
+                    self._events.put((callback, MemoryEvent('patch', rel, data)))
+                else:
+                    self._events.put((callback, MemoryEvent('put', rel, copy.deepcopy(written[()]))))
+            elif listen_parts[:len(parts)] == parts:
+                # 리스너 경로가 쓰기 지점 아래: 영향받은 자식만 골라 put으로 전달
+                for sub, _ in written.items():
+                    full = parts + list(sub)
+                    if full[:depth] == listen_parts:
+                        rel = '/' + '/'.join(full[depth:])
+                        self._events.put((callback, MemoryEvent('put', rel, self._read(full))))
+                    elif listen_parts[:len(full)] == full:
+                        self._events.put((callback, MemoryEvent('put', '/', self._read(listen_parts))))
+
+    @staticmethod
+    def _etag(value):
+        return hashlib.md5(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, path, shallow=False):
+        with self._lock:
+            value = self._read(self._split(path))
+        if shallow and isinstance(value, dict):
+            return {key: (True if isinstance(child, dict) else child) for key, child in value.items()}
+        return value
+
+    def get_with_etag(self, path):
+        value = self.get(path)
+        return value, self._etag(value)
+
+    def get_if_changed(self, path, etag):
+        value, new_etag = self.get_with_etag(path)
+        if new_etag == etag:
+            return False, None, etag
+        return True, value, new_etag
+
+    def set(self, path, value):
+        parts = self._split(path)
+        with self._lock:
+            self._write(parts, value)
+            self._notify(parts, {(): value})
+
+    def update(self, path, values):
+        parts = self._split(path)
+        with self._lock:
+            written = {}
+            for key, value in values.items():
+                sub = tuple(self._split(key))
+                self._write(parts + list(sub), value)
+                written[sub] = value
+            self._notify(parts, written)
+
+    def listen(self, path, callback):
+        self.connect()
+        parts = self._split(path)
+        with self._lock:
+            listener_id = next(self._next_id)
+            self._listeners[listener_id] = (parts, callback)
+            self._events.put((callback, MemoryEvent('put', '/', self._read(parts))))
+        backend = self
+
+        class Registration:
+            def close(self):
+                with backend._lock:
+                    backend._listeners.pop(listener_id, None)
+        return Registration()
+
+class MeteredBackend:
+    """다른 백엔드를 감싸 호출별 지연/오류 수와 리스너 콜백 처리 시간을 지표에 기록."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def _call(self, name, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception:
+            metrics.inc(f'cloud.{name}.errors')
+            raise
+        finally:
+            metrics.observe(f'cloud.{name}', time.perf_counter() - start)
+
+    def connect(self):
+        metrics.inc('cloud.connect_attempts')
+        return self._call('connect', self.inner.connect)
+
+    def get(self, path, shallow=False):
+        return self._call('get_shallow' if shallow else 'get', self.inner.get, path, shallow)
+
+    def get_with_etag(self, path):
+        return self._call('get', self.inner.get_with_etag, path)
+
+    def get_if_changed(self, path, etag):
+        changed, value, new_etag = self._call('get_if_changed', self.inner.get_if_changed, path, etag)
+        metrics.inc('cloud.etag_hits' if not changed else 'cloud.etag_misses')
+        return changed, value, new_etag
+
+    def set(self, path, value):
+        return self._call('set', self.inner.set, path, value)
+
+    def update(self, path, values):
+        metrics.inc('cloud.update_paths', len(values))
+        return self._call('update', self.inner.update, path, values)
+
+    def listen(self, path, callback):
+        def timed_callback(event):
+            metrics.inc('cloud.listener_events')
+            with metrics.timer('cloud.listener_callback'):
+                callback(event)
+        return self._call('listen', self.inner.listen, path, timed_callback)
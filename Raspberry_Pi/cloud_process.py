@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+"""클라우드 SDK를 별도 워커 프로세스에서 실행하는 백엔드 (--cloud-process).
+
+ProcessBackend가 spawn으로 워커(cloud_worker_main)를 시작하고 파이프로 백엔드 호출과 리스너
+이벤트를 주고받는다. status 샘플은 공유 메모리 링(SampleRing)으로 넘겨 시리얼 루프가 워커를
+기다리지 않게 한다. 워커 프로세스는 이 모듈만 import하므로 wearable_controller.py에 의존하지 않는다.
+"""
+
+import itertools
+import logging
+import signal
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from cloud_backends import FirebaseBackend, InMemoryBackend, MemoryEvent
+from link_health import LinkHealth
+from log_metrics import cloud_log, log, metrics, setup_logging
+
+CLOUD_WORKER_CALL_TIMEOUT = 10.0  # 워커 프로세스 호출 응답 대기 시간 (초, 넘으면 실패로 보고 outbox로)
+CLOUD_WORKER_RING_SLOTS = 256   # status 샘플 공유 메모리 링 슬롯 수 (워커가 밀리면 오래된 슬롯부터 덮어씀)
+CLOUD_WORKER_RING_FIELDS = 32   # 슬롯 하나에 담는 기기별 최대 status 경로 수 (넘는 경로는 파이프로 전송)
+CLOUD_WORKER_PING_INTERVAL = 2.0  # 감시 스레드가 워커에 응답을 확인하는 간격 (초)
+CLOUD_WORKER_MAX_MISSED = 5     # 이만큼 연속으로 응답이 없으면 멈춘 것으로 보고 워커를 다시 시작
+CLOUD_WORKER_RESTART_BASE = 1   # 워커 재시작 백오프 시작 간격 (초, 연달아 죽으면 2배씩)
+CLOUD_WORKER_RESTART_MAX = 60   # 워커 재시작 백오프 최대 간격 (초)
+CLOUD_WORKER_THREADS = 4        # 워커 프로세스에서 블로킹 SDK 호출을 처리할 스레드 수
+CLOUD_WORKER_STATUS_INTERVAL = 0.25  # 워커가 링의 status 샘플을 모아 한 번의 update()로 쓰는 주기 (초)
+
+class SampleRing:
+    """공유 메모리 위의 고정 크기 슬롯 링 (status 샘플을 워커 프로세스로 넘기는 용도, 잠금 없이 읽음).
+
+    슬롯마다 (순번, 기기 번호, 필드 마스크, 시각, 값 배열, 순번)을 기록하고, 읽는 쪽은 앞뒤 순번이
+    기대한 값과 같을 때만 받아들인다 (읽는 도중 덮어쓴 슬롯은 버림). 쓰는 쪽은 읽는 쪽을 기다리지
+    않으므로 읽는 쪽이 밀리면 오래된 슬롯부터 덮어쓰고, 읽는 쪽은 건너뛴 슬롯 수를 센다.
+    읽는 쪽은 처리(전송 또는 부모에게 반환)를 마친 위치를 ack()로 기록하므로, 워커가 죽어도
+    부모가 recover할 수 있고 다음 워커는 그 위치부터 이어서 읽는다.
+    """
+
+    HEADER = struct.Struct('<QQ')  # 지금까지 쓴 슬롯 수 (마지막 슬롯의 순번), 처리를 마친 순번
+    TAIL = struct.Struct('<Q')
+
+    def __init__(self, buf, slots=CLOUD_WORKER_RING_SLOTS, fields=CLOUD_WORKER_RING_FIELDS):
+        self.buf = buf
+        self.slots = slots
+        self.fields = fields
+        self.slot = self.slot_struct(fields)
+        self.slot_size = self.slot.size + self.TAIL.size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def slot_struct(fields):
+        return struct.Struct(f'<QHHIq{fields}d')  # 순번, 기기 번호, 예약, 필드 마스크, 시각(ms), 값
+
+    @classmethod
+    def size(cls, slots=CLOUD_WORKER_RING_SLOTS, fields=CLOUD_WORKER_RING_FIELDS):
+        return cls.HEADER.size + slots * (cls.slot_struct(fields).size + cls.TAIL.size)
+
+    def head(self):
+        return self.HEADER.unpack_from(self.buf, 0)[0]
+
+    def acked(self):
+        return self.HEADER.unpack_from(self.buf, 0)[1]
+
+    def ack(self, pos):
+        struct.pack_into('<Q', self.buf, 8, pos)
+
+    def _offset(self, seq):
+        return self.HEADER.size + (seq - 1) % self.slots * self.slot_size
+
+    def write(self, index, values, ts_ms=None):
+        """기기 번호 index의 {필드 번호: 값}을 슬롯 하나에 기록 (대기 없음)."""
+        ts_ms = int(time.time() * 1000) if ts_ms is None else ts_ms
+        row = [0.0] * self.fields
+        mask = 0
+        for field, value in values.items():
+            row[field] = value
+            mask |= 1 << field
+        with self._lock:  # 게이트웨이 모드에서는 기기별 시리얼 스레드가 함께 쓴다
+            seq = self.head() + 1  # 순번 0은 빈 슬롯
+            offset = self._offset(seq)
+            self.slot.pack_into(self.buf, offset, seq, index, 0, mask, ts_ms, *row)
+            self.TAIL.pack_into(self.buf, offset + self.slot.size, seq)
+            struct.pack_into('<Q', self.buf, 0, seq)
+
+    def read(self, pos):
+        """순번 pos 다음 슬롯부터 읽는다. ([(기기 번호, 시각, {필드 번호: 값})], 새 위치, 건너뛴 수)를 반환."""
+        head = self.head()
+        lost = 0
+        if head - pos > self.slots:
+            lost = head - pos - self.slots
+            pos = head - self.slots
+        rows = []
+        while pos < head:
+            pos += 1
+            offset = self._offset(pos)
+            seq, index, _, mask, ts_ms, *row = self.slot.unpack_from(self.buf, offset)
+            if seq != pos or self.TAIL.unpack_from(self.buf, offset + self.slot.size)[0] != pos:
+                lost += 1
+                continue
+            rows.append((index, ts_ms, {field: row[field] for field in range(self.fields) if mask >> field & 1}))
+        return rows, pos, lost
+
+def status_layouts(targets):
+    """기기별 status 경로 목록 (SampleRing 필드 번호 = 목록 위치, 앞에서부터 CLOUD_WORKER_RING_FIELDS개)."""
+    return [([f'{dev.path}/status/current_temp'] +
+             [f'{dev.path}/status/{path}' for path in dev.sensors.status_paths])[:CLOUD_WORKER_RING_FIELDS]
+            for dev in targets]
+
+def ring_updates(rows, layouts):
+    """SampleRing.read()의 행을 layouts 기준 {status 절대 경로: 값}으로 합친다 (같은 경로는 나중 값)."""
+    updates = {}
+    for index, _, values in rows:
+        paths = layouts[index] if index < len(layouts) else ()
+        for field, value in values.items():
+            if field < len(paths):
+                updates[paths[field]] = int(value) if value.is_integer() else value
+    return updates
+
+def cloud_worker_main(conn, backend_kind, key_path, ring_name, layouts, log_level):
+    """클라우드 워커 프로세스 본체 (ProcessBackend가 spawn으로 시작).
+
+    파이프로 받은 백엔드 호출을 스레드 풀에서 실행해 결과를 돌려주고, 리스너 이벤트를 파이프로
+    보낸다. 별도 스레드가 CLOUD_WORKER_STATUS_INTERVAL마다 공유 메모리 링의 status 샘플을 모아 하나의
+    update()로 쓴다. 부모와의 파이프가 끊기거나 'stop'을 받으면 종료한다.
+    """
+    from multiprocessing import shared_memory
+    # Ctrl+C/SIGTERM은 부모가 받아 종료 시 상태 기록을 마친 뒤 'stop'을 보낸다
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_IGN)
+    log_listener = setup_logging(log_level)
+    backend = FirebaseBackend(key_path) if backend_kind == 'firebase' else InMemoryBackend()
+    shm = shared_memory.SharedMemory(name=ring_name)
+    ring = SampleRing(shm.buf)
+    executor = ThreadPoolExecutor(max_workers=CLOUD_WORKER_THREADS, thread_name_prefix='cloud-rpc')
+    send_lock = threading.Lock()
+    registrations = {}
+    stopped = threading.Event()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def run(call_id, method, args):
+        try:
+            if method == 'listen':
+                listener_id, path = args
+                registrations[listener_id] = backend.listen(
+                    path, lambda event: send(('event', listener_id, event.event_type, event.path, event.data)))
+                result = None
+            else:
+                result = getattr(backend, method)(*args)
+            send(('result', call_id, True, result))
+        except Exception as e:
+            send(('result', call_id, False, f'{type(e).__name__}: {e}'))
+
+    def publish_status():
+        # 이전 워커가 처리하지 못한 슬롯은 부모가 재시작 전에 recover_status()로 outbox에 넣고 ack했다
+        pos = ring.acked()
+        while not stopped.wait(CLOUD_WORKER_STATUS_INTERVAL):
+            rows, pos, lost = ring.read(pos)
+            updates = ring_updates(rows, layouts)
+            if not updates and not lost:
+                ring.ack(pos)
+                continue
+            error = None
+            if updates:
+                try:
+                    backend.update('/', updates)
+                except Exception as e:
+                    error = f'{type(e).__name__}: {e}'
+            # 실패한 값은 부모에게 돌려보내 outbox에 보관 (store-and-forward)
+            send(('status', len(updates), lost, error, updates if error else None))
+            ring.ack(pos)
+
+    status_thread = threading.Thread(target=publish_status, name='cloud-status', daemon=True)
+    status_thread.start()
+    try:
+        while True:
+            message = conn.recv()
+            kind = message[0]
+            if kind == 'call':
+                executor.submit(run, *message[1:])
+            elif kind == 'ping':
+                send(('pong', message[1]))
+            elif kind == 'unlisten':
+                registration = registrations.pop(message[1], None)
+                if registration is not None:
+                    executor.submit(registration.close)
+            elif kind == 'layouts':
+                layouts = message[1]
+            elif kind == 'stop':
+                break
+    except (EOFError, OSError):
+        pass  # 부모 프로세스 종료
+    finally:
+        stopped.set()
+        status_thread.join(timeout=2)
+        for registration in registrations.values():
+            try:
+                registration.close()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+        shm.close()
+        log_listener.stop()
+
+class ProcessBackend:
+    """클라우드 SDK(HTTP/JSON 처리, 리스너 스트림 파싱)를 별도 워커 프로세스에서 실행하는 백엔드 (--cloud-process).
+
+    다른 백엔드와 같은 메서드를 제공하며, 호출은 파이프로 워커에 넘기고 CLOUD_WORKER_CALL_TIMEOUT까지
+    응답을 기다린다 (넘으면 예외 -> 호출한 쪽이 outbox에 보관). 리스너 이벤트는 수신 스레드에서
+    콜백으로 전달된다. status 쓰기는 push_status()로 공유 메모리 링에 넣으므로 시리얼 루프는
+    워커가 느리거나 멈춰도 기다리지 않는다. 워커가 죽거나 멈추면 supervise()가 백오프 후 다시 시작한다.
+    워커가 쓰지 못한 status는 on_spill({경로: 값})로, status 쓰기 결과는 on_status_result(성공 여부, 오류)로
+    알린다 (main()이 outbox와 클라우드 링크 상태에 연결).
+    """
+
+    def __init__(self, backend_kind, key_path):
+        self.backend_kind = backend_kind
+        self.key_path = key_path
+        self.health = LinkHealth('cloud_worker', CLOUD_WORKER_RESTART_BASE, CLOUD_WORKER_RESTART_MAX)
+        self.devices = []
+        self.layouts = []
+        self.restarts = 0
+        self.on_spill = None          # 보내지 못한 status {절대 경로: 값}을 받아 보관 (outbox)
+        self.on_status_result = None  # 워커의 status 쓰기 결과 (ok, 오류 문자열)
+        self._fields = {}     # status 절대 경로 -> (기기 번호, 필드 번호)
+        self._ring = None
+        self._shm = None
+        self._process = None
+        self._conn = None
+        self._generation = 0
+        self._send_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._calls = {}      # 호출 번호 -> (세대, Future)
+        self._callbacks = {}  # 리스너 번호 -> 콜백
+        self._ids = itertools.count(1)
+        self._missed = 0
+        self._next_ping = 0.0
+
+    @property
+    def alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def register_devices(self, targets):
+        """status 샘플을 링으로 보낼 기기 목록을 등록 (기기 번호 = 목록 위치)."""
+        self.devices = list(targets)
+        self.layouts = status_layouts(targets)
+        self._fields = {path: (index, field) for index, paths in enumerate(self.layouts)
+                        for field, path in enumerate(paths)}
+        if self.alive:
+            self._send(('layouts', self.layouts))
+
+    def start(self):
+        # multiprocessing은 --cloud-process일 때만 필요하므로 여기서 가져온다
+        import multiprocessing
+        from multiprocessing import shared_memory
+        with self._start_lock:
+            if self.alive:
+                return
+            if self._shm is None:
+                # 링은 워커가 다시 시작되어도 부모가 계속 소유한다
+                self._shm = shared_memory.SharedMemory(create=True, size=SampleRing.size())
+                self._shm.buf[:SampleRing.HEADER.size] = bytes(SampleRing.HEADER.size)
+                self._ring = SampleRing(self._shm.buf)
+            # SDK 스레드/잠금을 물려받지 않도록 fork 대신 spawn
+            ctx = multiprocessing.get_context('spawn')
+            parent_conn, child_conn = ctx.Pipe()
+            self._generation += 1
+            self._process = ctx.Process(
+                target=cloud_worker_main, name='cloud-worker', daemon=True,
+                args=(child_conn, self.backend_kind, self.key_path, self._shm.name, self.layouts,
+                      logging.getLevelName(log.getEffectiveLevel())))
+            self._process.start()
+            child_conn.close()  # 워커가 죽으면 수신 스레드가 EOF를 받도록 부모 쪽 사본은 닫음
+            self._conn = parent_conn
+            self._missed = 0
+            self._next_ping = time.monotonic() + CLOUD_WORKER_PING_INTERVAL
+            threading.Thread(target=self._receive, args=(parent_conn, self._generation),
+                             name='cloud-worker-rx', daemon=True).start()
+            cloud_log.info("☁️  클라우드 워커 프로세스 시작 (pid %s)", self._process.pid)
+
+    def _send(self, message, timeout=-1):
+        if not self._send_lock.acquire(timeout=timeout):
+            raise TimeoutError('클라우드 워커 파이프가 막혀 있습니다.')
+        try:
+            self._conn.send(message)
+        finally:
+            self._send_lock.release()
+
+    def _receive(self, conn, generation):
+        """워커가 보낸 호출 결과/리스너 이벤트/status 결과를 처리 (워커 한 번의 수명 동안)."""
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message[0]
+            if kind == 'result':
+                _, call_id, ok, value = message
+                entry = self._calls.pop(call_id, None)
+                if entry is not None:
+                    if ok:
+                        entry[1].set_result(value)
+                    else:
+                        entry[1].set_exception(RuntimeError(value))
+            elif kind == 'event':
+                _, listener_id, event_type, path, data = message
+                callback = self._callbacks.get(listener_id)
+                if callback is not None:
+                    try:
+                        callback(MemoryEvent(event_type, path, data))
+                    except Exception as e:
+                        cloud_log.exception("리스너 콜백 오류: %s", e)
+            elif kind == 'pong':
+                self._missed = 0
+                self.health.record_success()
+            elif kind == 'status':
+                _, paths, lost, error, failed = message
+                metrics.inc('cloud_worker.status_paths', paths)
+                if lost:
+                    self._ring_lost(lost)
+                if failed:
+                    cloud_log.warning("status 쓰기 실패, 오프라인 큐에 보관합니다: %s", error)
+                    if self.on_spill is not None:
+                        self.on_spill(failed)
+                if paths and self.on_status_result is not None:
+                    self.on_status_result(error is None, error)
+        conn.close()
+        # 이 워커에 보낸 호출은 응답이 오지 않으므로 바로 실패 처리
+        for call_id, (gen, future) in list(self._calls.items()):
+            if gen == generation and self._calls.pop(call_id, None) is not None:
+                future.set_exception(ConnectionError('클라우드 워커 프로세스가 종료되었습니다.'))
+
+    def _call(self, method, *args):
+        if self._process is None:
+            self.health.should_attempt()  # 첫 시작 (이후 재시작은 supervise()만 한다)
+            self.start()
+        elif not self.alive:
+            raise ConnectionError('클라우드 워커 프로세스가 실행 중이 아닙니다.')
+        call_id = next(self._ids)
+        future = Future()
+        self._calls[call_id] = (self._generation, future)
+        try:
+            self._send(('call', call_id, method, args), CLOUD_WORKER_CALL_TIMEOUT)
+            return future.result(CLOUD_WORKER_CALL_TIMEOUT)
+        except (OSError, TimeoutError) as e:
+            raise ConnectionError(f'클라우드 워커 호출 실패 ({method}): {e or "응답 없음"}') from e
+        finally:
+            self._calls.pop(call_id, None)
+
+    def connect(self):
+        return self._call('connect')
+
+    def get(self, path, shallow=False):
+        return self._call('get', path, shallow)
+
+    def get_with_etag(self, path):
+        return self._call('get_with_etag', path)
+
+    def get_if_changed(self, path, etag):
+        return self._call('get_if_changed', path, etag)
+
+    def set(self, path, value):
+        return self._call('set', path, value)
+
+    def update(self, path, values):
+        return self._call('update', path, values)
+
+    def listen(self, path, callback):
+        listener_id = next(self._ids)
+        self._callbacks[listener_id] = callback
+        try:
+            self._call('listen', listener_id, path)
+        except Exception:
+            self._callbacks.pop(listener_id, None)
+            raise
+        backend = self
+
+        class Registration:
+            def close(self):
+                if backend._callbacks.pop(listener_id, None) is not None and backend.alive:
+                    try:
+                        backend._send(('unlisten', listener_id), CLOUD_WORKER_CALL_TIMEOUT)
+                    except (OSError, TimeoutError):
+                        pass
+        return Registration()
+
+    def push_status(self, updates):
+        """status 쓰기 중 링에 담을 수 있는 경로를 링에 넣고 (대기 없음), 나머지 {경로: 값}을 반환."""
+        if self._ring is None:
+            return updates
+        rest = {}
+        rows = {}
+        for path, value in updates.items():
+            location = self._fields.get(path)
+            if location is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+                rest[path] = value
+            else:
+                rows.setdefault(location[0], {})[location[1]] = value
+        for index, values in rows.items():
+            self._ring.write(index, values)
+        metrics.inc('cloud_worker.ring_writes', len(rows))
+        return rest
+
+    def _ring_lost(self, lost):
+        # 덮어쓴 슬롯의 값은 복구할 수 없으므로 다음 프레임에서 전체 status를 다시 쓰게 한다
+        metrics.inc('cloud_worker.ring_overruns', lost)
+        for dev in self.devices:
+            dev.telemetry.invalidate()
+
+    def recover_status(self):
+        """워커가 처리하지 못한 링 슬롯을 on_spill(outbox)로 넘기고 ack (워커가 종료된 뒤에만 호출). 넣은 경로 수를 반환."""
+        if self._ring is None or self.alive:
+            return 0
+        rows, pos, lost = self._ring.read(self._ring.acked())
+        updates = ring_updates(rows, self.layouts)
+        if updates and self.on_spill is not None:
+            self.on_spill(updates)
+            metrics.inc('cloud_worker.recovered', len(updates))
+        if lost:
+            self._ring_lost(lost)
+        self._ring.ack(pos)
+        return len(updates)
+
+    def supervise(self, now=None):
+        """워커 상태 확인 (감시 스레드가 1초마다 호출). 워커를 다시 시작했으면 이유 문자열을 반환."""
+        if self._process is None:
+            return None  # 아직 한 번도 호출되지 않음
+        now = time.monotonic() if now is None else now
+        if self.alive and self._missed >= CLOUD_WORKER_MAX_MISSED:
+            cloud_log.error("🚨 클라우드 워커가 %d초간 응답하지 않습니다. 강제 종료합니다.",
+                            CLOUD_WORKER_MAX_MISSED * CLOUD_WORKER_PING_INTERVAL)
+            self._process.kill()
+            self._process.join(timeout=5)
+            self.health.disconnect('응답 없음')
+        if not self.alive:
+            if self.health.connected or self.health.state == LinkHealth.RECONNECTING:
+                cloud_log.error("🚨 클라우드 워커 프로세스 종료 (종료 코드 %s)", self._process.exitcode)
+                metrics.inc('cloud_worker.crashes')
+                self.health.disconnect(f'종료 코드 {self._process.exitcode}')
+            self.recover_status()
+            if not self.health.should_attempt(now):
+                return None
+            self._callbacks.clear()  # 이전 워커의 리스너는 재연결(connect_firebase) 때 다시 등록됨
+            self.start()
+            self.restarts += 1
+            metrics.inc('cloud_worker.restarts')
+            return '클라우드 워커 재시작'
+        if now >= self._next_ping:
+            self._next_ping = now + CLOUD_WORKER_PING_INTERVAL
+            self._missed += 1  # pong을 받으면 0으로
+            try:
+                self._send(('ping', now), 0)
+            except (OSError, TimeoutError):
+                pass
+        return None
+
+    def stop(self, timeout=5):
+        """워커에 종료를 요청하고 (응답이 없으면 강제 종료) 공유 메모리를 해제."""
+        if self.alive:
+            try:
+                self._send(('stop',), timeout)
+            except (OSError, TimeoutError):
+                pass
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join(timeout)
+        self.recover_status()  # 마지막으로 보내지 못한 status는 outbox로 (outbox를 닫기 전에 호출)
+        if self._shm is not None:
+            self._ring = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def summary(self):
+        return {'pid': self._process.pid if self._process is not None else None, 'alive': self.alive,
+                'restarts': self.restarts, 'link': self.health.summary()}
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""pty 기반 가짜 아두이노 (main_controller.ino의 시리얼 프로토콜을 흉내 냄).
+
+하드웨어 없이 wearable_controller.py와 벤치마크를 돌리기 위한 도구.
+- 텍스트 모드: 'SENSORS:a,b,c,d,e' 전송, 'CMD:A:COOLING:24[:SEQ]' 수신 시 'ACK:A:SEQ' 응답
+- 'HELLO:BIN1' 수신 시 'HELLO:BIN1:OK' 응답 후 바이너리 프레임(CRC16)으로 전환
+
+단독 실행: python3 fake_arduino.py --rate 5  (출력된 포트 경로를 ARDUINO_PORT로 사용)
+"""
+
+import argparse
+import binascii
+import os
+import pty
+import select
+import struct
+import threading
+import time
+import tty
+
+FRAME_SYNC = b'\xa5\x5a'
+FRAME_SENSORS = 1
+FRAME_CMD = 2
+FRAME_ACK = 3
+MODE_NAMES = {0: 'OFF', 1: 'COOLING', 2: 'HEATING'}
+NUM_SENSORS = 5
+
+
+class FakeArduino:
+    """pty 한 쌍을 열고 백그라운드 스레드에서 아두이노처럼 응답한다.
+
+    received에는 (time.perf_counter() 수신 시각, 그룹, 모드, 목표 온도) 명령이, sent에는
+    첫 번째 센서 값 -> 그 값을 처음 전송한 시각이 기록된다 (벤치마크의 지연 측정용).
+    """
+
+    def __init__(self, rate=5.0, binary=True, sensors=None):
+        self.rate = rate                # 초당 센서 프레임 수 (0이면 최대 속도)
+        self.allow_binary = binary      # False면 HELLO에 응답하지 않는 구버전 펌웨어처럼 동작
+        self.sensors = list(sensors or [24] * NUM_SENSORS)
+        self.binary = False
+        self.received = []
+        self.sent = {}
+        self.frames_sent = 0
+        self._tx_seq = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+    def set_sensors(self, values):
+        with self._lock:
+            self.sensors = list(values)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='fake-arduino', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=2)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _frame(self, frame_type, payload):
+        body = bytes((len(payload) + 2, frame_type, self._tx_seq)) + payload
+        self._tx_seq = (self._tx_seq + 1) & 0xFF
+        return FRAME_SYNC + body + struct.pack('<H', binascii.crc_hqx(body, 0xFFFF))
+
+    def _send_sensors(self):
+        with self._lock:
+            values = list(self.sensors)
+        if not select.select([], [self.master], [], 0)[1]:
+            return  # 상대가 읽지 않아 pty 버퍼가 찼으면 이번 프레임은 건너뜀
+        if self.binary:
+            payload = struct.pack(f'<B{len(values)}h', len(values), *(round(v * 100) for v in values))
+            data = self._frame(FRAME_SENSORS, payload)
+        else:
+            data = ('SENSORS:' + ','.join(str(int(v)) for v in values) + '\r\n').encode()
+        try:
+            os.write(self.master, data)
+        except OSError:
+            return
+        self.sent.setdefault(values[0], time.perf_counter())
+        self.frames_sent += 1
+
+    def _ack(self, group_index, seq):
+        if self.binary:
+            data = self._frame(FRAME_ACK, bytes((group_index, seq & 0xFF)))
+        else:
+            data = f"ACK:{'A' if group_index == 0 else 'B'}:{seq & 0xFF}\r\n".encode()
+        os.write(self.master, data)
+
+    def _handle_line(self, line, now):
+        line = line.strip()
+        if line == 'HELLO:BIN1':
+            if self.allow_binary:
+                os.write(self.master, b'HELLO:BIN1:OK\r\n')
+                self.binary = True
+            return
+        parts = line.split(':')
+        if len(parts) < 4 or parts[0] != 'CMD':
+            return
+        self.received.append((now, parts[1], parts[2], float(parts[3])))
+        if len(parts) > 4:
+            self._ack(0 if parts[1] == 'A' else 1, int(parts[4]))
+
+    def _handle_input(self, buf, now):
+        """buf에서 완성된 텍스트 줄/바이너리 프레임을 처리하고 남은 바이트를 반환."""
+        while buf:
+            if buf[:1] == FRAME_SYNC[:1]:
+                if len(buf) < 3:
+                    break
+                total = 3 + buf[2] + 2
+                if len(buf) < total:
+                    break
+                body, crc = buf[2:total - 2], buf[total - 2:total]
+                buf = buf[total:]
+                if struct.unpack('<H', crc)[0] != binascii.crc_hqx(body, 0xFFFF):
+                    continue
+                frame_type, seq, payload = body[1], body[2], body[3:]
+                if frame_type == FRAME_CMD and len(payload) >= 4:
+                    group_index, mode, centi = struct.unpack_from('<BBh', payload)
+                    self.received.append((now, 'A' if group_index == 0 else 'B',
+                                          MODE_NAMES.get(mode, 'OFF'), centi / 100))
+                    self._ack(group_index, seq)
+            else:
+                end = buf.find(b'\n')
+                if end < 0:
+                    break
+                line, buf = buf[:end], buf[end + 1:]
+                self._handle_line(line.decode(errors='replace'), now)
+        return buf
+
+    def _run(self):
+        buf = b''
+        next_tx = time.perf_counter()
+        while self._running:
+            interval = 1.0 / self.rate if self.rate > 0 else 0  # 실행 중에도 rate 변경 가능
+            timeout = max(0.0, next_tx - time.perf_counter())
+            try:
+                readable, _, _ = select.select([self.master], [], [], timeout)
+                if readable:
+                    buf = self._handle_input(buf + os.read(self.master, 4096), time.perf_counter())
+            except OSError:
+                return
+            if time.perf_counter() >= next_tx:
+                self._send_sensors()
+                next_tx = max(next_tx + interval, time.perf_counter()) if interval else time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pty 기반 가짜 아두이노')
+    parser.add_argument('--rate', type=float, default=5.0, help='초당 센서 프레임 수 (기본 5)')
+    parser.add_argument('--text-only', action='store_true', help='바이너리 프로토콜 협상을 거부')
+    args = parser.parse_args()
+
+    fake = FakeArduino(rate=args.rate, binary=not args.text_only).start()
+    print(f"가짜 아두이노 포트: {fake.port}  (Ctrl+C로 종료)")
+    shown = 0
+    try:
+        while True:
+            time.sleep(1)
+            for _, group, mode, temp in fake.received[shown:]:
+                print(f"<- 명령: {group} {mode} {temp:g} (전송 프레임 {fake.frames_sent}개)")
+            shown = len(fake.received)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
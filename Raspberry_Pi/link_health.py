@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""링크(클라우드, 기기별 시리얼, 클라우드 워커 프로세스)의 연결 상태 머신과 재연결 백오프."""
+
+import random
+import threading
+import time
+
+from log_metrics import log, metrics
+
+class LinkHealth:
+    """링크 하나(클라우드 또는 기기별 시리얼)의 연결 상태 머신과 재연결 백오프.
+
+    connected --실패--> degraded --연속 실패 failure_threshold회 / disconnect()--> backing_off
+    backing_off --대기 시간 경과, should_attempt()--> reconnecting (half-open: 시도 한 번만 허용)
+    reconnecting --성공--> connected, --실패--> backing_off (대기 시간 2배, 최대 max_delay)
+    degraded에서 성공하면 재연결 없이 connected로 돌아간다. 대기 시간의 절반은 무작위(jitter)로
+    정해 Wi-Fi가 잠깐 끊겼다 돌아와도 여러 기기가 같은 순간에 재연결하지 않게 한다.
+    """
+
+    CONNECTED = 'connected'
+    DEGRADED = 'degraded'
+    BACKING_OFF = 'backing_off'
+    RECONNECTING = 'reconnecting'
+
+    def __init__(self, name, base_delay, max_delay, failure_threshold=1, tag='', rng=random.random):
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.tag = tag
+        self.rng = rng
+        self.state = self.BACKING_OFF  # retry_at = 0 이므로 처음에는 바로 연결 시도
+        self.failures = 0              # 연속 실패 횟수
+        self.attempt = 0               # 연속으로 실패한 재연결 시도 수 (백오프 지수)
+        self.retry_at = 0.0
+        self.transitions = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self):
+        return self.state in (self.CONNECTED, self.DEGRADED)
+
+    def _set(self, state, reason=None):
+        if state == self.state:
+            return
+        old, self.state = self.state, state
+        self.transitions += 1
+        metrics.inc(f'link.{self.name}.{state}')
+        log.info("%s🔀 %s 링크: %s -> %s%s", self.tag, self.name, old, state, f" ({reason})" if reason else '')
+
+    def _back_off(self, reason):
+        delay = min(self.max_delay, self.base_delay * 2 ** self.attempt)
+        delay = delay / 2 + self.rng() * delay / 2
+        self.attempt += 1
+        self.retry_at = time.monotonic() + delay
+        self._set(self.BACKING_OFF, reason)
+
+    def record_success(self):
+        if self.state == self.CONNECTED and not self.failures:
+            return  # 평상시에는 잠금 없이 반환
+        with self._lock:
+            if self.state == self.BACKING_OFF:
+                return  # 재연결 전에 도착한 늦은 응답은 무시
+            self.failures = 0
+            self.attempt = 0
+            self._set(self.CONNECTED)
+
+    def record_failure(self, reason=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(reason) if reason else None
+            if self.state == self.BACKING_OFF:
+                return
+            if self.state == self.RECONNECTING or self.failures >= self.failure_threshold:
+                self._back_off(reason)
+            else:
+                self._set(self.DEGRADED, reason)
+
+    def degrade(self, reason=None):
+        """실패는 아니지만 의심스러운 경우 (예: 수신 없음). connected에서 바뀌었으면 True."""
+        with self._lock:
+            if self.state != self.CONNECTED:
+                return False
+            self._set(self.DEGRADED, reason)
+            return True
+
+    def disconnect(self, reason=None):
+        """연결이 끊겼음을 확인한 경우. 바로 backing_off로 간다."""
+        with self._lock:
+            if self.state != self.BACKING_OFF:
+                self.last_error = str(reason) if reason else None
+                self._back_off(reason)
+
+    def should_attempt(self, now=None):
+        """대기 시간이 지났으면 reconnecting으로 바꾸고 True (호출한 쪽이 한 번 시도한다)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.state != self.BACKING_OFF or now < self.retry_at:
+                return False
+            self._set(self.RECONNECTING)
+            return True
+
+    def retry_in(self, now=None):
+        """다음 재연결 시도까지 남은 시간 (초). backing_off가 아니면 0."""
+        if self.state != self.BACKING_OFF:
+            return 0.0
+        return max(0.0, self.retry_at - (time.monotonic() if now is None else now))
+
+    def summary(self):
+        return {'state': self.state, 'failures': self.failures, 'attempt': self.attempt,
+                'retry_in_s': round(self.retry_in(), 1), 'transitions': self.transitions,
+                'last_error': self.last_error}
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""LAN 제어 엔드포인트 (--local-port): 클라우드 왕복 없이 앱이 control/프리셋을 바꾸고 센서 스트림을 받는다.
+
+요청 처리에 필요한 기기 목록과 제어 함수는 start_local_api()가 서버(LocalApiServer)에 넘겨 주므로
+이 모듈은 wearable_controller.py에 의존하지 않는다.
+"""
+
+import hmac
+import http.server
+import json
+import math
+import queue
+import threading
+import time
+import urllib.parse
+
+import serial
+
+from log_metrics import log, metrics
+from serial_protocol import GROUP_CHANNELS, MODE_CODES
+
+TARGET_TEMP_RANGE = (16, 30)    # 앱(SensorControlDialog, PresetsActivity)이 허용하는 목표 온도 범위 (°C)
+LOCAL_API_HOST = '127.0.0.1'    # LAN 제어 엔드포인트 주소 (기본은 로컬 전용, LAN 공개는 --local-host나 config 'local_api.host'로 명시)
+LOCAL_API_PORT = 0              # LAN 제어 엔드포인트 포트, 0이면 비활성화 (--local-port)
+LOCAL_API_MAX_BODY = 64 * 1024  # LAN 제어 요청 본문 최대 크기 (바이트, 넘으면 413)
+LOCAL_STREAM_QUEUE = 50         # 스트림 구독자별 대기 프레임 수 (느린 클라이언트는 오래된 프레임부터 버림)
+LOCAL_STREAM_KEEPALIVE = 15     # 스트림에 데이터가 없을 때 연결 유지 주석을 보내는 간격 (초)
+
+class SensorFeed:
+    """시리얼 경로에서 처리한 센서 프레임을 LAN 스트림 구독자에게 전달 (구독자가 없으면 비용 없음)."""
+
+    def __init__(self, queue_size=LOCAL_STREAM_QUEUE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self.dropped = 0
+
+    @property
+    def active(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        q = queue.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def publish(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(frame)
+            except queue.Full:
+                # 느린 클라이언트: 가장 오래된 프레임을 버리고 최신 프레임을 넣음
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(frame)
+                self.dropped += 1
+
+class RequestTooLarge(Exception):
+    """LAN 제어 요청 본문이 LOCAL_API_MAX_BODY를 넘음 (413)."""
+
+class LocalControlHandler(http.server.BaseHTTPRequestHandler):
+    """LAN 제어 엔드포인트 (클라우드 왕복 없이 앱이 직접 제어).
+
+    GET  /control         현재 control (Firebase와 같은 스키마)
+    POST /control         {'global_mode', 'groups': {group_N: {'target_temp'}}} 일부만 보내도 됨
+    POST /preset          {'preset': 프리셋 ID}
+    GET  /stream          센서 프레임 Server-Sent Events 스트림
+    기본으로 127.0.0.1에만 열리므로 같은 네트워크의 앱이 접속하려면 --local-host 0.0.0.0 (또는 wlan0의 IP)나
+    config의 'local_api': {'host': ...}로 LAN 공개를 명시적으로 켜야 한다.
+    기기 비밀번호(config 'device_password')를 X-Device-Password 헤더로 보내야 하며 (URL에 넣으면
+    로그/기록에 남으므로 받지 않음), 게이트웨이 모드에서는 ?device=기기 ID로 기기를 고른다.
+    본문이 LOCAL_API_MAX_BODY를 넘으면 읽지 않고 413, 시리얼 전송에 실패하면 503 (변경은 기록되어
+    재연결 후 전송됨).
+    """
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _device(self):
+        """요청 대상 기기와 경로. 기기가 없거나 인증에 실패하면 응답을 보내고 (None, None)."""
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        device_id = query.get('device')
+        targets = [d for d in self.server.devices if device_id in (None, d.device_id)]
+        if len(targets) != 1:
+            self._send_json(404, {'error': '기기를 찾을 수 없습니다 (?device=기기 ID).'})
+            return None, None
+        dev = targets[0]
+        password = self.headers.get('X-Device-Password') or ''
+        expected = str(dev.config_data.get('device_password'))
+        if not hmac.compare_digest(password.encode('utf-8'), expected.encode('utf-8')):
+            self._send_json(401, {'error': '기기 비밀번호가 올바르지 않습니다.'})
+            return None, None
+        return dev, url.path
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise ValueError('Content-Length가 올바르지 않습니다.') from None
+        if length < 0:
+            raise ValueError('Content-Length가 올바르지 않습니다.')
+        if length > LOCAL_API_MAX_BODY:
+            raise RequestTooLarge(length)
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def do_GET(self):
+        dev, path = self._device()
+        if dev is None:
+            return
+        if path == '/control':
+            self._send_json(200, dev.control_mirror.snapshot() or dev.config_data.get('last_control_state') or {})
+        elif path == '/stream':
+            self._stream(dev)
+        else:
+            self._send_json(404, {'error': f'알 수 없는 경로: {path}'})
+
+    def do_POST(self):
+        dev, path = self._device()
+        if dev is None:
+            return
+        started = time.perf_counter()
+        try:
+            body = self._read_json()
+            if path == '/control':
+                control = self.server.apply_control(dev, parse_control_changes(body))
+            elif path == '/preset':
+                if not isinstance(body, dict) or not self.server.switch_preset(dev, body.get('preset')):
+                    raise ValueError('알 수 없는 프리셋입니다.')
+                control = dev.control_mirror.snapshot()
+            else:
+                self._send_json(404, {'error': f'알 수 없는 경로: {path}'})
+                return
+        except ValueError as e:  # JSON 오류 포함
+            self._send_json(400, {'error': str(e)})
+            return
+        except RequestTooLarge:
+            self.close_connection = True  # 읽지 않은 본문이 남아 있으므로 연결을 재사용하지 않음
+            self._send_json(413, {'error': f'요청 본문은 {LOCAL_API_MAX_BODY}바이트 이하여야 합니다.'})
+            return
+        except serial.SerialException as e:  # SerialTimeoutException 포함
+            self._send_json(503, {'error': f'아두이노 전송 실패 (재연결 후 다시 보냄): {e}'})
+            return
+        metrics.observe('local.control_to_serial', time.perf_counter() - started)
+        self._send_json(200, {'ok': True, 'control': control})
+
+    do_PUT = do_POST
+
+    def _stream(self, dev):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        q = dev.feed.subscribe()
+        try:
+            while self.server.is_running():
+                try:
+                    frame = q.get(timeout=LOCAL_STREAM_KEEPALIVE)
+                    self.wfile.write(f"data: {json.dumps(frame, ensure_ascii=False)}\n\n".encode('utf-8'))
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 클라이언트 연결 종료
+        finally:
+            dev.feed.unsubscribe(q)
+
+    def log_message(self, format, *args):
+        pass  # 요청마다 출력하지 않음
+
+def local_api_host(targets):
+    """config의 'local_api': {'host'}로 지정한 주소 (게이트웨이 모드에서는 처음 지정한 기기), 없으면 LOCAL_API_HOST."""
+    for dev in targets:
+        host = (dev.config_data.get('local_api') or {}).get('host')
+        if host:
+            return str(host)
+    return LOCAL_API_HOST
+
+class LocalApiServer(http.server.ThreadingHTTPServer):
+    """LocalControlHandler가 사용하는 기기 목록과 제어 함수를 가진 HTTP 서버.
+
+    apply_control(dev, changes)는 변경이 반영된 전체 control을, switch_preset(dev, preset_id)는 성공
+    여부를 반환하고, is_running()이 False가 되면 열려 있는 스트림을 닫는다.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, targets, apply_control, switch_preset, is_running):
+        super().__init__(address, LocalControlHandler)
+        self.devices = targets
+        self.apply_control = apply_control
+        self.switch_preset = switch_preset
+        self.is_running = is_running
+
+def start_local_api(targets, apply_control, switch_preset, is_running, port=LOCAL_API_PORT, host=LOCAL_API_HOST):
+    """LAN 제어 엔드포인트를 데몬 스레드에서 시작. 비활성화되었거나 실패하면 None."""
+    if not port:
+        return None
+    try:
+        server = LocalApiServer((host, port), targets, apply_control, switch_preset, is_running)
+    except OSError as e:
+        log.warning("⚠️ LAN 제어 엔드포인트를 열 수 없습니다 (%s:%s): %s", host, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name='local-api', daemon=True).start()
+    log.info("📶 LAN 제어 엔드포인트: http://%s:%s/control", host, port)
+    return server
+
+def parse_control_changes(body):
+    """control 스키마({'global_mode', 'groups': {group_N: {'target_temp'}}})를 {상대 경로: 값}으로 검증·변환."""
+    if not isinstance(body, dict):
+        raise ValueError('JSON 객체가 필요합니다.')
+    changes = {}
+    if 'global_mode' in body:
+        mode = str(body['global_mode']).lower()
+        if mode.upper() not in MODE_CODES:
+            raise ValueError(f"알 수 없는 global_mode: {body['global_mode']}")
+        changes['global_mode'] = mode
+    groups = body.get('groups')
+    if groups is None:
+        groups = {}
+    elif not isinstance(groups, dict):
+        raise ValueError('groups는 객체여야 합니다.')
+    for group_key, group in groups.items():
+        if group_key not in GROUP_CHANNELS.values() or not isinstance(group, dict):
+            raise ValueError(f'알 수 없는 그룹: {group_key}')
+        temp = group.get('target_temp')
+        if isinstance(temp, bool) or not isinstance(temp, (int, float)) or not math.isfinite(temp):
+            raise ValueError(f'{group_key}.target_temp는 숫자여야 합니다.')
+        if not TARGET_TEMP_RANGE[0] <= temp <= TARGET_TEMP_RANGE[1]:
+            raise ValueError(f'{group_key}.target_temp는 {TARGET_TEMP_RANGE[0]}~{TARGET_TEMP_RANGE[1]}°C 범위여야 합니다.')
+        changes[f'groups/{group_key}/target_temp'] = temp
+    if not changes:
+        raise ValueError('변경할 값이 없습니다.')
+    return changes
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""로그 파이프라인(큐 기반 비동기 출력, 샘플링, 최근 로그 링)과 지표 레지스트리.
+
+호출 스레드는 로그 기록을 큐에 넣기만 하고 포맷/출력은 QueueListener 스레드가 맡는다.
+metrics는 프로세스 전체가 공유하는 카운터/게이지/지연 히스토그램 레지스트리다.
+"""
+
+import bisect
+import contextlib
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+LOGGING_LEVEL = 'INFO'          # 로그 레벨 (--log-level)
+LOGGING_QUEUE_SIZE = 10000      # 로그 스레드가 처리하기 전까지 쌓아 둘 최대 기록 수 (넘으면 버림, 호출 스레드는 막히지 않음)
+LOGGING_RING_SIZE = 1000        # 메모리에 보관하는 최근 로그 수 (GET /logs, SIGUSR1로 덤프)
+LOGGING_SAMPLE_LIMITS = {'wearable.serial.rx': 12, 'wearable.cloud.heartbeat': 1}  # 로거별 분당 최대 기록 수 (--log-sample)
+
+# --- 로그 (호출 스레드는 기록만 큐에 넣고, 포맷/출력은 백그라운드 스레드에서) ---
+log = logging.getLogger('wearable')
+log.addHandler(logging.NullHandler())  # setup_logging() 전에는 (벤치마크 등에서 import해도) 출력하지 않음
+cloud_log = logging.getLogger('wearable.cloud')
+heartbeat_log = logging.getLogger('wearable.cloud.heartbeat')
+control_log = logging.getLogger('wearable.control')
+serial_log = logging.getLogger('wearable.serial')
+rx_log = logging.getLogger('wearable.serial.rx')
+
+class SamplingFilter(logging.Filter):
+    """로거(하위 로거 포함)별로 window초 동안 최대 limits[이름]개만 통과시킨다.
+
+    버린 개수는 다음 창에서 처음 통과하는 기록 끝에 붙인다.
+    """
+
+    def __init__(self, limits, window=60.0):
+        super().__init__()
+        self.limits = dict(limits)
+        self.window = window
+        self._lock = threading.Lock()
+        self._windows = {}  # 로거 이름 -> [창 시작 시각, 통과 수, 버린 수]
+
+    def _limit_for(self, name):
+        while name:
+            if name in self.limits:
+                return name, self.limits[name]
+            name = name.rpartition('.')[0]
+        return None, None
+
+    def filter(self, record):
+        key, limit = self._limit_for(record.name)
+        if key is None:
+            return True
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or record.created - window[0] >= self.window:
+                skipped = window[2] if window else 0
+                window = self._windows[key] = [record.created, 0, 0]
+                if skipped:
+                    record.msg = f'{record.msg} (직전 {self.window:g}초 동안 {skipped}개 생략)'
+            if window[1] >= limit:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """기록을 큐에 넣는 핸들러 (포맷터/핸들러 처리는 QueueListener 스레드에서). 큐가 가득 차면 버린다."""
+
+    def prepare(self, record):
+        # 인자는 호출 시점에 문자열로 합쳐 둠: 이후 바뀌는 가변 객체(dict 등)를 다른 스레드에서 읽지 않도록
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('logging.dropped')
+
+class RingBufferHandler(logging.Handler):
+    """최근 로그 기록을 메모리에 보관 (현장에서 문제가 생겼을 때 덤프)."""
+
+    def __init__(self, capacity=LOGGING_RING_SIZE):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        entry = {'t': round(record.created, 3), 'level': record.levelname, 'logger': record.name,
+                 'msg': record.getMessage()}
+        if record.exc_info:
+            entry['exc'] = record.exc_text or logging.Formatter().formatException(record.exc_info)
+        self.records.append(entry)
+
+    def dump(self):
+        return list(self.records)
+
+class JsonLogFormatter(logging.Formatter):
+    """한 줄에 JSON 객체 하나 (journald/로그 수집기에서 필드로 검색, --log-json)."""
+
+    def format(self, record):
+        entry = {'t': round(record.created, 3), 'level': record.levelname, 'logger': record.name,
+                 'thread': record.threadName, 'msg': record.getMessage()}
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+log_ring = RingBufferHandler()
+
+def setup_logging(level=LOGGING_LEVEL, json_format=False, sample_limits=None, stream=None):
+    """큐 기반 로깅을 설정하고 시작한 QueueListener를 반환 (종료할 때 stop()으로 남은 기록을 출력)."""
+    records = queue.Queue(LOGGING_QUEUE_SIZE)
+    handler = BackgroundQueueHandler(records)
+    handler.addFilter(SamplingFilter(LOGGING_SAMPLE_LIMITS if sample_limits is None else sample_limits))
+    console = logging.StreamHandler(stream or sys.stdout)
+    console.setFormatter(JsonLogFormatter() if json_format else
+                         logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+    for old in list(log.handlers):
+        log.removeHandler(old)
+    log.addHandler(handler)
+    log.setLevel(level)
+    log.propagate = False
+    metrics.gauge('logging.queue', records.qsize)
+    listener = logging.handlers.QueueListener(records, console, log_ring)
+    listener.start()
+    return listener
+
+def flush_logs():
+    """큐에 쌓인 로그가 모두 출력될 때까지 기다린다 (대화형 입력 전에 호출, 로그 스레드가 실행 중이어야 함)."""
+    for handler in log.handlers:
+        if isinstance(handler, BackgroundQueueHandler):
+            handler.queue.join()
+
+def dump_log_ring(path):
+    """메모리의 최근 로그를 path에 JSON Lines로 저장. 저장한 기록 수를 반환."""
+    entries = log_ring.dump()
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    log.info("🧾 최근 로그 %d개를 '%s'에 저장했습니다.", len(entries), path)
+    return len(entries)
+
+# --- 지표 (지연 히스토그램, 카운터, 큐 깊이) ---
+class LatencyHistogram:
+    """고정 버킷(초 단위 상한) 지연 히스토그램. 백분위수는 버킷 상한으로 근사한다."""
+
+    BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+              0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def _percentile(self, q):
+        target = q * self.count
+        cumulative = 0
+        for bound, n in zip(self.BOUNDS, self.counts):
+            cumulative += n
+            if cumulative >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        ms = lambda s: round(s * 1000, 3)
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count),
+            'p50_ms': ms(self._percentile(0.50)),
+            'p95_ms': ms(self._percentile(0.95)),
+            'p99_ms': ms(self._percentile(0.99)),
+            'max_ms': ms(self.max),
+            'buckets': {('inf' if b == float('inf') else f'{ms(b):g}'): n
+                        for b, n in zip(self.BOUNDS, self.counts) if n},
+        }
+
+class Metrics:
+    """카운터/게이지/지연 히스토그램 레지스트리 (스레드 안전).
+
+    게이지는 스냅샷 시점에 호출되는 함수로 등록해 큐 길이처럼 이미 있는 값을 그대로 읽는다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self.started = time.time()
+
+    def inc(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = LatencyHistogram()
+            hist.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def gauge(self, name, fn):
+        self._gauges[name] = fn
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: hist.summary() for name, hist in self._histograms.items()}
+        gauges = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                gauges[name] = fn()
+            except Exception:
+                gauges[name] = None
+        return {'uptime_s': round(time.time() - self.started, 1), 'counters': counters,
+                'gauges': gauges, 'histograms': histograms}
+
+metrics = Metrics()
+
+class StartupTimer:
+    """프로세스 시작부터 각 시작 단계까지 걸린 시간(ms). 단계마다 처음 한 번만 기록한다."""
+
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def mark(self, stage, tag=''):
+        with self._lock:
+            if stage in self.stages:
+                return
+            elapsed_ms = round((time.perf_counter() - self.t0) * 1000, 1)
+            self.stages[stage] = elapsed_ms
+        log.info("%s⏱️  시작 단계 '%s': %s ms", tag, stage, elapsed_ms)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""--record-trace로 기록한 트레이스를 컨트롤러 코드에 다시 흘려 보내는 재생 도구 (아두이노/Firebase 없이 실행).
+
+기록된 시리얼 수신 바이트는 실제 리더(SerialFrameReader)와 process_serial_frames로, 리스너 이벤트는
+control_listener/presets_listener로 기록 당시의 시간 간격을 speed배로 줄여 전달한다. 클라우드 쓰기는
+InMemoryBackend로 보낸다. 컨트롤러가 보내는 명령에는 펌웨어처럼 바로 ACK하므로, 기록된 ACK는
+SEQ가 맞지 않아 무시된다.
+
+결과: 처리량, 수신 청크 처리 지연, 제어 이벤트 -> 시리얼 쓰기 지연, 재생 지연(일정보다 늦은 정도),
+버려진/유실된 프레임 수.
+
+사용 예:
+    python3 replay.py field.trace --speed 0 --json replay.json   # 최대 속도 (하루치를 몇 분 안에)
+    python3 replay.py field.trace --speed 60 --baseline replay.json   # 기준 대비 악화되면 종료 코드 1
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import wearable_controller as wc
+from benchmark import summarize
+from cloud_backends import InMemoryBackend, MemoryEvent, MeteredBackend
+from serial_protocol import FRAME_CMD, FRAME_SYNC, SerialFrameReader
+from storage import OutboundQueue
+from tracing import TRACE_DEVICE, TRACE_EVENT, TRACE_RX, TRACE_SESSION, TRACE_TX, read_trace
+
+
+class ReplayPort:
+    """기록된 RX 바이트를 읽어 주는 가짜 시리얼 포트 (fileno가 없어 리더는 read()를 사용).
+
+    write()로 받은 CMD는 바로 ACK할 (그룹, SEQ)로 모아 두고, 쓴 시각을 기록한다.
+    """
+
+    is_open = True
+
+    def __init__(self):
+        self.rx = bytearray()
+        self.acks = []
+        self.writes = 0
+        self.last_write = None
+
+    def fileno(self):
+        raise OSError('replay port')
+
+    @property
+    def in_waiting(self):
+        return len(self.rx)
+
+    def feed(self, data):
+        self.rx += data
+
+    def read(self, size):
+        data = bytes(self.rx[:size])
+        del self.rx[:size]
+        return data
+
+    def write(self, data):
+        self.writes += 1
+        self.last_write = time.perf_counter()
+        if data.startswith(FRAME_SYNC):
+            if len(data) > 5 and data[3] == FRAME_CMD:
+                self.acks.append(('A' if data[5] == 0 else 'B', data[4]))
+        elif data.startswith(b'CMD:'):
+            parts = data.decode(errors='replace').strip().split(':')
+            if len(parts) > 4:
+                self.acks.append((parts[1], int(parts[4]) & 0xFF))
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class ReplayDevice:
+    """트레이스의 기기 하나: 기록된 설정으로 만든 Device와 가짜 포트, 현재 세션의 리더."""
+
+    def __init__(self, workdir, index, info):
+        config_path = os.path.join(workdir, f'config_{index}.json')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(info.get('config') or {}, f, ensure_ascii=False)
+        self.dev = wc.Device(config_path, None)
+        if not wc.validate_and_load_config(self.dev):
+            raise ValueError(f"기록된 기기 설정을 읽을 수 없습니다: {info.get('device_id')}")
+        self.dev.tag = f'[{self.dev.device_id}] '
+        self.dev.command_channel.tag = self.dev.tag
+        self.port = ReplayPort()
+        self.dev.arduino = self.port
+        self.reader = None
+        self.frames = dict.fromkeys(('received', 'discarded', 'invalid', 'lost'), 0)  # 지난 세션 리더의 합계
+        self.start_session('text')  # 기록된 세션 레코드 전까지 (협상 응답 등) 받을 리더
+        wc.restore_control_state(self.dev)
+        self.next_edge_tick = wc.EDGE_CONTROL_INTERVAL
+        self.recorded_tx = 0
+
+    def start_session(self, protocol):
+        """기록된 새 시리얼 세션: 리더를 새로 만들고 모든 그룹 명령을 다시 보낼 준비 (start_serial_session과 동일)."""
+        channel = self.dev.command_channel
+        if self.reader is not None:
+            for key, value in self.frame_counts().items():
+                self.frames[key] = value
+        self.reader = SerialFrameReader(self.port, sensor_count=len(self.dev.sensors))
+        self.reader.binary = protocol == 'binary'
+        channel.protocol = protocol
+        channel.reset()
+        self.dev.reader = self.reader
+
+    def frame_counts(self):
+        reader = self.reader
+        return {'received': self.frames['received'] + reader.frames_received,
+                'discarded': self.frames['discarded'] + reader.frames_discarded,
+                'invalid': self.frames['invalid'] + reader.frames_invalid,
+                'lost': self.frames['lost'] + reader.frames_lost}
+
+    def pump(self):
+        """보낼 명령을 보내고, 가짜 펌웨어의 ACK를 처리."""
+        channel = self.dev.command_channel
+        channel.pump(self.port)
+        while self.port.acks:
+            group, seq = self.port.acks.pop(0)
+            channel.on_ack(group, seq)
+
+
+class Replayer:
+    def __init__(self, path, speed, workdir):
+        self.path = path
+        self.speed = speed
+        self.workdir = workdir
+        self.devices = {}
+        self.records = 0
+        self.trace_duration = 0.0
+        self.rx_samples = []       # 수신 청크 하나를 처리하는 데 걸린 시간 (초)
+        self.control_samples = []  # 제어 이벤트 전달 -> 시리얼 쓰기 (초)
+        self.lag_samples = []      # 일정보다 늦게 전달된 레코드의 지연 (초)
+
+    def run(self):
+        start = time.perf_counter()
+        for kind, index, t, body in read_trace(self.path):
+            self.records += 1
+            self.trace_duration = t
+            if self.speed > 0:
+                delay = start + t / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.lag_samples.append(-delay)
+            if kind == TRACE_DEVICE:
+                self.devices[index] = ReplayDevice(self.workdir, index, json.loads(body))
+                continue
+            rd = self.devices.get(index)
+            if rd is None:
+                continue
+            if kind == TRACE_RX:
+                self.on_rx(rd, body)
+            elif kind == TRACE_TX:
+                rd.recorded_tx += 1
+            elif kind == TRACE_SESSION:
+                rd.start_session(body.decode())
+                rd.dev.counters['serial_reconnects'] += 1
+                rd.pump()
+            elif kind == TRACE_EVENT:
+                self.on_event(rd, json.loads(body))
+            # 로컬 제어 루프는 기록 시각 기준으로 실행 (재생 속도와 무관하게 같은 횟수)
+            while t >= rd.next_edge_tick:
+                rd.next_edge_tick += wc.EDGE_CONTROL_INTERVAL
+                wc.edge_control_tick(rd.dev)
+                rd.pump()
+            if wc.write_scheduler.next_delay() == 0:
+                wc.write_scheduler.flush()
+        while wc.write_scheduler.flush():
+            pass
+        return time.perf_counter() - start
+
+    def on_rx(self, rd, data):
+        rd.port.feed(data)
+        t0 = time.perf_counter()
+        rd.reader.fill(0)
+        updates = wc.process_serial_frames(rd.dev, rd.reader)
+        if updates:
+            wc.write_scheduler.submit(updates, wc.PRIORITY_TELEMETRY)
+        self.rx_samples.append(time.perf_counter() - t0)
+        rd.pump()
+
+    def on_event(self, rd, info):
+        event = MemoryEvent(info['type'], info['path'], info['data'])
+        if info['listener'] == 'presets':
+            wc.presets_listener(rd.dev, event)
+            return
+        writes = rd.port.writes
+        t0 = time.perf_counter()
+        wc.control_listener(rd.dev, event)
+        if rd.port.writes > writes:
+            self.control_samples.append(rd.port.last_write - t0)
+        rd.pump()
+
+    def results(self, wall):
+        counts = [rd.frame_counts() for rd in self.devices.values()]
+        devs = [rd.dev for rd in self.devices.values()]
+        processed = sum(dev.counters['frames_processed'] for dev in devs)
+        return {
+            'trace': self.path,
+            'speed': self.speed,
+            'devices': [dev.device_id for dev in devs],
+            'records': self.records,
+            'trace_duration_s': round(self.trace_duration, 3),
+            'wall_s': round(wall, 3),
+            'effective_speed': round(self.trace_duration / wall, 1) if wall > 0 else None,
+            'throughput': {
+                'records_per_s': round(self.records / wall, 1) if wall > 0 else None,
+                'frames_processed_per_s': round(processed / wall, 1) if wall > 0 else None,
+            },
+            'frames': {
+                'received': sum(c['received'] for c in counts),
+                'processed': processed,
+                'discarded': sum(c['discarded'] for c in counts),
+                'invalid': sum(c['invalid'] for c in counts),
+                'lost': sum(c['lost'] for c in counts),
+                'mismatched': sum(dev.counters['frames_mismatched'] for dev in devs),
+            },
+            'commands': {
+                'recorded': sum(rd.recorded_tx for rd in self.devices.values()),
+                'replayed': sum(rd.port.writes for rd in self.devices.values()),
+            },
+            'status_writes': sum(dev.counters['status_writes'] for dev in devs),
+            'rx_processing': summarize(self.rx_samples),
+            'control_to_serial': summarize(self.control_samples),
+            'schedule_lag': summarize(self.lag_samples),
+        }
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='wc-replay-')
+    wc.cloud = MeteredBackend(InMemoryBackend())
+    wc.cloud.connect()
+    wc.outbox = OutboundQueue(os.path.join(workdir, 'outbox.db'))
+    wc.record_cloud_result(True)
+
+    replayer = Replayer(args.trace, args.speed, workdir)
+    log = sys.stdout if args.verbose else open(os.devnull, 'w')
+    log_listener = wc.setup_logging() if args.verbose else None  # 로그는 --verbose일 때만 출력
+    try:
+        with contextlib.redirect_stdout(log):
+            wall = replayer.run()
+        return replayer.results(wall)
+    finally:
+        for rd in replayer.devices.values():
+            rd.dev.config_store.flush()
+        wc.outbox.close()
+        if log_listener is not None:
+            log_listener.stop()
+        if log is not sys.stdout:
+            log.close()
+
+
+def compare(results, baseline, tolerance, slack_ms=1.0):
+    """기준 결과 대비 악화된 항목 목록. 지연은 p95가 늘면, 처리량은 줄면, 프레임 손실은 늘면 악화."""
+    regressions = []
+    for key in ('rx_processing', 'control_to_serial'):
+        old, new = (baseline.get(key) or {}).get('p95_ms'), (results.get(key) or {}).get('p95_ms')
+        if old and new and new > old * (1 + tolerance) + slack_ms:
+            regressions.append(f'{key}.p95_ms: {old} -> {new}')
+    if results.get('speed') == 0 and baseline.get('speed') == 0:
+        # 처리량은 최대 속도 재생끼리만 비교할 수 있음
+        old = baseline.get('throughput', {}).get('frames_processed_per_s')
+        new = results.get('throughput', {}).get('frames_processed_per_s')
+        if old and new is not None and new < old * (1 - tolerance):
+            regressions.append(f'throughput.frames_processed_per_s: {old} -> {new}')
+    for key in ('invalid', 'lost', 'mismatched'):
+        old, new = baseline.get('frames', {}).get(key), results.get('frames', {}).get(key)
+        if old is not None and new is not None and new > old:
+            regressions.append(f'frames.{key}: {old} -> {new}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='웨어러블 컨트롤러 트레이스 재생')
+    parser.add_argument('trace', help='--record-trace로 기록한 트레이스 파일')
+    parser.add_argument('--speed', type=float, default=1.0, help='재생 배속 (기본 1, 0이면 최대 속도)')
+    parser.add_argument('--json', metavar='FILE', help='결과를 JSON 파일로 저장')
+    parser.add_argument('--baseline', metavar='FILE', help='비교할 기준 결과 JSON')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='허용 악화 비율 (기본 0.2 = 20%%)')
+    parser.add_argument('--slack-ms', type=float, default=1.0, help='지연 비교 시 추가로 허용하는 절대 차이 (ms)')
+    parser.add_argument('--verbose', action='store_true', help='컨트롤러 출력 표시')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.slack_ms)
+        for line in regressions:
+            print(f"❌ 성능 저하: {line}")
+        if regressions:
+            return 1
+        print("✅ 기준 대비 성능 저하 없음")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""아두이노 시리얼 프로토콜: 프레임 인코딩, 명령 채널(ACK/재전송), 수신 프레임 리더.
+
+텍스트('SENSORS:'/'CMD:') 프로토콜과 연결 시 협상하는 바이너리 프레임 프로토콜을 모두 다룬다.
+"""
+
+import binascii
+import functools
+import itertools
+import os
+import select
+import struct
+import threading
+import time
+from collections import deque
+
+import serial
+
+from log_metrics import control_log, metrics
+from tracing import TRACE_RX, TRACE_TX
+
+BAUD_RATE = 9600
+SERIAL_READ_TIMEOUT = 0.1  # 시리얼 수신 대기 최대 시간 (초)
+SERIAL_CHUNK_SIZE = 1024   # 한 번에 읽어 들이는 최대 바이트 수
+SERIAL_MAX_PENDING = 4096  # 줄바꿈 없이 이 크기를 넘으면 쓰레기 데이터로 보고 버림
+SERIAL_PROTOCOL = 'auto'   # 'auto': 연결 시 바이너리 프로토콜 협상, 실패하면 텍스트 / 'text': 텍스트 고정
+SERIAL_NEGOTIATE_TIMEOUT = 1.0  # 바이너리 협상 응답 대기 시간 (초)
+COMMAND_RETRY_BASE = 0.5  # ACK가 없을 때 첫 재전송까지 대기 (초), 이후 2배씩 증가
+COMMAND_RETRY_MAX = 30    # 재전송 간격 상한 (초)
+DEFAULT_TARGET_TEMP = 24  # target_temp가 없을 때 사용하는 목표 온도
+GROUP_CHANNELS = {'A': 'group_1', 'B': 'group_2'}  # 아두이노 드라이버 -> control/groups 키
+EDGE_SETPOINT_STEP = 0.5  # 명령 설정값 양자화 단위 (작은 보정으로 명령이 반복 전송되지 않도록)
+
+# --- 바이너리 시리얼 프로토콜 ---
+# [0xA5 0x5A][LEN][TYPE][SEQ][PAYLOAD...][CRC16 LE]
+#  LEN = TYPE+SEQ+PAYLOAD 바이트 수, CRC16-CCITT(초기값 0xFFFF)는 LEN부터 PAYLOAD 끝까지 계산
+#  SENSORS payload: [N][int16 LE x N] (0.01°C 단위), CMD payload: [그룹(0=A,1=B)][모드][int16 LE 목표온도 0.01°C]
+# 텍스트 모드 명령은 CMD:그룹:모드:온도:SEQ 이며, 신규 펌웨어는 ACK:그룹:SEQ 로 응답한다.
+FRAME_SYNC = b'\xa5\x5a'
+FRAME_SENSORS = 0x01
+FRAME_CMD = 0x02
+FRAME_ACK = 0x03   # payload: [그룹][ACK 대상 CMD의 SEQ]
+HELLO_REQUEST = b'HELLO:BIN1\n'
+HELLO_REPLY = b'HELLO:BIN1:OK'
+MODE_CODES = {'OFF': 0, 'COOLING': 1, 'HEATING': 2}
+
+_tx_seq = itertools.count()
+
+def next_seq():
+    return next(_tx_seq) & 0xFF
+
+def encode_frame(frame_type, payload, seq=None):
+    seq = next_seq() if seq is None else seq
+    body = bytes((len(payload) + 2, frame_type, seq)) + payload
+    return FRAME_SYNC + body + struct.pack('<H', binascii.crc_hqx(body, 0xFFFF))
+
+@functools.lru_cache(maxsize=256, typed=True)
+def command_payload(group, mode, temp, protocol):
+    """CMD 프레임에서 SEQ/CRC를 뺀 부분. 프리셋·보정 설정값 조합은 몇 가지뿐이라 캐시해 둔다."""
+    if protocol == 'binary':
+        return struct.pack('<BBh', 0 if group == 'A' else 1, MODE_CODES.get(mode, 0), round(float(temp) * 100))
+    return f"CMD:{group}:{mode}:{temp}:".encode()
+
+def format_command(group, mode, temp, seq, protocol='text'):
+    """프로토콜('text' | 'binary')에 맞는 CMD 프레임(bytes) 생성."""
+    payload = command_payload(group, mode, temp, protocol)
+    if protocol == 'binary':
+        return encode_frame(FRAME_CMD, payload, seq)
+    return payload + b'%d\n' % seq
+
+def compile_control(control):
+    """control/프리셋 형식의 dict({'global_mode', 'groups'})를 그룹별 (mode, temp)로 변환."""
+    mode = (control.get('global_mode') or 'off').upper()
+    groups = control.get('groups') or {}
+    return {group: (mode, (groups.get(group_key) or {}).get('target_temp', DEFAULT_TARGET_TEMP))
+            for group, group_key in GROUP_CHANNELS.items()}
+
+class CommandChannel:
+    """그룹별 목표 상태를 보관하고, 바뀐 경우에만 아두이노로 전송하는 명령 채널.
+
+    전송한 명령은 SEQ로 ACK를 기다리며, ACK가 없는 그룹만 지수 백오프로 재전송한다.
+    (ACK를 보내지 않는 구버전 펌웨어에서는 COMMAND_RETRY_MAX 간격의 재동기화가 된다)
+    """
+
+    def __init__(self, retry_base=COMMAND_RETRY_BASE, retry_max=COMMAND_RETRY_MAX):
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self._desired = {}    # group -> (mode, temp) 실제로 보낼 상태
+        self._targets = {}    # group -> (mode, temp) control에서 받은 목표 (보정 전)
+        self._trim = {}       # group -> 로컬 제어 루프의 설정값 보정 (°C)
+        self._dirty = set()   # 새 상태를 아직 보내지 않은 그룹
+        self._inflight = {}   # group -> {'sent': {seq: 전송 시각}, 'attempts', 'next_retry'}
+        self.sent_count = 0
+        self.retry_count = 0
+        self.ack_latencies = deque(maxlen=100)  # 전송 -> ACK 지연 (초)
+        self.protocol = 'text'  # 현재 연결에서 협상된 시리얼 프로토콜
+        self.tag = ''
+        self.tracer = None      # 트레이스를 켜면 TraceRecorder.add_device()가 설정
+        self.trace_id = None    # 트레이스 기록용 기기 ID
+
+    def set_desired(self, group, mode, temp):
+        state = (mode, temp)
+        with self._lock:
+            if self._desired.get(group) != state:
+                self._desired[group] = state
+                self._dirty.add(group)
+
+    def set_control(self, control):
+        """control/프리셋 형식의 dict({'global_mode', 'groups'})에서 그룹별 상태를 갱신."""
+        self.set_targets(compile_control(control))
+
+    def set_targets(self, targets):
+        """compile_control() 형식의 {group: (mode, temp)}로 그룹별 목표를 갱신."""
+        for group, target in targets.items():
+            with self._lock:
+                self._targets[group] = target
+            self._apply(group)
+
+    def target(self, group):
+        """control에서 받은 (mode, temp). 아직 없으면 None."""
+        with self._lock:
+            return self._targets.get(group)
+
+    def set_trim(self, group, trim):
+        with self._lock:
+            self._trim[group] = trim
+        self._apply(group)
+
+    def _apply(self, group):
+        with self._lock:
+            target = self._targets.get(group)
+            trim = self._trim.get(group, 0)
+        if target is None:
+            return
+        mode, temp = target
+        if trim:
+            temp = round((float(temp) + trim) / EDGE_SETPOINT_STEP) * EDGE_SETPOINT_STEP
+            if temp == int(temp):
+                temp = int(temp)
+        self.set_desired(group, mode, temp)
+
+    def reset(self):
+        """재연결 후 호출. 아두이노가 초기화됐을 수 있으므로 모든 그룹을 다시 보낸다."""
+        with self._lock:
+            self._inflight.clear()
+            self._dirty = set(self._desired)
+
+    def pump(self, port, now=None):
+        """보낼 명령(변경분, 재전송 시점이 된 미확인 명령)을 전송. 보낸 개수를 반환."""
+        now = time.monotonic() if now is None else now
+        sent = 0
+        with self._lock:
+            for group, state in self._desired.items():
+                inflight = self._inflight.get(group)
+                if group in self._dirty:
+                    self._send(port, group, state, 1, now)
+                elif inflight and now >= inflight['next_retry']:
+                    self.retry_count += 1
+                    self._send(port, group, state, inflight['attempts'] + 1, now)
+                else:
+                    continue
+                sent += 1
+        return sent
+
+    def _send(self, port, group, state, attempts, now):
+        mode, temp = state
+        seq = next_seq()
+        self._dirty.discard(group)
+        frame = format_command(group, mode, temp, seq, self.protocol)
+        try:
+            port.write(frame)
+        except Exception:
+            self._dirty.add(group)
+            raise
+        if self.tracer is not None:
+            self.tracer.record(TRACE_TX, self.trace_id, frame)
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        # 같은 상태의 재전송이면 이전 SEQ에 대한 늦은 ACK도 인정
+        sent = self._inflight[group]['sent'] if attempts > 1 and group in self._inflight else {}
+        sent[seq] = now
+        self._inflight[group] = {'sent': sent, 'attempts': attempts, 'next_retry': now + delay, 'state': state}
+        self.sent_count += 1
+        metrics.inc('serial.tx_bytes', len(frame))
+        metrics.inc('commands.sent')
+        if attempts > 1:
+            metrics.inc('commands.retries')
+        control_log.info("%s-> 전송: CMD:%s:%s:%s (seq %d, 시도 %d)", self.tag, group, mode, temp, seq, attempts)
+
+    def on_ack(self, group, seq, now=None):
+        """대기 중인 명령의 ACK이면 아두이노에 적용된 (mode, temp)를 반환, 아니면 None."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            inflight = self._inflight.get(group)
+            if inflight and seq in inflight['sent']:
+                del self._inflight[group]
+                latency = now - inflight['sent'][seq]
+                self.ack_latencies.append(latency)
+                metrics.observe('commands.ack_latency', latency)
+                control_log.debug("%s✔️ ACK %s (seq %d, %.1f ms)", self.tag, group, seq, latency * 1000)
+                return inflight['state']
+            return None
+
+    def pending(self):
+        with self._lock:
+            return len(self._dirty) + len(self._inflight)
+
+    def next_deadline(self):
+        """다음으로 pump()가 필요한 시각(time.monotonic 기준). 없으면 None."""
+        with self._lock:
+            if self._dirty:
+                return 0
+            if not self._inflight:
+                return None
+            return min(inflight['next_retry'] for inflight in self._inflight.values())
+
+class SerialFrameReader:
+    """재사용 bytearray 버퍼로 시리얼 데이터를 읽고 프레임을 점진적으로 분리.
+
+    fill()은 데이터가 올 때까지 최대 timeout 동안 대기(select)한 뒤 읽을 수 있는 만큼 읽고,
+    latest_sensor_frame()은 새로 완성된 프레임 중 가장 최신 센서 프레임만 파싱한다.
+    버려지는 프레임은 디코딩하지 않고 개수만 센다. negotiate()로 바이너리 모드를 협상하며,
+    아두이노가 응답하지 않으면 텍스트('SENSORS:') 모드를 유지한다.
+    """
+
+    PREFIX = b'SENSORS:'
+
+    def __init__(self, port, chunk_size=SERIAL_CHUNK_SIZE, max_pending=SERIAL_MAX_PENDING, tracer=None,
+                 trace_id=None, sensor_count=None):
+        self.port = port
+        self.tracer = tracer  # 송수신 바이트를 기록할 TraceRecorder (None이면 기록하지 않음)
+        self.trace_id = trace_id  # 트레이스 기록용 기기 ID
+        self.sensor_count = sensor_count  # 텍스트 줄의 기대 센서 수 (None이면 확인하지 않음)
+        self.max_pending = max_pending
+        self._chunk = bytearray(chunk_size)
+        self._chunk_view = memoryview(self._chunk)
+        self._pending = bytearray()  # 아직 줄바꿈을 받지 못한 데이터 포함
+        try:
+            self._fd = port.fileno()
+        except Exception:
+            self._fd = None  # fileno가 없는 포트 (Windows 등)는 pyserial read로 대체
+
+        self.bytes_received = 0
+        self.frames_received = 0
+        self.frames_discarded = 0   # 최신 프레임만 처리하면서 건너뛴 프레임
+        self.frames_invalid = 0     # 파싱/CRC 검사에 실패한 프레임
+        self.frames_lost = 0        # 시퀀스 번호로 확인한 유실 프레임 (바이너리 모드)
+        self.binary = False
+        self._rx_seq = None
+        self.acks = []  # 수신한 (그룹, SEQ) ACK 목록, pop_acks()로 꺼냄
+
+    def fill(self, timeout=SERIAL_READ_TIMEOUT):
+        """최대 timeout초 대기 후 수신된 바이트를 내부 버퍼에 추가. 읽은 바이트 수를 반환."""
+        if self._fd is not None:
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+            if not ready:
+                return 0
+            n = os.readv(self._fd, [self._chunk_view])
+            if n == 0:
+                # 준비됐다고 했는데 데이터가 없으면 장치가 분리된 것 (pyserial과 동일한 판단)
+                raise serial.SerialException('device reports readiness to read but returned no data')
+            self._pending += self._chunk_view[:n]
+        else:
+            data = self.port.read(max(1, self.port.in_waiting))
+            n = len(data)
+            self._pending += data
+        self.bytes_received += n
+        metrics.inc('serial.rx_bytes', n)
+        if self.tracer is not None and n:
+            self.tracer.record(TRACE_RX, self.trace_id, self._pending[-n:])
+        return n
+
+    def pop_acks(self):
+        acks, self.acks = self.acks, []
+        return acks
+
+    def negotiate(self, mode=SERIAL_PROTOCOL, timeout=SERIAL_NEGOTIATE_TIMEOUT):
+        """바이너리 프로토콜을 요청하고 결과 프로토콜('binary' | 'text')을 반환.
+
+        구버전 펌웨어는 HELLO 요청을 무시하므로 timeout 후 텍스트 모드로 남는다.
+        """
+        self.binary = False
+        self._rx_seq = None
+        if mode == 'text':
+            return 'text'
+        self.port.write(HELLO_REQUEST)
+        if self.tracer is not None:
+            self.tracer.record(TRACE_TX, self.trace_id, HELLO_REQUEST)
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            self.fill(min(SERIAL_READ_TIMEOUT, remaining))
+            idx = self._pending.find(HELLO_REPLY)
+            if idx >= 0:
+                line_end = self._pending.find(b'\n', idx)
+                if line_end >= 0:
+                    # 응답 이전의 텍스트 프레임은 버림
+                    del self._pending[:line_end + 1]
+                    self.binary = True
+                    return 'binary'
+        return 'text'
+
+    def latest_sensor_frame(self):
+        """완성된 프레임들을 소비하고, 파싱되는 가장 최신 센서 프레임의 값 리스트(float)를 반환. 없으면 None."""
+        if self.binary:
+            return self._latest_binary_frame()
+        buf = self._pending
+        end = buf.rfind(b'\n')
+        if end < 0:
+            if len(buf) > self.max_pending:
+                del buf[:]
+            return None
+
+        lines = buf.count(b'\n', 0, end + 1)
+        self.frames_received += lines
+
+        # ACK 줄은 드물기 때문에 위치만 찾아 필요한 부분만 파싱
+        ack = buf.find(b'ACK:', 0, end)
+        while ack >= 0:
+            if ack == 0 or buf[ack - 1] in b'\r\n':
+                line_end = buf.find(b'\n', ack)
+                fields = buf[ack + 4:line_end].strip().split(b':')
+                if len(fields) == 2 and fields[1].isdigit():
+                    self.acks.append((fields[0].decode('ascii', 'ignore'), int(fields[1])))
+                    lines -= 1
+            ack = buf.find(b'ACK:', ack + 4, end)
+
+        # 완성된 영역에서 뒤에서부터 줄 시작 위치의 SENSORS: 를 찾음
+        # (가장 최신 줄이 깨졌으면 같은 읽기 안의 그 이전 줄 중 파싱되는 가장 최신 줄을 사용)
+        values = None
+        limit = end
+        while values is None:
+            start = buf.rfind(self.PREFIX, 0, limit)
+            while start > 0 and buf[start - 1] not in b'\r\n':
+                start = buf.rfind(self.PREFIX, 0, start)
+            if start < 0:
+                break
+            line_end = buf.find(b'\n', start)
+            try:
+                values = [float(v) for v in buf[start + len(self.PREFIX):line_end].split(b',')]
+                if self.sensor_count is not None and len(values) != self.sensor_count:
+                    raise ValueError('센서 수 불일치')  # 중간에 잘린 줄
+            except ValueError:
+                values = None
+                self.frames_invalid += 1
+                limit = start
+        self.frames_discarded += lines - (1 if values is not None else 0)
+
+        del buf[:end + 1]
+        return values
+
+    def _latest_binary_frame(self):
+        buf = self._pending
+        size = len(buf)
+        pos = 0
+        newest = None  # 가장 최신 SENSORS 프레임의 payload 위치
+        with memoryview(buf) as view:
+            while True:
+                start = buf.find(FRAME_SYNC, pos)
+                if start < 0:
+                    # 마지막 바이트가 동기 바이트의 앞부분일 수 있으므로 남겨둠
+                    pos = max(pos, size - 1)
+                    break
+                if size - start < 5:
+                    pos = start
+                    break
+                length = buf[start + 2]
+                body_end = start + 3 + length
+                if size < body_end + 2:
+                    pos = start
+                    break
+                crc = buf[body_end] | (buf[body_end + 1] << 8)
+                if length < 2 or binascii.crc_hqx(view[start + 2:body_end], 0xFFFF) != crc:
+                    self.frames_invalid += 1
+                    pos = start + 1
+                    continue
+
+                seq = buf[start + 4]
+                if self._rx_seq is not None:
+                    self.frames_lost += (seq - self._rx_seq - 1) & 0xFF
+                self._rx_seq = seq
+                self.frames_received += 1
+                frame_type = buf[start + 3]
+                if frame_type == FRAME_SENSORS:
+                    if newest is not None:
+                        self.frames_discarded += 1
+                    newest = (start + 5, body_end)
+                elif frame_type == FRAME_ACK and length >= 4:
+                    self.acks.append(('A' if buf[start + 5] == 0 else 'B', buf[start + 6]))
+                pos = body_end + 2
+
+            values = None
+            if newest is not None:
+                offset, end = newest
+                count = buf[offset]
+                if offset + 1 + 2 * count <= end:
+                    values = [v / 100 for v in struct.unpack_from(f'<{count}h', buf, offset + 1)]
+                else:
+                    self.frames_invalid += 1
+        if len(buf) > self.max_pending:
+            pos = len(buf)
+        del buf[:pos]
+        return values
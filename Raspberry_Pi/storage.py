@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""로컬 저장소: 설정 파일 기록(ConfigStore), 오프라인 쓰기 큐(OutboundQueue), 센서 시계열(SampleStore).
+
+모두 시리얼/클라우드 스레드를 막지 않도록 디스크 쓰기를 모으거나 백그라운드 스레드로 넘긴다.
+"""
+
+import bisect
+import contextlib
+import csv
+import datetime
+import json
+import math
+import mmap
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+
+from log_metrics import cloud_log, log, metrics
+
+HISTORY_ENABLED = False         # 센서 원본 샘플을 로컬 시계열 저장소에 기록 (config 'history'로 켬)
+HISTORY_RETENTION_DAYS = 7      # 로컬 시계열 보관 기간 (일 단위 세그먼트, 기기 하나 5Hz 기준 하루 약 12MB)
+HISTORY_FLUSH_ROWS = 256        # 쓰기 버퍼에 이만큼 모이면 세그먼트 파일에 추가
+HISTORY_FLUSH_INTERVAL = 10.0   # 행 수와 관계없이 쓰기 버퍼를 비우는 주기 (초)
+OUTBOX_MAX_BYTES = 20 * 1024 * 1024  # 큐 디스크 사용 상한 (초과 시 오래된 항목부터 삭제)
+OUTBOX_DRAIN_BATCH = 500        # 재연결 시 한 번의 update()로 보낼 최대 항목 수
+OUTBOX_DRAIN_MAX_BATCHES = 5    # 한 주기(1초)에 보낼 최대 배치 수
+CONFIG_SAVE_DEBOUNCE = 2.0      # config.json 변경을 모아서 기록하는 대기 시간 (초)
+
+class ConfigStore:
+    """config.json 등 로컬 JSON 파일 쓰기 전담 (지연 병합 + 변경 확인 + 원자적 교체).
+
+    save()는 호출한 스레드에서 내용을 직렬화해 두기만 하고 바로 반환한다. 마지막으로 기록한
+    내용과 같으면 아무것도 하지 않으며, 연달아 바뀌면 debounce초 동안 모아 마지막 내용만
+    백그라운드 스레드에서 기록한다. 기록은 임시 파일에 쓰고 fsync한 뒤 os.replace로 교체하므로
+    쓰는 도중 전원이 꺼져도 이전 파일이나 새 파일 중 하나가 온전히 남는다.
+    """
+
+    def __init__(self, path, debounce=CONFIG_SAVE_DEBOUNCE):
+        self.path = path
+        self.debounce = debounce
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # 디스크 쓰기는 save()를 막지 않도록 별도 잠금
+        self._written = None   # 파일에 있는 것으로 확인된 직렬화 내용
+        self._pending = None   # 아직 기록하지 않은 최신 내용
+        self._deadline = None
+        self._thread = None
+
+    @staticmethod
+    def serialize(data):
+        return json.dumps(data, indent=4, ensure_ascii=False)
+
+    def mark_clean(self, data):
+        """파일에서 읽은 내용을 기록된 것으로 표시 (같은 내용을 다시 쓰지 않도록)."""
+        with self._cond:
+            self._written = self.serialize(data)
+
+    def save(self, data):
+        text = self.serialize(data)
+        with self._cond:
+            if text == (self._pending if self._pending is not None else self._written):
+                metrics.inc('config.save_skipped')
+                return
+            if self._pending is None:
+                self._deadline = time.monotonic() + self.debounce
+            self._pending = text
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='config-store', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None or (wait := self._deadline - time.monotonic()) > 0:
+                    self._cond.wait(None if self._pending is None else wait)
+            self.flush()
+
+    def flush(self):
+        """밀린 내용을 즉시 기록. 기록할 것이 없으면 아무것도 하지 않는다."""
+        with self._write_lock:
+            with self._cond:
+                text, self._pending = self._pending, None
+                if text is None or text == self._written:
+                    return
+            try:
+                with metrics.timer('config.write'):
+                    self._write_atomic(text)
+            except Exception as e:
+                log.error("❌ 설정 저장 실패: %s", e)
+                return
+            with self._cond:
+                self._written = text
+            metrics.inc('config.writes')
+
+    def _write_atomic(self, text):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # 이름 변경 자체도 디스크에 남도록 디렉터리 동기화
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class OutboundQueue:
+    """Firebase 연결이 끊긴 동안의 쓰기를 보관하는 SQLite(WAL) 기반 추가 전용 큐.
+
+    각 항목은 (기록 시각, DB 루트 기준 절대 경로, JSON 값)이며, 재연결 후 배치 단위로 묶어
+    루트 다중 경로 update() 한 번으로 전송한다. 메모리에는 한 배치만 올라온다.
+    """
+
+    def __init__(self, path, max_bytes=OUTBOX_MAX_BYTES, batch_size=OUTBOX_DRAIN_BATCH):
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                           'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                           'ts INTEGER NOT NULL, path TEXT NOT NULL, value TEXT NOT NULL)')
+        self._page_size = self._conn.execute('PRAGMA page_size').fetchone()[0]
+        self._depth = self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def __len__(self):
+        return self._depth
+
+    def put(self, updates, ts_ms=None):
+        """{절대 경로: 값}을 하나의 트랜잭션으로 저장."""
+        ts_ms = int(time.time() * 1000) if ts_ms is None else ts_ms
+        rows = [(ts_ms, path, json.dumps(value, ensure_ascii=False)) for path, value in updates.items()]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('INSERT INTO outbox (ts, path, value) VALUES (?, ?, ?)', rows)
+            self._conn.execute('COMMIT')
+            self._depth += len(rows)
+            self._enforce_cap()
+
+    def _enforce_cap(self):
+        page_count = self._conn.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if (page_count - free_pages) * self._page_size <= self.max_bytes:
+            return
+        # 용량 초과: 가장 오래된 10%를 버린다 (삭제된 페이지는 이후 INSERT에서 재사용됨)
+        drop = max(1, self._depth // 10)
+        self._conn.execute('DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)', (drop,))
+        self._depth = self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+        cloud_log.warning("⚠️ 오프라인 큐 용량 초과: 오래된 항목 %d개 삭제", drop)
+
+    def drain(self, write_fn, max_batches=OUTBOX_DRAIN_MAX_BATCHES):
+        """오래된 순서로 배치를 꺼내 write_fn(다중 경로 dict)으로 전송하고, 성공한 배치만 삭제.
+
+        write_fn이 예외를 던지면 해당 배치는 큐에 남는다. 전송한 항목 수를 반환.
+        """
+        sent = 0
+        for _ in range(max_batches):
+            with self._lock:
+                rows = self._conn.execute('SELECT id, path, value FROM outbox ORDER BY id LIMIT ?',
+                                          (self.batch_size,)).fetchall()
+            if not rows:
+                break
+            merged = {}
+            for _, path, value in rows:
+                merged[path] = json.loads(value)  # 같은 경로는 마지막 값만 남음
+            write_fn(merged)
+            with self._lock:
+                self._conn.execute('DELETE FROM outbox WHERE id <= ?', (rows[-1][0],))
+                self._depth = max(0, self._depth - len(rows))
+            sent += len(rows)
+        return sent
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+@contextlib.contextmanager
+def mapped_column(path, fmt):
+    """열 파일을 읽기 전용 mmap으로 열어 fmt('q' | 'f') 형식의 memoryview로 제공 (복사 없음)."""
+    itemsize = struct.calcsize(fmt)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        yield memoryview(b'').cast(fmt)
+        return
+    with f:
+        size = os.fstat(f.fileno()).st_size // itemsize * itemsize
+        if not size:
+            yield memoryview(b'').cast(fmt)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            raw = memoryview(mm)
+            view = raw[:size].cast(fmt)
+            try:
+                yield view
+            finally:
+                view.release()
+                raw.release()
+
+class SampleStore:
+    """센서 원본 샘플의 로컬 시계열 저장소 (추가 전용, 열 단위, 일 단위 세그먼트).
+
+    세그먼트 {root}/{YYYY-MM-DD}/에 시각(time.i64, epoch ms)과 센서별 값(sensor_XX.f32)을 같은 행 순서로
+    추가한다. 시각 열은 항상 증가하므로 그 자체가 시간 인덱스이며, 조회는 파일을 mmap해 이진 탐색한
+    구간만 읽는다. 저장소가 커져도 상주 메모리는 쓰기 버퍼(HISTORY_FLUSH_ROWS행)로 일정하다.
+
+    append()는 호출한 (시리얼) 스레드에서 메모리 버퍼에 추가만 하고, 찬 버퍼는 백그라운드 스레드가
+    세그먼트 열기/정리와 함께 파일에 기록한다. 느린 SD 카드 쓰기가 시리얼 읽기를 막지 않는다.
+    """
+
+    TIME_FILE = 'time.i64'
+
+    def __init__(self, root, sensor_ids, retention_days=HISTORY_RETENTION_DAYS,
+                 flush_rows=HISTORY_FLUSH_ROWS, flush_interval=HISTORY_FLUSH_INTERVAL):
+        self.root = root
+        self.sensor_ids = list(sensor_ids)
+        self.retention_days = retention_days
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # 디스크 쓰기는 append()를 막지 않도록 별도 잠금
+        self._day = None      # 쓰기 버퍼의 세그먼트 날짜
+        self._last_ms = 0     # 마지막 행의 시각 (시계가 되돌아가도 시각 열이 줄지 않도록)
+        self._times = array('q')
+        self._columns = [array('f') for _ in self.sensor_ids]
+        self._next_flush = time.monotonic() + flush_interval
+        self._pending = []    # 기록 대기 중인 버퍼 [(날짜, 시각 열, 센서 열 목록)]
+        self._thread = None
+        self._open_day = None  # 파일 쪽에서 열어 둔 세그먼트 날짜 (쓰기 스레드 전용)
+        self._segment_last = 0  # 열어 둔 세그먼트의 마지막 시각
+        self.rows_written = 0
+
+    @classmethod
+    def from_config(cls, config_path, config_data, sensor_ids):
+        """config.json의 'history'로 설정을 덮어쓴다. enabled가 false면 None."""
+        options = config_data.get('history', {})
+        if not options.get('enabled', HISTORY_ENABLED):
+            return None
+        root = options.get('path') or os.path.splitext(config_path)[0] + '_history'
+        return cls(root, sensor_ids, retention_days=options.get('retention_days', HISTORY_RETENTION_DAYS))
+
+    def _column_path(self, day, name):
+        return os.path.join(self.root, day, name)
+
+    def _open_segment(self, day):
+        """세그먼트를 열고 (비정상 종료로) 열 길이가 어긋났으면 시각 열 기준으로 맞춘다."""
+        os.makedirs(os.path.join(self.root, day), exist_ok=True)
+        time_path = self._column_path(day, self.TIME_FILE)
+        with mapped_column(time_path, 'q') as times:
+            rows = len(times)
+            self._segment_last = times[-1] if rows else 0
+        for sensor_id in self.sensor_ids:
+            path = self._column_path(day, f'{sensor_id}.f32')
+            if os.path.exists(path):  # 새로 추가된 센서의 열은 아래에서 NaN으로 채움
+                rows = min(rows, os.path.getsize(path) // 4)
+        with open(time_path, 'ab') as f:
+            f.truncate(rows * 8)
+        for sensor_id in self.sensor_ids:
+            with open(self._column_path(day, f'{sensor_id}.f32'), 'ab') as f:
+                if f.tell() > rows * 4:
+                    f.truncate(rows * 4)
+                elif f.tell() < rows * 4:
+                    f.write(array('f', [math.nan] * (rows - f.tell() // 4)).tobytes())
+        self._open_day = day
+        self._prune(day)
+
+    def _prune(self, today):
+        cutoff = (datetime.date.fromisoformat(today) - datetime.timedelta(days=self.retention_days)).isoformat()
+        for day in self.days():
+            if day < cutoff:
+                shutil.rmtree(os.path.join(self.root, day), ignore_errors=True)
+
+    def days(self):
+        """저장된 세그먼트 날짜 목록 (오름차순)."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if len(name) == 10 and name[4] == '-' and name[7] == '-')
+
+    def append(self, values, ts_ms=None):
+        """한 프레임의 센서 값을 추가 (부족한 센서는 NaN)."""
+        ts_ms = int(time.time() * 1000) if ts_ms is None else ts_ms
+        day = datetime.datetime.fromtimestamp(ts_ms / 1000).strftime('%Y-%m-%d')
+        with self._cond:
+            if day != self._day:
+                self._hand_off()
+                self._day = day
+            self._last_ms = max(ts_ms, self._last_ms)
+            self._times.append(self._last_ms)
+            for i, column in enumerate(self._columns):
+                column.append(values[i] if i < len(values) else math.nan)
+            if len(self._times) >= self.flush_rows or time.monotonic() >= self._next_flush:
+                self._hand_off()
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='sample-store', daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+
+    def _hand_off(self):
+        """쓰기 버퍼를 기록 대기 목록으로 넘긴다 (_cond를 잡은 상태에서 호출)."""
+        self._next_flush = time.monotonic() + self.flush_interval
+        if not self._times:
+            return
+        self._pending.append((self._day, self._times, self._columns))
+        self._times = array('q')
+        self._columns = [array('f') for _ in self.sensor_ids]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._write_lock:
+            with self._cond:
+                batches, self._pending = self._pending, []
+            for day, times, columns in batches:
+                try:
+                    self._write_batch(day, times, columns)
+                except OSError as e:
+                    metrics.inc('history.write_errors')
+                    log.error("❌ 로컬 시계열 기록 실패 (%s행 버림): %s", len(times), e)
+
+    def _write_batch(self, day, times, columns):
+        if day != self._open_day:
+            self._open_segment(day)
+        # 재시작 직후 시계가 파일의 마지막 시각보다 뒤처져 있으면 그 시각으로 맞춤 (시각 열은 줄지 않음)
+        k = 0
+        while k < len(times) and times[k] < self._segment_last:
+            times[k] = self._segment_last
+            k += 1
+        self._segment_last = times[-1]
+        with open(self._column_path(day, self.TIME_FILE), 'ab') as f:
+            f.write(times.tobytes())
+        for sensor_id, column in zip(self.sensor_ids, columns):
+            with open(self._column_path(day, f'{sensor_id}.f32'), 'ab') as f:
+                f.write(column.tobytes())
+        self.rows_written += len(times)
+        metrics.inc('history.rows', len(times))
+
+    def flush(self):
+        """버퍼와 기록 대기 중인 행을 호출한 스레드에서 즉시 기록 (조회, 종료 처리용)."""
+        with self._cond:
+            self._hand_off()
+        self._write_pending()
+
+    def query(self, start_ms, end_ms, step_ms=None, sensors=None):
+        """[start_ms, end_ms) 구간의 행 목록 [(시각 ms, [센서별 값])].
+
+        step_ms를 주면 step_ms 단위 구간의 평균(NaN 제외, 값이 없으면 None)으로 다운샘플링한다.
+        """
+        self.flush()  # 버퍼에 있는 최근 행도 조회되도록
+        sensors = list(sensors or self.sensor_ids)
+        first = datetime.datetime.fromtimestamp(start_ms / 1000).strftime('%Y-%m-%d')
+        last = datetime.datetime.fromtimestamp(max(start_ms, end_ms - 1) / 1000).strftime('%Y-%m-%d')
+        rows = []
+        for day in self.days():
+            if first <= day <= last:
+                rows.extend(self._query_segment(day, start_ms, end_ms, step_ms, sensors))
+        return rows
+
+    def _query_segment(self, day, start_ms, end_ms, step_ms, sensors):
+        with contextlib.ExitStack() as stack:
+            times = stack.enter_context(mapped_column(self._column_path(day, self.TIME_FILE), 'q'))
+            # 이 세그먼트 이후에 추가된 센서는 열 파일이 없으므로 None으로 채움
+            columns = [stack.enter_context(mapped_column(path, 'f')) if os.path.exists(path) else None
+                       for path in (self._column_path(day, f'{sensor_id}.f32') for sensor_id in sensors)]
+            n = min([len(times)] + [len(column) for column in columns if column is not None])
+            i = bisect.bisect_left(times, start_ms, 0, n)
+            end = bisect.bisect_left(times, end_ms, i, n)
+            if not step_ms:
+                return [(times[k], [None if column is None or column[k] != column[k] else round(column[k], 2)
+                                    for column in columns])
+                        for k in range(i, end)]
+            rows = []
+            while i < end:
+                bucket = times[i] - times[i] % step_ms
+                j = bisect.bisect_left(times, bucket + step_ms, i, end)
+                values = []
+                for column in columns:
+                    valid = [v for v in column[i:j] if v == v] if column is not None else []
+                    values.append(round(sum(valid) / len(valid), 2) if valid else None)
+                rows.append((bucket, values))
+                i = j
+            return rows
+
+    def export_csv(self, out, start_ms, end_ms, step_ms=None, sensors=None):
+        """조회 결과를 CSV(time, ts_ms, 센서...)로 out(텍스트 파일 객체)에 쓴다. 쓴 행 수를 반환."""
+        sensors = list(sensors or self.sensor_ids)
+        writer = csv.writer(out)
+        writer.writerow(['time', 'ts_ms'] + sensors)
+        count = 0
+        for ts_ms, values in self.query(start_ms, end_ms, step_ms, sensors):
+            stamp = datetime.datetime.fromtimestamp(ts_ms / 1000).isoformat(timespec='milliseconds')
+            writer.writerow([stamp, ts_ms] + ['' if v is None else v for v in values])
+            count += 1
+        return count
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+# 컨트롤러 모듈(wearable_controller.py 등)은 패키지가 아닌 스크립트 디렉터리에 있으므로 상위 디렉터리를 경로에 추가
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cloud_backends import InMemoryBackend  # noqa: E402
+from fake_arduino import FakeArduino  # noqa: E402
+
+
+class MemoryPort:
+    """fileno 없는 pyserial 포트 흉내 (SerialFrameReader는 read/in_waiting으로 읽는다)."""
+
+    def __init__(self, data=b''):
+        self.rx = bytearray(data)
+        self.written = []
+
+    @property
+    def in_waiting(self):
+        return len(self.rx)
+
+    def read(self, size):
+        data = bytes(self.rx[:size])
+        del self.rx[:size]
+        return data
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+
+@pytest.fixture
+def memory_port():
+    """수신 데이터를 미리 채운 MemoryPort를 만드는 팩토리."""
+    return MemoryPort
+
+
+@pytest.fixture
+def memory_backend():
+    return InMemoryBackend()
+
+
+@pytest.fixture
+def fake_arduino():
+    """pty 기반 가짜 아두이노를 시작하는 팩토리 (테스트가 끝나면 정지)."""
+    started = []
+
+    def start(**kwargs):
+        fake = FakeArduino(**kwargs).start()
+        started.append(fake)
+        return fake
+
+    yield start
+    for fake in started:
+        fake.stop()
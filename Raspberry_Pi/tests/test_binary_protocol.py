@@ -0,0 +1,94 @@
+"""바이너리 시리얼 프로토콜(CRC16 프레이밍, 시퀀스 번호) 테스트."""
+
+import binascii
+import struct
+
+import serial_protocol
+
+
+def sensors_frame(values, seq):
+    payload = bytes((len(values),)) + struct.pack(f'<{len(values)}h', *(round(v * 100) for v in values))
+    return serial_protocol.encode_frame(serial_protocol.FRAME_SENSORS, payload, seq)
+
+
+def binary_reader(port):
+    reader = serial_protocol.SerialFrameReader(port)
+    reader.binary = True
+    reader.fill()
+    return reader
+
+
+def test_binary_frame_round_trip(memory_port):
+    frame = sensors_frame([24.5, -3.25, 30.0], seq=7)
+    assert frame[:2] == serial_protocol.FRAME_SYNC
+
+    reader = binary_reader(memory_port(frame))
+    assert reader.latest_sensor_frame() == [24.5, -3.25, 30.0]
+    assert reader.frames_received == 1
+    assert reader.frames_invalid == 0
+
+
+def test_binary_resync_after_garbage_and_bad_crc(memory_port):
+    good = sensors_frame([21.0, 22.0], seq=2)
+    corrupt = bytearray(sensors_frame([99.0, 99.0], seq=1))
+    corrupt[-1] ^= 0xFF  # CRC 손상
+    data = b'\x00\xa5garbage' + bytes(corrupt) + good
+
+    reader = binary_reader(memory_port(data))
+    assert reader.latest_sensor_frame() == [21.0, 22.0]
+    assert reader.frames_invalid >= 1
+    assert reader.frames_received == 1
+
+
+def test_binary_partial_frame_waits_for_rest(memory_port):
+    frame = sensors_frame([25.0], seq=0)
+    reader = binary_reader(memory_port(frame[:6]))
+    assert reader.latest_sensor_frame() is None
+
+    reader.port.rx += frame[6:]
+    reader.fill()
+    assert reader.latest_sensor_frame() == [25.0]
+
+
+def test_binary_keeps_newest_frame_and_counts_lost_sequence(memory_port):
+    data = sensors_frame([20.0], seq=10) + sensors_frame([21.0], seq=12)
+    data += serial_protocol.encode_frame(serial_protocol.FRAME_ACK, bytes((1, 42)), seq=13)
+
+    reader = binary_reader(memory_port(data))
+    assert reader.latest_sensor_frame() == [21.0]
+    assert reader.frames_discarded == 1
+    assert reader.frames_lost == 1
+    assert reader.pop_acks() == [('B', 42)]
+
+
+def test_binary_command_frame_decodes(memory_port):
+    frame = serial_protocol.format_command('B', 'COOLING', 23.5, seq=9, protocol='binary')
+    reader = binary_reader(memory_port(frame))
+    reader.latest_sensor_frame()
+    assert reader.frames_received == 1 and reader.frames_invalid == 0
+    assert frame[3] == serial_protocol.FRAME_CMD and frame[4] == 9
+    assert struct.unpack_from('<BBh', frame, 5) == (1, serial_protocol.MODE_CODES['COOLING'], 2350)
+
+
+def test_frame_layout_and_crc():
+    frame = serial_protocol.encode_frame(serial_protocol.FRAME_SENSORS, b'\x01\x10\x27', seq=5)
+    # [SYNC][LEN][TYPE][SEQ][PAYLOAD][CRC16 LE], CRC는 LEN부터 PAYLOAD 끝까지 (CRC-16/CCITT-FALSE, 펌웨어와 같음)
+    assert frame[:2] == serial_protocol.FRAME_SYNC
+    assert frame[2:5] == bytes((5, serial_protocol.FRAME_SENSORS, 5))
+    assert frame[-2:] == struct.pack('<H', binascii.crc_hqx(frame[2:-2], 0xFFFF))
+    assert binascii.crc_hqx(b'123456789', 0xFFFF) == 0x29B1
+
+
+def test_negotiate_switches_to_binary_and_drops_earlier_text(memory_port):
+    port = memory_port(b'SENSORS:1,2\nHELLO:BIN1:OK\r\n' + sensors_frame([22.0, 23.0], seq=0))
+    reader = serial_protocol.SerialFrameReader(port)
+    assert reader.negotiate('auto', timeout=0.5) == 'binary'
+    assert port.written == [serial_protocol.HELLO_REQUEST]
+    assert reader.latest_sensor_frame() == [22.0, 23.0]
+
+
+def test_negotiate_text_mode_does_not_send_hello(memory_port):
+    port = memory_port()
+    reader = serial_protocol.SerialFrameReader(port)
+    assert reader.negotiate('text') == 'text'
+    assert port.written == [] and not reader.binary
@@ -0,0 +1,76 @@
+"""아두이노 명령 채널(CommandChannel: 변경분 전송, ACK, 재전송 백오프) 테스트."""
+
+import pytest
+
+import serial_protocol
+
+
+def parse_text_command(frame):
+    _, group, mode, temp, seq = frame.decode().strip().split(':')
+    return group, mode, temp, int(seq)
+
+
+def test_command_channel_sends_changes_once(memory_port):
+    channel = serial_protocol.CommandChannel(retry_base=0.5, retry_max=4)
+    port = memory_port()
+    control = {'global_mode': 'cooling', 'groups': {'group_1': {'target_temp': 22}, 'group_2': {'target_temp': 25}}}
+
+    channel.set_control(control)
+    assert channel.pump(port, now=0) == 2
+    assert sorted(parse_text_command(f)[:3] for f in port.written) == [('A', 'COOLING', '22'), ('B', 'COOLING', '25')]
+
+    channel.set_control(control)  # 같은 상태는 다시 보내지 않음
+    assert channel.pump(port, now=0.1) == 0
+    assert channel.next_deadline() == 0.5
+
+
+def test_command_channel_ack_clears_and_backoff_doubles(memory_port):
+    channel = serial_protocol.CommandChannel(retry_base=0.5, retry_max=1.5)
+    port = memory_port()
+    channel.set_desired('A', 'HEATING', 28)
+
+    channel.pump(port, now=0)
+    first_seq = parse_text_command(port.written[-1])[3]
+    assert channel.pump(port, now=0.4) == 0
+    assert channel.pump(port, now=0.5) == 1     # 첫 재전송 (0.5초 후)
+    assert channel.next_deadline() == 1.5       # 다음은 2배 (0.5 + 1.0)
+    assert channel.pump(port, now=1.5) == 1
+    assert channel.next_deadline() == 3.0       # 상한 1.5초
+    assert channel.retry_count == 2
+
+    # 이전 SEQ에 대한 늦은 ACK도 인정
+    assert channel.on_ack('A', first_seq, now=1.6) == ('HEATING', 28)
+    assert channel.pending() == 0
+    assert channel.next_deadline() is None
+    assert channel.on_ack('A', first_seq, now=1.7) is None
+
+
+def test_command_channel_reset_resends_everything(memory_port):
+    channel = serial_protocol.CommandChannel()
+    port = memory_port()
+    channel.set_desired('A', 'COOLING', 24)
+    channel.set_desired('B', 'OFF', 24)
+    channel.pump(port, now=0)
+    for frame in port.written:
+        group, _, _, seq = parse_text_command(frame)
+        channel.on_ack(group, seq, now=0.01)
+    assert channel.pending() == 0
+
+    channel.reset()
+    assert channel.pump(port, now=1) == 2
+
+
+def test_command_channel_failed_write_keeps_group_dirty(memory_port):
+    class BrokenPort:
+        def write(self, data):
+            raise OSError('write failed')
+
+    channel = serial_protocol.CommandChannel()
+    channel.set_desired('A', 'COOLING', 24)
+    with pytest.raises(OSError):
+        channel.pump(BrokenPort(), now=0)
+    assert channel.next_deadline() == 0  # 다음 pump에서 바로 다시 보냄
+
+    port = memory_port()
+    assert channel.pump(port, now=0.1) == 1
+    assert parse_text_command(port.written[0])[:3] == ('A', 'COOLING', '24')
@@ -0,0 +1,66 @@
+"""pty 가짜 아두이노와 실제 시리얼 포트 경로(serial.Serial, select 기반 읽기)로 주고받는 테스트."""
+
+import time
+
+import serial
+
+import serial_protocol
+
+
+def read_frame(reader, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        reader.fill(0.05)
+        values = reader.latest_sensor_frame()
+        if values is not None:
+            return values
+    return None
+
+
+def wait_for(predicate, reader, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        reader.fill(0.05)
+        reader.latest_sensor_frame()
+        if predicate():
+            return True
+    return False
+
+
+def test_binary_negotiation_sensor_frames_and_acks(fake_arduino):
+    fake = fake_arduino(rate=50, sensors=[24.5, 25, 26, 27, 28])
+    port = serial.Serial(fake.port, serial_protocol.BAUD_RATE, timeout=0)
+    try:
+        reader = serial_protocol.SerialFrameReader(port, sensor_count=5)
+        assert reader.negotiate('auto', timeout=2.0) == 'binary'
+        assert read_frame(reader) == [24.5, 25.0, 26.0, 27.0, 28.0]
+
+        channel = serial_protocol.CommandChannel()
+        channel.protocol = 'binary'
+        channel.set_desired('B', 'COOLING', 22.5)
+        channel.pump(port)
+        assert wait_for(lambda: bool(reader.acks), reader)
+        group, seq = reader.pop_acks()[0]
+        assert channel.on_ack(group, seq) == ('COOLING', 22.5)
+        assert [command[1:] for command in fake.received] == [('B', 'COOLING', 22.5)]
+    finally:
+        port.close()
+
+
+def test_old_firmware_stays_in_text_mode(fake_arduino):
+    fake = fake_arduino(rate=50, binary=False, sensors=[20, 21, 22, 23, 24])
+    port = serial.Serial(fake.port, serial_protocol.BAUD_RATE, timeout=0)
+    try:
+        reader = serial_protocol.SerialFrameReader(port, sensor_count=5)
+        assert reader.negotiate('auto', timeout=0.3) == 'text'
+        assert read_frame(reader) == [20.0, 21.0, 22.0, 23.0, 24.0]
+
+        channel = serial_protocol.CommandChannel()
+        channel.set_desired('A', 'HEATING', 28)
+        channel.pump(port)
+        assert wait_for(lambda: bool(reader.acks), reader)
+        group, seq = reader.pop_acks()[0]
+        assert channel.on_ack(group, seq) == ('HEATING', 28)
+        assert [command[1:] for command in fake.received] == [('A', 'HEATING', 28.0)]
+    finally:
+        port.close()
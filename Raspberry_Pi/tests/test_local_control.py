@@ -0,0 +1,90 @@
+"""로컬 control 변경 조정(LocalOverrides)과 LAN 제어 요청 검증 테스트."""
+
+import http.client
+import threading
+import types
+
+import pytest
+
+import local_api
+import wearable_controller as wc
+
+
+def control(mode='cooling', temp=24, updated_at=None):
+    data = {'global_mode': mode, 'groups': {'group_1': {'target_temp': temp}}}
+    if updated_at is not None:
+        data['updated_at'] = updated_at
+    return data
+
+
+def test_local_overrides_keep_local_value_until_echo():
+    overrides = wc.LocalOverrides(hold=30)
+    overrides.add({'groups/group_1/target_temp': 20}, connected=True, updated_at=1000, now=0)
+
+    # 로컬 쓰기 이전의 스냅샷 (재연결 스냅샷, 늦은 이벤트, updated_at 없는 앱 쓰기)
+    assert overrides.reconcile(control(temp=24, updated_at=900), True, now=1) == {'groups/group_1/target_temp': 20}
+    assert overrides.reconcile(control(temp=24), True, now=2) == {'groups/group_1/target_temp': 20}
+
+    # 같은 값이 보이면 확인된 것으로 지움
+    assert overrides.reconcile(control(temp=20, updated_at=1000), True, now=3) == {}
+    assert len(overrides) == 0
+
+
+def test_local_overrides_newer_remote_write_wins():
+    overrides = wc.LocalOverrides(hold=30)
+    overrides.add({'global_mode': 'heating', 'groups/group_1/target_temp': 20}, True, updated_at=1000, now=0)
+
+    assert overrides.reconcile(control(mode='off', temp=26, updated_at=1500), True, now=1) == {}
+    assert len(overrides) == 0
+
+
+def test_local_overrides_hold_expires_only_while_connected():
+    overrides = wc.LocalOverrides(hold=30)
+    overrides.add({'global_mode': 'heating'}, connected=False, updated_at=1000, now=0)
+
+    # 오프라인에서 쓴 값은 연결될 때까지 만료되지 않음
+    assert overrides.reconcile(control(), False, now=100) == {'global_mode': 'heating'}
+    # 연결되면 그때부터 hold초를 기다린다
+    assert overrides.reconcile(control(), True, now=200) == {'global_mode': 'heating'}
+    assert overrides.reconcile(control(), True, now=229) == {'global_mode': 'heating'}
+    assert overrides.reconcile(control(), True, now=230) == {}
+    assert len(overrides) == 0
+
+
+@pytest.mark.parametrize('groups', [['group_1'], 'group_1', 3])
+def test_parse_control_changes_rejects_non_object_groups(groups):
+    with pytest.raises(ValueError, match='groups는 객체여야 합니다'):
+        local_api.parse_control_changes({'groups': groups})
+
+
+def test_parse_control_changes_accepts_missing_groups():
+    assert local_api.parse_control_changes({'global_mode': 'HEATING', 'groups': None}) == {'global_mode': 'heating'}
+
+
+def test_local_api_rejects_oversized_body():
+    dev = types.SimpleNamespace(device_id='d1', config_data={'device_password': '1234'})
+    server = local_api.LocalApiServer(('127.0.0.1', 0), [dev], None, None, lambda: True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+        conn.putrequest('POST', '/control')
+        conn.putheader('X-Device-Password', '1234')
+        conn.putheader('Content-Length', str(local_api.LOCAL_API_MAX_BODY + 1))
+        conn.endheaders()
+        assert conn.getresponse().status == 413
+        conn.close()
+
+        conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+        conn.request('POST', '/control', body=b'{}', headers={'X-Device-Password': '1234', 'Content-Length': 'x'})
+        assert conn.getresponse().status == 400
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_local_api_host_defaults_to_loopback():
+    plain = types.SimpleNamespace(config_data={})
+    exposed = types.SimpleNamespace(config_data={'local_api': {'host': '0.0.0.0'}})
+    assert local_api.local_api_host([plain]) == '127.0.0.1'
+    assert local_api.local_api_host([plain, exposed]) == '0.0.0.0'
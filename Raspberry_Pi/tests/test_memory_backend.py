@@ -0,0 +1,94 @@
+"""InMemoryBackend(--backend memory)의 Realtime Database 리스너 의미 테스트."""
+
+import queue
+
+import cloud_backends
+import wearable_controller as wc
+from log_metrics import metrics
+
+
+def collect(backend, path):
+    events = queue.Queue()
+    registration = backend.listen(path, events.put)
+    return events, registration
+
+
+def test_listen_starts_with_snapshot_then_put_and_patch_events(memory_backend):
+    memory_backend.set('devices/d1/control', {'global_mode': 'off'})
+    events, registration = collect(memory_backend, 'devices/d1/control')
+
+    first = events.get(timeout=2)
+    assert (first.event_type, first.path, first.data) == ('put', '/', {'global_mode': 'off'})
+
+    memory_backend.set('devices/d1/control/global_mode', 'cooling')
+    event = events.get(timeout=2)
+    assert (event.event_type, event.path, event.data) == ('put', '/global_mode', 'cooling')
+
+    memory_backend.update('devices/d1/control', {'groups/group_1/target_temp': 22, 'global_mode': 'heating'})
+    event = events.get(timeout=2)
+    assert (event.event_type, event.path) == ('patch', '/')
+    assert event.data == {'groups/group_1/target_temp': 22, 'global_mode': 'heating'}
+
+    registration.close()
+    memory_backend.set('devices/d1/control/global_mode', 'off')
+    assert events.empty()
+
+
+def test_write_above_listener_path_is_delivered_as_put(memory_backend):
+    events, registration = collect(memory_backend, 'devices/d1/control/groups')
+    assert events.get(timeout=2).data is None
+
+    memory_backend.update('/', {'devices/d1/control/groups/group_2/target_temp': 26, 'devices/d1/status/x': 1})
+    event = events.get(timeout=2)
+    assert (event.event_type, event.path, event.data) == ('put', '/group_2/target_temp', 26)
+    registration.close()
+
+
+def test_none_deletes_and_prunes_empty_parents(memory_backend):
+    memory_backend.update('/', {'a/b/c': 1, 'a/d': 2})
+    memory_backend.update('/', {'a/b/c': None})
+    assert memory_backend.get('a') == {'d': 2}
+    assert memory_backend.get('a', shallow=True) == {'d': 2}
+
+    memory_backend.set('a/d', None)
+    assert memory_backend.get('a') is None
+
+
+def test_etag_changes_only_when_value_changes(memory_backend):
+    memory_backend.set('devices/d1/presets', {'p1': {'name': 'x'}})
+    value, etag = memory_backend.get_with_etag('devices/d1/presets')
+    assert value == {'p1': {'name': 'x'}}
+    assert memory_backend.get_if_changed('devices/d1/presets', etag) == (False, None, etag)
+
+    memory_backend.set('devices/d1/presets/p1/name', 'y')
+    changed, value, new_etag = memory_backend.get_if_changed('devices/d1/presets', etag)
+    assert changed and value == {'p1': {'name': 'y'}} and new_etag != etag
+
+
+def test_tree_mirror_follows_listener_events(memory_backend):
+    memory_backend.set('devices/d1/control', {'global_mode': 'off'})
+    mirror = wc.TreeMirror()
+    events = queue.Queue()
+
+    def on_event(event):
+        mirror.apply_event(event.event_type, event.path, event.data)
+        events.put(event)
+
+    registration = memory_backend.listen('devices/d1/control', on_event)
+    memory_backend.update('devices/d1/control', {'global_mode': 'cooling', 'groups/group_1/target_temp': 22})
+    memory_backend.set('devices/d1/control/groups/group_2', {'target_temp': 27})
+    memory_backend.update('devices/d1', {'control/groups/group_1': None, 'status/current_temp': 25})
+    for _ in range(4):
+        events.get(timeout=2)
+    registration.close()
+
+    assert mirror.snapshot() == memory_backend.get('devices/d1/control')
+    assert mirror.snapshot() == {'global_mode': 'cooling', 'groups': {'group_2': {'target_temp': 27}}}
+
+
+def test_metered_backend_counts_update_paths(memory_backend):
+    backend = cloud_backends.MeteredBackend(memory_backend)
+    before = metrics.snapshot()['counters'].get('cloud.update_paths', 0)
+    backend.update('/', {'a/b': 1, 'a/c': 2})
+    assert backend.get('a') == {'b': 1, 'c': 2}
+    assert metrics.snapshot()['counters']['cloud.update_paths'] - before == 2
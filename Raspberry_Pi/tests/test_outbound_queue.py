@@ -0,0 +1,62 @@
+"""오프라인 쓰기 보관 큐(OutboundQueue) 테스트."""
+
+import pytest
+
+import storage
+
+
+def test_outbound_queue_merges_paths_and_drains_in_order(tmp_path, memory_backend):
+    outbox = storage.OutboundQueue(str(tmp_path / 'outbox.db'), batch_size=3)
+    outbox.put({'devices/d1/status/current_temp': 24.0, 'devices/d1/connection/status': 'offline'})
+    outbox.put({'devices/d1/status/current_temp': 25.5})
+    outbox.put({'devices/d1/logs/1': {'msg': 'a'}})
+    assert len(outbox) == 4
+
+    batches = []
+
+    def write(merged):
+        batches.append(merged)
+        memory_backend.update('/', merged)
+
+    assert outbox.drain(write) == 4
+    assert len(outbox) == 0
+    assert len(batches) == 2
+    assert batches[0] == {'devices/d1/status/current_temp': 25.5, 'devices/d1/connection/status': 'offline'}
+    assert memory_backend.get('devices/d1') == {'status': {'current_temp': 25.5},
+                                                'connection': {'status': 'offline'},
+                                                'logs': {'1': {'msg': 'a'}}}
+    outbox.close()
+
+
+def test_outbound_queue_keeps_batch_when_write_fails(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    outbox = storage.OutboundQueue(path)
+    outbox.put({'a/b': 1, 'a/c': [1, 2]})
+
+    def fail(merged):
+        raise ConnectionError('offline')
+
+    with pytest.raises(ConnectionError):
+        outbox.drain(fail)
+    assert len(outbox) == 2
+    outbox.close()
+
+    # 재시작 후에도 남아 있음
+    reopened = storage.OutboundQueue(path)
+    received = []
+    assert reopened.drain(received.append) == 2
+    assert received == [{'a/b': 1, 'a/c': [1, 2]}]
+    reopened.close()
+
+
+def test_outbound_queue_drops_oldest_when_over_cap(tmp_path):
+    outbox = storage.OutboundQueue(str(tmp_path / 'outbox.db'), max_bytes=32 * 1024)
+    for i in range(200):
+        outbox.put({f'devices/d1/logs/{i}': 'x' * 500})
+    assert 0 < len(outbox) < 200
+
+    received = {}
+    outbox.drain(received.update, max_batches=1000)
+    assert 'devices/d1/logs/199' in received  # 최신 항목은 남고
+    assert 'devices/d1/logs/0' not in received  # 오래된 항목부터 버림
+    outbox.close()
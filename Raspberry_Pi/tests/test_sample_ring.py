@@ -0,0 +1,57 @@
+"""워커 프로세스용 공유 메모리 링(SampleRing) 테스트."""
+
+import cloud_process
+
+
+def make_ring(slots=4, fields=3):
+    return cloud_process.SampleRing(bytearray(cloud_process.SampleRing.size(slots, fields)), slots=slots, fields=fields)
+
+
+def test_sample_ring_round_trip_and_ack():
+    ring = make_ring()
+    ring.write(0, {0: 24.5, 2: 26.0}, ts_ms=1000)
+    ring.write(1, {1: 23.0}, ts_ms=1001)
+
+    rows, pos, lost = ring.read(ring.acked())
+    assert rows == [(0, 1000, {0: 24.5, 2: 26.0}), (1, 1001, {1: 23.0})]
+    assert (pos, lost) == (2, 0)
+    assert ring.read(pos) == ([], 2, 0)
+
+    assert ring.acked() == 0
+    ring.ack(pos)
+    assert ring.acked() == 2 and ring.head() == 2
+
+
+def test_sample_ring_wraparound_counts_lost_slots():
+    ring = make_ring(slots=4)
+    for i in range(10):
+        ring.write(0, {0: float(i)}, ts_ms=i)
+
+    # 읽는 쪽이 2에 머물러 있는 동안 8개가 쓰였으므로 가장 오래된 4개는 덮어써짐
+    rows, pos, lost = ring.read(2)
+    assert [values[0] for _, _, values in rows] == [6.0, 7.0, 8.0, 9.0]
+    assert (pos, lost) == (10, 4)
+
+
+def test_sample_ring_skips_torn_slot():
+    ring = make_ring(slots=4)
+    for i in range(3):
+        ring.write(0, {0: float(i)}, ts_ms=i)
+    # 두 번째 슬롯을 쓰는 도중인 것처럼 꼬리 순번을 어긋나게 함
+    offset = ring._offset(2)
+    ring.TAIL.pack_into(ring.buf, offset + ring.slot.size, 99)
+
+    rows, pos, lost = ring.read(0)
+    assert [values[0] for _, _, values in rows] == [0.0, 2.0]
+    assert (pos, lost) == (3, 1)
+
+
+def test_ring_updates_maps_fields_to_status_paths():
+    layouts = [['d1/status/current_temp', 'd1/status/sensors/s1/temp'], ['d2/status/current_temp']]
+    rows = [(0, 1, {0: 24.0, 1: 23.5}), (1, 2, {0: 25.25, 1: 99.0}), (0, 3, {0: 24.5}), (5, 4, {0: 1.0})]
+    assert cloud_process.ring_updates(rows, layouts) == {
+        'd1/status/current_temp': 24.5,
+        'd1/status/sensors/s1/temp': 23.5,
+        'd2/status/current_temp': 25.25,
+    }
+    assert cloud_process.ring_updates([(0, 1, {0: 24.0})], layouts) == {'d1/status/current_temp': 24}
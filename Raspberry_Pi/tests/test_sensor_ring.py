@@ -0,0 +1,60 @@
+"""센서별 링 버퍼(SensorRing: 스파이크 필터, EMA, 창 통계) 테스트."""
+
+import pytest
+
+import wearable_controller as wc
+
+
+def test_sensor_ring_replaces_spike_with_median():
+    ring = wc.SensorRing(capacity=8, median_window=5, spike_threshold=5.0)
+    for value in (20.0, 21.0, 20.5):
+        assert ring.add(value) == value
+
+    assert ring.add(40.0) == 20.5  # 중앙값(20.5)과 5°C 넘게 차이 -> 중앙값으로 대체
+    assert ring.spikes == 1
+    assert ring.max() == 21.0
+
+    # 실제 변화가 이어지면 원시 값 창의 중앙값이 따라와 더 이상 스파이크로 보지 않는다
+    assert ring.add(40.0) == 20.75  # 창 [20, 21, 20.5, 40]
+    assert ring.add(40.0) == 21.0   # 창 [20, 21, 20.5, 40, 40]
+    assert ring.add(40.0) == 40.0   # 창 [40, 21, 20.5, 40, 40]
+    assert ring.spikes == 3
+
+
+def test_sensor_ring_rejects_out_of_range_values():
+    ring = wc.SensorRing(valid_range=(-20.0, 80.0))
+    assert ring.add(-40.0) is None
+    assert ring.add(85.0) is None
+    assert ring.rejected == 2
+    assert ring.count == 0 and ring.summary() == {'count': 0}
+
+
+def test_sensor_ring_ema_and_window_statistics():
+    ring = wc.SensorRing(capacity=3, alpha=0.5, spike_threshold=100)
+    for value in (10.0, 12.0, 14.0, 16.0):
+        ring.add(value)
+
+    assert ring.ema == pytest.approx(14.25)  # 10 -> 11 -> 12.5 -> 14.25
+    assert ring.mean() == pytest.approx(14.0)  # 창(3개): 12, 14, 16
+    assert (ring.min(), ring.max()) == (12.0, 16.0)
+    assert ring.last == 16.0
+
+
+def test_sensor_ring_min_max_slide_out_of_window():
+    ring = wc.SensorRing(capacity=4, spike_threshold=100)
+    values = [5.0, 1.0, 9.0, 3.0, 4.0, 6.0, 2.0, 8.0, 7.0]
+    for i, value in enumerate(values):
+        ring.add(value)
+        window = values[max(0, i - 3):i + 1]
+        assert (ring.min(), ring.max()) == (min(window), max(window))
+        assert ring.mean() == pytest.approx(sum(window) / len(window))
+
+
+def test_sensor_store_frames_and_average():
+    store = wc.SensorStore(['sensor_01', 'sensor_02'])
+    assert store.current_average() is None
+    assert store.add_frame([24.0, 26.0])
+    assert not store.add_frame([24.0])  # 센서 수가 다른 프레임은 버림
+    assert store.frames == 1
+    assert store.current_average() == 25.0
+    assert store.status_paths == ['sensors/sensor_01/temp', 'sensors/sensor_02/temp']
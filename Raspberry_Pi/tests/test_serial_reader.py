@@ -0,0 +1,54 @@
+"""텍스트 모드 시리얼 프레임 리더(SerialFrameReader) 테스트."""
+
+import serial_protocol
+
+
+def test_text_latest_frame_and_acks(memory_port):
+    reader = serial_protocol.SerialFrameReader(memory_port(b'SENSORS:1,2\nACK:A:3\nSENSORS:3.5,4\nSENS'))
+    reader.fill()
+
+    assert reader.latest_sensor_frame() == [3.5, 4.0]
+    assert reader.pop_acks() == [('A', 3)]
+    assert reader.frames_discarded == 1
+    assert reader.latest_sensor_frame() is None  # 끝나지 않은 줄은 남겨 둠
+
+
+def test_text_falls_back_to_newest_valid_line(memory_port):
+    data = b'SENSORS:20,21,22\nSENSORS:23,24,25\nSENSORS:26,2x,28\nSENSORS:29,30\n'
+    reader = serial_protocol.SerialFrameReader(memory_port(data), sensor_count=3)
+    reader.fill()
+
+    # 깨진 줄(2x)과 잘린 줄(센서 수 불일치)은 건너뛰고 같은 읽기의 이전 줄을 사용
+    assert reader.latest_sensor_frame() == [23.0, 24.0, 25.0]
+    assert reader.frames_invalid == 2
+    assert reader.frames_discarded == 3
+
+
+def test_text_all_lines_invalid_returns_none(memory_port):
+    reader = serial_protocol.SerialFrameReader(memory_port(b'SENSORS:a,b\nSENSORS:\n'))
+    reader.fill()
+    assert reader.latest_sensor_frame() is None
+    assert reader.frames_invalid == 2
+
+
+def test_text_line_split_across_reads(memory_port):
+    port = memory_port(b'SENSORS:24.5,2')
+    reader = serial_protocol.SerialFrameReader(port)
+    reader.fill()
+    assert reader.latest_sensor_frame() is None
+
+    port.rx += b'5\r\n'
+    reader.fill()
+    assert reader.latest_sensor_frame() == [24.5, 25.0]
+    assert reader.bytes_received == 17
+
+
+def test_text_garbage_without_newline_is_dropped(memory_port):
+    port = memory_port(b'\xff' * 64)
+    reader = serial_protocol.SerialFrameReader(port, max_pending=32)
+    reader.fill()
+    assert reader.latest_sensor_frame() is None
+
+    port.rx += b'SENSORS:1\n'
+    reader.fill()
+    assert reader.latest_sensor_frame() == [1.0]
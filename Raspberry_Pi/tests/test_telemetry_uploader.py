@@ -0,0 +1,34 @@
+"""status 업로드 델타/데드밴드 필터(TelemetryUploader) 테스트."""
+
+import wearable_controller as wc
+
+
+def test_telemetry_uploader_deadband_interval_and_staleness():
+    uploader = wc.TelemetryUploader(deadband=0.5, min_interval=1.0, max_staleness=30)
+    values = {'s1': 24.0, 's2': 25.0, 'mode': 'cooling'}
+
+    first = uploader.build_update(values, now=0)
+    assert first == values  # 처음에는 전체 값
+    uploader.mark_published(first, now=0)
+
+    assert uploader.build_update({'s1': 30.0, 's2': 25.0, 'mode': 'cooling'}, now=0.5) is None  # 최소 간격 전
+    assert uploader.build_update({'s1': 24.4, 's2': 25.0, 'mode': 'cooling'}, now=2) is None  # 데드밴드 안
+    update = uploader.build_update({'s1': 24.6, 's2': 25.0, 'mode': 'heating'}, now=2)
+    assert update == {'s1': 24.6, 'mode': 'heating'}
+    uploader.mark_published(update, now=2)
+
+    assert uploader.build_update({'s1': 24.6, 's2': 25.0, 'mode': 'heating'}, now=10) is None
+    assert uploader.build_update({'s1': 24.6, 's2': 25.0, 'mode': 'heating'}, now=31) == \
+        {'s1': 24.6, 's2': 25.0, 'mode': 'heating'}  # max_staleness가 지나면 전체 값
+
+
+def test_telemetry_uploader_failed_write_is_retried_and_invalidate_forces_full():
+    uploader = wc.TelemetryUploader(deadband=0.5, min_interval=0, max_staleness=30)
+    uploader.mark_published(uploader.build_update({'s1': 24.0, 's2': 25.0}, now=0), now=0)
+
+    # mark_published를 부르지 않으면 (제출하지 않은 업로드) 다음에도 같은 변경이 나온다
+    assert uploader.build_update({'s1': 26.0, 's2': 25.0}, now=1) == {'s1': 26.0}
+    assert uploader.build_update({'s1': 26.0, 's2': 25.0}, now=2) == {'s1': 26.0}
+
+    uploader.invalidate()
+    assert uploader.build_update({'s1': 24.0, 's2': 25.0}, now=3) == {'s1': 24.0, 's2': 25.0}
@@ -0,0 +1,23 @@
+"""리스너 이벤트(put/patch)로 갱신되는 control 미러(TreeMirror) 테스트."""
+
+import wearable_controller as wc
+
+
+def test_tree_mirror_put_patch_and_delete():
+    mirror = wc.TreeMirror()
+    assert not mirror.ready and mirror.snapshot() is None
+
+    mirror.apply_event('put', '/', {'global_mode': 'off', 'groups': {'group_1': {'target_temp': 24}}})
+    mirror.apply_event('patch', '/', {'global_mode': 'cooling', 'groups/group_2/target_temp': 26})
+    mirror.apply_event('put', '/groups/group_1/target_temp', 20)
+    assert mirror.snapshot() == {'global_mode': 'cooling',
+                                 'groups': {'group_1': {'target_temp': 20}, 'group_2': {'target_temp': 26}}}
+
+    # 삭제하면 비어버린 상위 노드도 제거
+    mirror.apply_event('put', '/groups/group_2/target_temp', None)
+    assert 'group_2' not in mirror.snapshot()['groups']
+
+    snapshot = mirror.snapshot()
+    snapshot['global_mode'] = 'heating'  # 사본이므로 미러는 그대로
+    assert mirror.snapshot()['global_mode'] == 'cooling'
+    assert mirror.ready and mirror.version == 4
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""현장 문제 재현용 트레이스 기록 (--record-trace)과 읽기 (replay.py).
+
+시리얼 송수신 바이트, 세션별 협상 프로토콜, Firebase 리스너 이벤트를 기기별 레코드로 남긴다.
+"""
+
+import gzip
+import json
+import struct
+import threading
+import time
+
+TRACE_FLUSH_INTERVAL = 5.0  # 트레이스 파일을 디스크로 내보내는 주기 (초, 비정상 종료 시 잃는 구간)
+
+TRACE_MAGIC = b'WCTRACE1'
+TRACE_HEADER = struct.Struct('<BBdI')  # 종류, 기기 번호, 기록 시작 후 경과 시간(초, monotonic), 본문 길이
+TRACE_DEVICE = 0   # 본문: {'device_id', 'config'} JSON (기기 번호는 등록 순서)
+TRACE_RX = 1       # 본문: 시리얼에서 읽은 바이트 그대로
+TRACE_TX = 2       # 본문: 시리얼로 쓴 바이트 그대로
+TRACE_SESSION = 3  # 본문: 새 시리얼 세션에서 협상된 프로토콜 ('text' | 'binary')
+TRACE_EVENT = 4    # 본문: {'listener', 'type', 'path', 'data'} JSON (Firebase 리스너 이벤트)
+
+class TraceRecorder:
+    """시리얼 송수신 바이트와 리스너 이벤트를 gzip 압축 바이너리 레코드로 기록 (replay.py로 재생).
+
+    여러 스레드(시리얼, Firebase SDK)에서 호출되므로 잠금으로 순서를 지키며, 비정상 종료에 대비해
+    TRACE_FLUSH_INTERVAL마다 압축 스트림을 디스크로 내보낸다.
+    """
+
+    def __init__(self, path, flush_interval=TRACE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = gzip.open(path, 'wb', compresslevel=6)
+        self._file.write(TRACE_MAGIC)
+        self._lock = threading.Lock()
+        self._devices = {}  # device_id -> 기기 번호
+        self.t0 = time.monotonic()
+        self._next_flush = self.t0 + flush_interval
+        self.records = 0
+
+    def add_device(self, dev):
+        """기기 설정을 기록 (재생할 때 같은 설정으로 컨트롤러를 구성)."""
+        # 시리얼 세션 전에 보내는 명령도 기록되도록
+        dev.command_channel.tracer = self
+        dev.command_channel.trace_id = dev.device_id
+        with self._lock:
+            self._register(dev.device_id, dev.config_data)
+
+    def _register(self, device_id, config_data=None):
+        index = self._devices.get(device_id)
+        if index is None:
+            index = self._devices[device_id] = len(self._devices)
+            body = json.dumps({'device_id': device_id, 'config': config_data}, ensure_ascii=False).encode()
+            self._write(TRACE_DEVICE, index, body)
+        return index
+
+    def _write(self, kind, index, body):
+        now = time.monotonic()
+        self._file.write(TRACE_HEADER.pack(kind, index, now - self.t0, len(body)))
+        self._file.write(body)
+        self.records += 1
+        if now >= self._next_flush:
+            self._next_flush = now + self.flush_interval
+            self._file.flush()
+
+    def record(self, kind, device_id, body):
+        with self._lock:
+            if self._file is None or device_id is None:
+                return
+            self._write(kind, self._register(device_id), bytes(body))
+
+    def record_event(self, listener, dev, event):
+        body = json.dumps({'listener': listener, 'type': event.event_type, 'path': event.path,
+                           'data': event.data}, ensure_ascii=False).encode()
+        self.record(TRACE_EVENT, dev.device_id, body)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def read_trace(path):
+    """트레이스 파일의 레코드를 (종류, 기기 번호, 경과 시간, 본문) 순서대로 반환하는 제너레이터."""
+    with gzip.open(path, 'rb') as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"트레이스 파일이 아닙니다: {path}")
+        while True:
+            header = f.read(TRACE_HEADER.size)
+            if len(header) < TRACE_HEADER.size:
+                return  # 기록 중 종료되어 잘린 마지막 레코드는 무시
+            kind, index, t, length = TRACE_HEADER.unpack(header)
+            body = f.read(length)
+            if len(body) < length:
+                return
+            yield kind, index, t, body
@@ -1,38 +1,214 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import firebase_admin
-from firebase_admin import credentials, db
-import serial
 import time
+STARTUP_T0 = time.perf_counter()  # 콜드 스타트 시간 측정 기준 (가능한 한 먼저 기록)
+import serial
 import json
+import logging
 import os
 import atexit
 import threading
-import socket
 import datetime
+import copy
+import itertools
+import hashlib
+import glob
+import argparse
+import asyncio
+import http.server
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+
+from cloud_backends import FirebaseBackend, InMemoryBackend, MeteredBackend
+from cloud_process import ProcessBackend
+from link_health import LinkHealth
+from local_api import LOCAL_API_HOST, LOCAL_API_PORT, SensorFeed, local_api_host, start_local_api
+from log_metrics import (LOGGING_LEVEL, LOGGING_SAMPLE_LIMITS, StartupTimer, cloud_log, control_log,
+                         dump_log_ring, flush_logs, heartbeat_log, log, log_ring, metrics, rx_log,
+                         serial_log, setup_logging)
+from serial_protocol import (BAUD_RATE, GROUP_CHANNELS, SERIAL_READ_TIMEOUT, CommandChannel,
+                             SerialFrameReader, command_payload, compile_control)
+from storage import ConfigStore, OutboundQueue, SampleStore
+from tracing import TRACE_SESSION, TraceRecorder
+
+startup = StartupTimer(STARTUP_T0)
 
 # --- 설정 (Constants) ---
 CONFIG_FILE = 'config.json'
 FIREBASE_KEY_FILE = 'firebase-key.json'
 ARDUINO_PORT = '/dev/ttyACM0'  # 환경에 따라 /dev/ttyUSB0 등으로 변경
-BAUD_RATE = 9600
+
+SERIAL_SETTLE_TIME = 2     # 포트를 연 뒤 아두이노 리셋을 기다리는 최대 시간 (첫 데이터가 오면 바로 진행, 초)
+SERIAL_BACKOFF_BASE = 1    # 시리얼 재연결 백오프 시작 간격 (초, 실패할 때마다 2배)
+SERIAL_BACKOFF_MAX = 30    # 시리얼 재연결 백오프 최대 간격 (초)
+SERIAL_DEGRADED_TIMEOUT = 5  # 이 시간 동안 수신이 없으면 degraded로 보고 명령을 다시 보내 확인 (초)
+DATA_TIMEOUT = 15          # 이 시간 동안 수신이 없으면 연결 재설정 (초)
+
 HEARTBEAT_INTERVAL = 5  # 하트비트 전송 간격 (초)
 LOG_INTERVAL = 60 # 로그 저장 간격 (초)
+LOG_RAW_RETENTION_DAYS = 7      # 분 단위 원본 로그(logs/) 보관 기간, config.json 'log_retention'으로 변경 가능
+LOG_HOURLY_RETENTION_DAYS = 90  # 시간 요약(logs_hourly/) 보관 기간, 일 요약(logs_daily/)은 계속 보관
+LOG_COMPACTION_INTERVAL = 3600  # 로그 요약/정리 작업 간격 (초)
+LOG_BACKFILL_DAYS_PER_RUN = 2   # 한 번의 정리 작업에서 원본을 내려받아 요약할 최대 일수
+DEFAULT_SENSOR_COUNT = 5        # sensors_config가 비어 있을 때의 센서 수
+SENSOR_HISTORY_SIZE = 64        # 센서별 링 버퍼 크기 (이동 평균/최소/최대 창, 표본 수)
+SENSOR_MEDIAN_WINDOW = 5        # 스파이크 판정용 중앙값 창 (표본 수)
+SENSOR_SPIKE_THRESHOLD = 5.0    # 중앙값과 이만큼 이상 차이 나면 스파이크로 보고 중앙값으로 대체 (°C)
+SENSOR_EMA_ALPHA = 0.3          # 지수 이동 평균 계수
+SENSOR_VALID_RANGE = (-20.0, 80.0)  # 이 범위를 벗어난 값은 센서 오류로 보고 버림 (°C)
+EDGE_CONTROL_ENABLED = False    # 측정 온도로 설정값을 보정하는 로컬 제어 루프 (목표 온도를 바꾸므로 기본은 꺼짐, config 'edge_control': {'enabled': true}로 켬)
+EDGE_CONTROL_INTERVAL = 2.0     # 로컬 제어 주기 (초)
+EDGE_KP = 0.5                   # 보정 비례 이득 (°C/°C)
+EDGE_KI = 0.02                  # 보정 적분 이득 (1/s)
+EDGE_TRIM_LIMIT = 3.0           # 설정값 보정 한계 (±°C)
+EDGE_DEADBAND = 0.3             # 이 오차 이내면 보정값 유지 (°C)
+
+EDGE_GROUP_SENSORS = {'group_1': ['sensor_01', 'sensor_02'],
+                      'group_2': ['sensor_03', 'sensor_04', 'sensor_05']}
+PRESET_SCHEDULE_INTERVAL = 20   # config 'preset_schedule'의 예약 시각을 확인하는 주기 (초)
+TELEMETRY_DEADBAND = 0.5        # 이 값 이상 변한 센서만 status에 업로드 (°C)
+TELEMETRY_MIN_INTERVAL = 1.0    # status 업로드 최소 간격 (초)
+TELEMETRY_MAX_STALENESS = 30    # 변화가 없어도 전체 값을 다시 쓰는 주기 (초)
+OUTBOX_FILE = 'outbox.db'       # 오프라인 동안의 쓰기를 보관하는 로컬 큐
+FIREBASE_BACKOFF_BASE = 2       # Firebase 재연결 백오프 시작 간격 (초, 실패할 때마다 2배)
+FIREBASE_BACKOFF_MAX = 300      # Firebase 재연결 백오프 최대 간격 (초)
+FIREBASE_FAILURE_THRESHOLD = 3  # 연속으로 이만큼 쓰기가 실패하면 연결이 끊긴 것으로 보고 백오프
+WRITE_TICK_INTERVAL = 0.25      # 쓰기 스케줄러가 모은 쓰기를 한 번의 update()로 보내는 주기 (초)
+WRITE_MAX_INTERVAL = 5.0        # 링크가 느릴 때 늘어나는 최대 주기 (초)
+WRITE_SLOW_THRESHOLD = 1.0      # update() 한 번이 이보다 오래 걸리면 느린 링크로 보고 주기를 늘림 (초)
+WRITE_MAX_PATHS = 500           # 한 번의 update()에 담을 최대 경로 수
+WRITE_MAX_PENDING = 5000        # 메모리에 모아 둘 최대 경로 수 (넘으면 낮은 우선순위부터 outbox로)
+PRIORITY_CONTROL = 0            # 쓰기 우선순위: 제어 ACK, 연결 상태 (틱을 기다리지 않고 전송)
+PRIORITY_TELEMETRY = 1          # status, 하트비트
+PRIORITY_LOG = 2                # 로그, 시간/일 요약, 로그 정리
+RUNTIME = 'threads'             # 기본 런타임 ('threads' | 'asyncio'), --runtime 으로 변경 가능
+ASYNC_EXECUTOR_WORKERS = 4      # asyncio 런타임에서 블로킹 SDK 호출을 처리할 스레드 수
+SERIAL_PORT_PATTERNS = ['/dev/ttyACM*', '/dev/ttyUSB*']  # 게이트웨이 모드 포트 자동 탐색 대상
+GATEWAY_STATS_INTERVAL = 60     # 게이트웨이 모드에서 기기별 지표를 출력하는 간격 (초)
+BACKEND = 'firebase'            # 클라우드 백엔드 ('firebase' | 'memory'), --backend 로 변경 가능
+CLOUD_PROCESS = False           # 클라우드 SDK 호출을 별도 워커 프로세스에서 실행 (--cloud-process)
+METRICS_HOST = '127.0.0.1'      # 지표 HTTP 엔드포인트 주소 (로컬 전용)
+METRICS_PORT = 9108             # GET /metrics, 0이면 비활성화 (--metrics-port)
+METRICS_FILE = 'metrics.jsonl'  # 주기적으로 지표 스냅샷을 한 줄씩 추가하는 파일
+METRICS_FILE_INTERVAL = 60      # 지표 파일 기록 간격 (초)
+METRICS_FILE_MAX_BYTES = 1024 * 1024  # 이 크기를 넘으면 metrics.jsonl.1, .2 ... 로 회전
+METRICS_FILE_BACKUPS = 3
+
+LOCAL_CONTROL_HOLD = 30.0       # 로컬 변경의 에코를 기다리는 최대 시간 (초, 쓰기가 유실됐을 때 클라우드 값으로 돌아가는 안전장치)
+
+LOGGING_DUMP_FILE = 'log_dump.jsonl'  # SIGUSR1을 받으면 최근 로그를 기록하는 파일
 
 # --- 전역 변수 ---
-device_id = None
-config_data = {}
-firebase_app = None
-arduino = None
-listener = None
-firebase_is_connected = False
+cloud = None              # 클라우드 DB 백엔드 (FirebaseBackend 또는 InMemoryBackend)
+firebase_is_connected = False  # cloud_health가 connected/degraded인지 (record_cloud_result가 갱신)
+cloud_health = LinkHealth('cloud', FIREBASE_BACKOFF_BASE, FIREBASE_BACKOFF_MAX, FIREBASE_FAILURE_THRESHOLD)
 main_loop_running = True  # 스레드 종료를 위한 플래그
+outbox = None             # 오프라인 쓰기 보관용 OutboundQueue (모든 기기가 공유)
+devices = []              # 이 프로세스가 담당하는 기기 목록 (게이트웨이 모드에서는 여러 개)
+tracer = None             # --record-trace로 켜는 TraceRecorder (꺼져 있으면 None)
+cloud_worker = None       # --cloud-process일 때 cloud가 감싸는 ProcessBackend (아니면 None)
+
+class Device:
+    """웨어러블 한 대(config 파일 + 시리얼 포트 + 기기 ID)의 상태.
+
+    기기별로 독립된 미러/명령 채널/집계기를 가지며, Firebase 앱과 오프라인 큐는 공유한다.
+    """
+
+    def __init__(self, config_path, port=ARDUINO_PORT):
+        self.config_path = config_path
+        self.port_name = port
+        self.device_id = None
+        self.config_data = {}
+        self.config_store = ConfigStore(config_path)
+        self.sensors_verified = False  # 이번 실행에서 status/sensors 메타데이터를 전체 확인했는지
+        self.arduino = None
+        self.listener = None
+        self.reader = None
+        self.tag = ''  # 출력 앞에 붙는 기기 표시 (게이트웨이 모드에서만 사용)
+        self.control_mirror = TreeMirror()   # devices/{id}/control 로컬 미러
+        self.telemetry = TelemetryUploader()
+        self.log_aggregator = LogAggregator()
+        self.log_rollup = LogRollup(os.path.splitext(config_path)[0] + '_rollup.json')
+        self.command_channel = CommandChannel()
+        self.serial_health = LinkHealth('serial', SERIAL_BACKOFF_BASE, SERIAL_BACKOFF_MAX)
+        self._edge = False  # 설정을 읽은 뒤 처음 사용할 때 생성 (꺼져 있으면 None)
+        self._presets = None
+        self._schedule = False
+        self.preset_listener = None
+        self.active_preset = None
+        self.counters = {'frames_processed': 0, 'frames_mismatched': 0, 'status_writes': 0,
+                         'serial_reconnects': 0, 'control_events': 0}
+        self._sensors = None
+        self._history = False
+        self.local_overrides = LocalOverrides()
+        self.feed = SensorFeed()
+
+    @property
+    def path(self):
+        return f'devices/{self.device_id}'
+
+    @property
+    def edge(self):
+        """로컬 설정값 보정 제어기. config에서 꺼져 있으면 None."""
+        if self._edge is False:
+            self._edge = EdgeController.from_config(self.config_data)
+        return self._edge
+
+    @property
+    def presets(self):
+        """미리 변환된 프리셋 명령 상태 (PresetBook). 설정을 읽은 뒤 처음 사용할 때 생성."""
+        if self._presets is None:
+            self._presets = PresetBook(self.config_data.get('presets'))
+        return self._presets
+
+    @property
+    def preset_schedule(self):
+        """config 'preset_schedule'의 시각별 프리셋 전환. 없으면 None."""
+        if self._schedule is False:
+            self._schedule = PresetSchedule.from_config(self.config_data)
+        return self._schedule
+
+    @property
+    def history(self):
+        """로컬 시계열 저장소 (SampleStore). 설정을 읽은 뒤 처음 사용할 때 생성, 꺼져 있으면 None."""
+        if self._history is False:
+            self._history = SampleStore.from_config(self.config_path, self.config_data, self.sensors.ids)
+        return self._history
+
+    @property
+    def sensors(self):
+        """sensors_config 기준 센서 링 버퍼 (처음 사용할 때 생성)."""
+        if self._sensors is None:
+            self._sensors = SensorStore.from_config(self.config_data)
+        return self._sensors
+
+    def metrics(self):
+        """기기별 지표 스냅샷."""
+        result = dict(self.counters)
+        reader = self.reader
+        if reader is not None:
+            result.update(bytes_received=reader.bytes_received, frames_received=reader.frames_received,
+                          frames_discarded=reader.frames_discarded, frames_invalid=reader.frames_invalid,
+                          frames_lost=reader.frames_lost)
+        channel = self.command_channel
+        result.update(commands_sent=channel.sent_count, command_retries=channel.retry_count,
+                      commands_pending=channel.pending())
+        if channel.ack_latencies:
+            result['ack_latency_ms'] = round(1000 * sum(channel.ack_latencies) / len(channel.ack_latencies), 1)
+        if self._sensors is not None:
+            result['sensors'] = self._sensors.summary()
+        if self._edge:
+            result['edge'] = dict(self._edge.state)
+        result['serial_link'] = self.serial_health.summary()
+        return result
 
 # --- 1. 최초 실행 시 설정 및 config.json 생성 ---
-def validate_and_load_config(config_path):
-    global config_data, device_id
-    print("설정 파일을 검증하고 로드합니다...")
+
+def validate_and_load_config(dev):
+    config_path = dev.config_path
+    log.info("설정 파일을 검증하고 로드합니다...")
     try:
         with open(config_path, 'r', encoding = 'utf-8') as f:
             config_data = json.load(f)
@@ -50,36 +226,34 @@ def validate_and_load_config(config_path):
         if not device_id:
             raise ValueError("'device_id'가 비어있습니다.")
             
-        print("✅ 설정 파일 검증 완료.")
+        dev.config_data = config_data
+        dev.device_id = device_id
+        dev.config_store.mark_clean(config_data)
+        log.info("✅ 설정 파일 검증 완료.")
         return True
     except (json.JSONDecodeError, ValueError, KeyError) as e:
-        print(f"⚠️ 설정 파일이 손상되었거나 유효하지 않습니다: {e}")
+        log.error("⚠️ 설정 파일이 손상되었거나 유효하지 않습니다: %s", e)
         # 손상된 파일 백업
         corrupted_path = config_path + ".corrupted"
         if os.path.exists(config_path):
             os.rename(config_path, corrupted_path)
-            print(f"손상된 설정 파일을 '{corrupted_path}'로 백업했습니다.")
+            log.info("손상된 설정 파일을 '%s'로 백업했습니다.", corrupted_path)
         return False
     
-def save_config_to_file():
-    global config_data
-    try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(script_dir, CONFIG_FILE)
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, indent=4, ensure_ascii=False)
-        # print("💾 설정 파일 저장됨") 
-    except Exception as e:
-        print(f"❌ 설정 저장 실패: {e}")
+def save_config_to_file(dev, immediate=False):
+    """설정 저장을 예약 (내용이 같으면 생략). immediate=True면 바로 기록한다."""
+    dev.config_store.save(dev.config_data)
+    if immediate:
+        dev.config_store.flush()
 
-def setup_device_and_config():
-    global device_id, config_data
-    print("--- 최초 설정 모드 ---")
+def setup_device_and_config(dev):
+    log.info("--- 최초 설정 모드 ---")
+    flush_logs()  # 앞선 로그가 입력 프롬프트 뒤에 섞여 나오지 않도록
     device_id = input("기기 고유번호를 입력하세요 (예: 123): ").strip()
     device_password = input("'{device_id}' 기기의 비밀번호를 입력하세요 (예: 0000): ").strip()
 
     if not device_id or not device_password:
-        print("오류: 기기 고유번호와 비밀번호는 반드시 입력해야 합니다.")
+        log.error("오류: 기기 고유번호와 비밀번호는 반드시 입력해야 합니다.")
         exit()
 
     # 기본 센서 설정 데이터 (물리적 정보)
@@ -111,25 +285,24 @@ def setup_device_and_config():
         'presets': default_presets,
     }
 
+    dev.device_id = device_id
+    dev.config_data = config_data
+
     # 설정 파일 저장
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, CONFIG_FILE)
-    with open(config_path, 'w', encoding = 'utf-8') as f:
-        json.dump(config_data, f, indent=4)
-    print(f"✅ 설정 파일 '{config_path}' 생성 완료.")
+    save_config_to_file(dev, immediate=True)
+    log.info("✅ 설정 파일 '%s' 생성 완료.", dev.config_path)
     
     # Firebase에 초기 데이터 업로드
-    upload_initial_config_to_firebase()
+    upload_initial_config_to_firebase(dev)
 
-def upload_initial_config_to_firebase():
-    print("Firebase에 완전한 초기 데이터 구조를 생성합니다...")
-    if not device_id or not config_data:
-        print("오류: 기기 ID 또는 설정 데이터가 없습니다.")
+def upload_initial_config_to_firebase(dev):
+    cloud_log.info("%sFirebase에 완전한 초기 데이터 구조를 생성합니다...", dev.tag)
+    config_data = dev.config_data
+    if not dev.device_id or not config_data:
+        cloud_log.error("%s오류: 기기 ID 또는 설정 데이터가 없습니다.", dev.tag)
         return
 
     try:
-        ref = db.reference(f'devices/{device_id}', app=firebase_app)
-        
         sensors_config = config_data.get('sensors_config', {})
         
         # 센서 config에서 temp 필드 추가 후 status 데이터 생성
@@ -138,7 +311,7 @@ def upload_initial_config_to_firebase():
         }
         
         # config_data를 기반으로 Firebase 데이터 구조 생성
-        ref.set({
+        cloud.set(dev.path, {
             'password': config_data['device_password'],
             'default_preset': config_data['default_preset'],
             'connection': {
@@ -159,468 +332,2048 @@ def upload_initial_config_to_firebase():
             },
             'presets': config_data['presets']
         })
-        print("✅ Firebase 데이터 셋업 완료.")
+        cloud_log.info("%s✅ Firebase 데이터 셋업 완료.", dev.tag)
     except Exception as e:
-        print(f"❌ Firebase 셋업 실패: {e}")
+        cloud_log.error("%s❌ Firebase 셋업 실패: %s", dev.tag, e)
 
 # --- 2. Firebase와 config.json 동기화 ---
-def sync_config_with_firebase():
-    global config_data
+# 기기 루트 전체를 get()하면 계속 늘어나는 logs 이력까지 내려받으므로, 필요한 하위 경로만 조회한다.
+# 섹션별로 마지막 동기화 시점의 원격 ETag와 로컬 내용 해시를 config.json의 'sync_state'에
+# 보관해, 양쪽 모두 바뀌지 않은 섹션은 본문을 내려받지 않고 건너뛴다.
+def content_hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def fetch_if_changed(path, entry):
+    """entry에 저장된 ETag로 조건부 조회. (원격 변경 여부, 값, 새 ETag)를 반환."""
+    if entry.get('etag'):
+        return cloud.get_if_changed(path, entry['etag'])
+    value, etag = cloud.get_with_etag(path)
+    return True, value, etag
+
+def sync_sensor_metadata(dev, state):
+    """status/sensors의 이름/위치 정보를 로컬 sensors_config 기준으로 복구."""
+    local_sensors_config = dev.config_data.get('sensors_config', {})
+    local_hash = content_hash(local_sensors_config)
+    sensors_path = f"{dev.path}/status/sensors"
+
+    # temp가 계속 바뀌므로 ETag 대신 shallow 조회로 센서 키만 확인 (전체 확인은 실행당 한 번)
+    if dev.sensors_verified and state.get('sensors') == local_hash:
+        remote_ids = cloud.get(sensors_path, shallow=True) or {}
+        if all(sensor_id in remote_ids for sensor_id in local_sensors_config):
+            return False
+
+    firebase_status_sensors = cloud.get(sensors_path) or {}
+    # 로컬 config.json 기준으로 Firebase의 센서 정보 확인 및 복구
+    for sensor_id, local_info in local_sensors_config.items():
+        firebase_sensor = firebase_status_sensors.get(sensor_id)
+        
+        # Firebase에 센서 자체가 없거나, 필수 정보(name, posX, posY)가 누락된 경우
+        if (firebase_sensor is None or 
+                'name' not in firebase_sensor or 
+                'posX' not in firebase_sensor or 
+                'posY' not in firebase_sensor):
+            
+            cloud_log.warning("Firebase에서 '%s'의 정보가 누락/손상되어 복구합니다.", sensor_id)
+            # temp 값은 유지하기 위해 기존 값을 읽어오거나 0으로 설정
+            existing_temp = firebase_sensor.get('temp', 0) if firebase_sensor else 0
+            cloud.set(f"{sensors_path}/{sensor_id}", {
+                'name': local_info['name'],
+                'posX': local_info['posX'],
+                'posY': local_info['posY'],
+                'temp': existing_temp
+            })
+    state['sensors'] = local_hash
+    dev.sensors_verified = True
+    return True
+
+def sync_presets(dev, state, remote_exists):
+    """presets 양방향 병합 (Firebase 우선, 로컬에만 있는 프리셋은 업로드). 로컬이 바뀌었으면 True."""
+    config_data = dev.config_data
+    local_presets = config_data.setdefault('presets', {})
+    presets_path = f"{dev.path}/presets"
+    entry = state.get('presets', {})
+
+    if remote_exists:
+        changed, firebase_presets, etag = fetch_if_changed(presets_path, entry)
+        if not changed:
+            if entry.get('hash') == content_hash(local_presets):
+                return False
+            # 로컬만 바뀜: 비교를 위해 원격 본문을 받음
+            firebase_presets, etag = cloud.get_with_etag(presets_path)
+    else:
+        firebase_presets, etag = None, None
+    firebase_presets = firebase_presets or {}
+
+    config_updated = False
+    # Firebase -> 로컬 동기화
+    for preset_id, info in firebase_presets.items():
+        if preset_id not in local_presets or local_presets[preset_id] != info:
+            local_presets[preset_id] = info
+            config_updated = True
+
+    # 로컬 -> Firebase 동기화 (한 번의 다중 경로 쓰기)
+    uploads = {preset_id: info for preset_id, info in local_presets.items() if preset_id not in firebase_presets}
+    if uploads:
+        cloud.update(presets_path, uploads)
+        etag = None  # 원격이 바뀌었으므로 다음 동기화에서 새 ETag를 받음
+
+    state['presets'] = {'etag': etag, 'hash': content_hash(local_presets)}
+    return config_updated
+
+def sync_default_preset(dev, state, remote_exists):
+    """default_preset 동기화 (Firebase 우선). 로컬이 바뀌었으면 True."""
+    config_data = dev.config_data
+    if not remote_exists:
+        return False
+    entry = state.get('default_preset', {})
+    changed, firebase_default, etag = fetch_if_changed(f"{dev.path}/default_preset", entry)
+    state['default_preset'] = {'etag': etag}
+    if changed and firebase_default and config_data.get('default_preset') != firebase_default:
+        config_data['default_preset'] = firebase_default
+        return True
+    return False
+
+def sync_config_with_firebase(dev):
     if not firebase_is_connected:
-        print("동기화 실패: Firebase에 연결되지 않았습니다.")
+        cloud_log.warning("동기화 실패: Firebase에 연결되지 않았습니다.")
         return
 
-    print("🔄 설정 동기화(프리셋 및 센서 정보)를 시작합니다...")
+    config_data = dev.config_data
+    cloud_log.info("%s🔄 설정 동기화(프리셋 및 센서 정보)를 시작합니다...", dev.tag)
     try:
-        device_ref = db.reference(f"devices/{device_id}", app=firebase_app)
-        firebase_data = device_ref.get()
+        # 기기 루트는 키만 조회 (logs 등 하위 데이터는 내려받지 않음)
+        root_keys = cloud.get(dev.path, shallow=True)
 
-        if firebase_data is None:
-            print("Firebase에 기기 데이터가 없습니다. 로컬 설정을 전체 업로드합니다.")
-            upload_initial_config_to_firebase()
+        if root_keys is None:
+            cloud_log.info("Firebase에 기기 데이터가 없습니다. 로컬 설정을 전체 업로드합니다.")
+            upload_initial_config_to_firebase(dev)
+            config_data.pop('sync_state', None)
+            save_config_to_file(dev)
             return
-            
+
+        state = config_data.setdefault('sync_state', {})
+        before = copy.deepcopy(state)
+
         # --- 센서 물리적 정보(status/sensors) 동기화 ---
-        firebase_status_sensors = firebase_data.get('status', {}).get('sensors', {})
-        local_sensors_config = config_data.get('sensors_config', {})
-        
-        # 로컬 config.json 기준으로 Firebase의 센서 정보 확인 및 복구
-        for sensor_id, local_info in local_sensors_config.items():
-            firebase_sensor = firebase_status_sensors.get(sensor_id)
-            
-            # Firebase에 센서 자체가 없거나, 필수 정보(name, posX, posY)가 누락된 경우
-            if (firebase_sensor is None or 
-                    'name' not in firebase_sensor or 
-                    'posX' not in firebase_sensor or 
-                    'posY' not in firebase_sensor):
-                
-                print(f"Firebase에서 '{sensor_id}'의 정보가 누락/손상되어 복구합니다.")
-                # 'temp' 값을 포함하여 완전한 노드를 다시 생성 (기존 temp 값은 덮어쓰지 않음)
-                update_path = f"status/sensors/{sensor_id}"
-                # temp 값은 유지하기 위해 기존 값을 읽어오거나 0으로 설정
-                existing_temp = firebase_sensor.get('temp', 0) if firebase_sensor else 0
-                device_ref.child(update_path).set({
-                    'name': local_info['name'],
-                    'posX': local_info['posX'],
-                    'posY': local_info['posY'],
-                    'temp': existing_temp
-                })
-
-        # --- 프리셋 및 default_preset 동기화 (기존 로직 유지) ---
-        firebase_presets = firebase_data.get('presets', {})
-        local_presets = config_data.get('presets', {})
-        config_updated = False
-
-        # Firebase -> 로컬 동기화
-        for preset_id, info in firebase_presets.items():
-            if preset_id not in local_presets or local_presets[preset_id] != info:
-                local_presets[preset_id] = info
-                config_updated = True
-        
-        # 로컬 -> Firebase 동기화
-        for preset_id, info in local_presets.items():
-            if preset_id not in firebase_presets:
-                device_ref.child('presets').child(preset_id).set(info)
-
-        # default_preset 동기화 (Firebase 우선)
-        firebase_default = firebase_data.get('default_preset')
-        if firebase_default and config_data.get('default_preset') != firebase_default:
-            config_data['default_preset'] = firebase_default
-            config_updated = True
+        sensors_checked = sync_sensor_metadata(dev, state)
+
+        # --- 프리셋 및 default_preset 동기화 ---
+        config_updated = sync_presets(dev, state, 'presets' in root_keys)
+        config_updated |= sync_default_preset(dev, state, 'default_preset' in root_keys)
 
         if config_updated:
-            print("프리셋 정보가 동기화되어 config.json을 업데이트합니다.")
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            config_path = os.path.join(script_dir, CONFIG_FILE)
-            with open(config_path, 'w', encoding = 'utf-8') as f:
-                json.dump(config_data, f, indent=4)
+            cloud_log.info("프리셋 정보가 동기화되어 config.json을 업데이트합니다.")
+        if config_updated or state != before:
+            save_config_to_file(dev)
         
-        print("✅ 설정 동기화 완료.")
+        unchanged = []
+        if not sensors_checked:
+            unchanged.append('센서')
+        if state.get('presets') == before.get('presets'):
+            unchanged.append('프리셋')
+        cloud_log.info("✅ 설정 동기화 완료.%s", f" (변경 없음: {', '.join(unchanged)})" if unchanged else '')
     except Exception as e:
-        print(f"❌ 설정 동기화 중 오류 발생: {e}")
+        cloud_log.error("❌ 설정 동기화 중 오류 발생: %s", e)
 
 # --- 3. Firebase 통신 (백그라운드 스레드) ---
-def firebase_thread_worker():
-    global firebase_app, firebase_is_connected, listener
-    
-    last_heartbeat_time = 0
-    last_log_time = 0 
 
+def cloud_worker_supervisor():
+    """main()이 시작하는 감시 스레드. 클라우드 워커가 죽거나 멈추면 다시 시작하고 클라우드 재연결을 요청."""
+    global firebase_is_connected
     while main_loop_running:
-        if not firebase_is_connected:
-            try:
-                print("Firebase 연결을 시도합니다...")
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                key_path = os.path.join(script_dir, FIREBASE_KEY_FILE)
-                cred = credentials.Certificate(key_path)
-                database_url = f'https://{cred.project_id}-default-rtdb.firebaseio.com/'
-                
-                if not firebase_admin._apps:
-                    firebase_app = firebase_admin.initialize_app(cred, {'databaseURL': database_url})
+        try:
+            reason = cloud_worker.supervise()
+            if reason:
+                # 새 워커에는 앱 초기화/리스너가 없으므로 일반 재연결 경로(connect_firebase)를 다시 탄다
+                cloud_health.disconnect(reason)
+                firebase_is_connected = cloud_health.connected
+        except Exception as e:
+            cloud_log.exception("클라우드 워커 감시 오류: %s", e)
+        time.sleep(1)
+
+def submit_status(updates):
+    """status 쓰기를 제출. 클라우드 워커가 있고 온라인이면 공유 메모리 링으로 넘긴다 (피클/파이프 없음).
+
+    오프라인이거나 outbox에 밀린 항목이 있으면 순서를 지키기 위해 지금처럼 쓰기 스케줄러로 보낸다.
+    """
+    if cloud_worker is not None and firebase_is_connected and (outbox is None or len(outbox) == 0):
+        updates = cloud_worker.push_status(updates)
+    write_scheduler.submit(updates, PRIORITY_TELEMETRY)
+
+def record_cloud_result(ok, reason=None):
+    """클라우드 호출 결과를 cloud_health에 반영하고 firebase_is_connected를 맞춘다.
+
+    한 번의 실패는 degraded로만 표시하고 (쓰기는 계속 시도, 실패분은 outbox로), 연속으로
+    FIREBASE_FAILURE_THRESHOLD번 실패해야 연결이 끊긴 것으로 보고 백오프를 시작한다.
+    """
+    global firebase_is_connected
+    if ok:
+        cloud_health.record_success()
+    else:
+        cloud_health.record_failure(reason)
+    firebase_is_connected = cloud_health.connected
+
+def write_or_enqueue(updates):
+    """DB 루트 기준 {절대 경로: 값}을 다중 경로 update()로 쓴다.
+
+    오프라인이거나 쓰기에 실패하면 outbox에 보관한다. 큐에 밀린 항목이 있으면 순서를 지키기
+    위해 새 쓰기도 큐 뒤에 붙인다. 즉시 전송에 성공했으면 True.
+    """
+    if firebase_is_connected and (outbox is None or len(outbox) == 0):
+        try:
+            cloud.update('/', updates)
+            metrics.inc('writes.direct')
+            record_cloud_result(True)
+            return True
+        except Exception as e:
+            record_cloud_result(False, e)
+            cloud_log.warning("쓰기 실패, 오프라인 큐에 보관합니다: %s", e)
+    enqueue_writes(updates)
+    return False
+
+def enqueue_writes(updates):
+    """{절대 경로: 값}을 outbox에 보관 (재연결 후 drain_outbox가 전송). outbox가 없으면 버린다."""
+    if outbox is not None:
+        outbox.put(updates)
+        metrics.inc('writes.enqueued')
+
+def drain_outbox():
+    if outbox is None or len(outbox) == 0:
+        return
+    try:
+        sent = outbox.drain(lambda merged: cloud.update('/', merged))
+        if sent:
+            record_cloud_result(True)
+            metrics.inc('outbox.drained', sent)
+            cloud_log.info("📤 오프라인 큐 전송: %d개 (남은 항목 %d개)", sent, len(outbox))
+    except Exception as e:
+        record_cloud_result(False, e)
+        cloud_log.warning("오프라인 큐 전송 실패: %s", e)
+
+class WriteScheduler:
+    """주기적인 클라우드 쓰기를 모아 틱마다 하나의 루트 다중 경로 update()로 보내는 스케줄러.
+
+    submit()으로 넣은 {절대 경로: 값}은 같은 경로끼리 최신 값으로 합쳐진다. flush()는 우선순위
+    (제어 ACK·연결 상태 > status·하트비트 > 로그) 순으로 max_paths개까지 한 번에 쓰며, 제어 쪽
+    쓰기가 들어오면 틱을 기다리지 않는다. 전송은 write_or_enqueue를 거치므로 오프라인/실패 시
+    outbox에 보관된다. back-pressure: update()가 slow_threshold보다 오래 걸리면 틱 간격을 두 배로
+    늘리고 (최대 max_interval, 빨라지면 복귀), 대기 경로가 max_pending을 넘으면 낮은 우선순위부터
+    outbox로 넘긴다. 느린 링크에서는 같은 경로의 status 값이 더 많이 합쳐진다.
+    """
+
+    def __init__(self, interval=WRITE_TICK_INTERVAL, max_interval=WRITE_MAX_INTERVAL,
+                 slow_threshold=WRITE_SLOW_THRESHOLD, max_paths=WRITE_MAX_PATHS, max_pending=WRITE_MAX_PENDING):
+        self.base_interval = interval
+        self.interval = interval
+        self.max_interval = max_interval
+        self.slow_threshold = slow_threshold
+        self.max_paths = max_paths
+        self.max_pending = max_pending
+        self.on_submit = None   # 제출 시 호출 (asyncio 런타임이 루프를 깨우는 데 사용)
+        self._cond = threading.Condition()
+        self._pending = [{} for _ in range(PRIORITY_LOG + 1)]  # 우선순위별 {경로: 값}
+        self._count = 0
+        self._urgent = False
+        self._window_start = None  # 이번 틱에 처음 제출된 시각
+
+    def __len__(self):
+        return self._count
+
+    def submit(self, updates, priority=PRIORITY_TELEMETRY):
+        if not updates:
+            return
+        with self._cond:
+            bucket = self._pending[priority]
+            before = len(bucket)
+            bucket.update(updates)
+            self._count += len(bucket) - before
+            metrics.inc('writes.submitted', len(updates))
+            if self._window_start is None:
+                self._window_start = time.monotonic()
+            if priority == PRIORITY_CONTROL:
+                self._urgent = True
+            if self._count > self.max_pending:
+                self._spill()
+            self._cond.notify()
+        if self.on_submit is not None:
+            self.on_submit()
+
+    def _spill(self):
+        # outbox에 넣은 뒤로는 write_or_enqueue가 새 쓰기도 큐 뒤에 붙이므로 순서가 유지된다
+        for priority in range(PRIORITY_LOG, PRIORITY_CONTROL, -1):
+            bucket = self._pending[priority]
+            if self._count <= self.max_pending or outbox is None:
+                return
+            if bucket:
+                outbox.put(bucket)
+                metrics.inc('writes.spilled', len(bucket))
+                self._count -= len(bucket)
+                self._pending[priority] = {}
+
+    def _delay(self, now):
+        if not self._count:
+            return None
+        if self._urgent:
+            return 0.0
+        return max(0.0, self._window_start + self.interval - now)
+
+    def next_delay(self, now=None):
+        """다음 flush()까지 남은 시간 (초). 보낼 것이 없으면 None."""
+        with self._cond:
+            return self._delay(time.monotonic() if now is None else now)
+
+    def wait_due(self, timeout):
+        """flush()할 때가 될 때까지 최대 timeout초 대기. 때가 됐으면 True."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                delay = self._delay(now)
+                if delay == 0:
+                    return True
+                if now >= deadline:
+                    return False
+                self._cond.wait(deadline - now if delay is None else min(delay, deadline - now))
+
+    def _take(self):
+        batch = {}
+        for priority, bucket in enumerate(self._pending):
+            room = self.max_paths - len(batch)
+            if room <= 0:
+                break
+            if len(bucket) <= room:
+                batch.update(bucket)
+                self._pending[priority] = {}
+            else:
+                for path in list(itertools.islice(bucket, room)):
+                    batch[path] = bucket.pop(path)
+        self._count -= len(batch)
+        self._urgent = False
+        self._window_start = time.monotonic() if self._count else None
+        return batch
+
+    def flush(self):
+        """대기 중인 쓰기를 한 번의 update()로 전송 (오프라인/실패 시 outbox). 처리한 경로 수를 반환."""
+        with self._cond:
+            batch = self._take()
+        if not batch:
+            return 0
+        start = time.monotonic()
+        sent = write_or_enqueue(batch)
+        elapsed = time.monotonic() - start
+        metrics.inc('writes.flushes')
+        metrics.inc('writes.paths', len(batch))
+        if sent:
+            metrics.observe('writes.flush', elapsed)
+            if elapsed > self.slow_threshold:
+                self.interval = min(self.max_interval, self.interval * 2)
+            else:
+                self.interval = self.base_interval
+        return len(batch)
+
+write_scheduler = WriteScheduler()
+
+def write_scheduler_worker():
+    """스레드 런타임의 쓰기 스레드. 틱마다 (제어 쓰기는 즉시) 모인 쓰기를 보낸다."""
+    while main_loop_running:
+        try:
+            if write_scheduler.wait_due(1.0):
+                write_scheduler.flush()
+        except Exception as e:
+            cloud_log.exception("쓰기 스케줄러 오류: %s", e)
+            time.sleep(1)
+
+class LogAggregator:
+    """로그 주기 동안 수신한 센서 샘플을 센서별 min/max/mean/count로 집계.
+
+    roll()이 호출될 때마다 현재 구간의 결과를 돌려주고 새 구간을 시작한다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}        # sensor_id -> [min, max, sum, count]
+        self._sample_count = 0  # 구간 내 수신 프레임 수
+
+    def add_store(self, store):
+        """SensorStore의 센서별 최신 필터 값을 한 프레임으로 누적 (범위를 벗어나 버린 값은 제외)."""
+        with self._lock:
+            self._sample_count += 1
+            for sensor_id, ring in zip(store.ids, store.rings):
+                value = ring.last
+                if value is None:
+                    continue
+                stat = self._stats.get(sensor_id)
+                if stat is None:
+                    self._stats[sensor_id] = [value, value, value, 1]
                 else:
-                    firebase_app = firebase_admin.get_app()
-                
-                print("✅ Firebase 초기화 성공.")
-                firebase_is_connected = True
-                
-                set_connection_status("online")
-                sync_config_with_firebase()
-                setup_firebase_listeners()
-
-            except (socket.gaierror, IOError, ValueError, FileNotFoundError) as e:
-                print(f"❌ Firebase 연결 실패: {e}. 10초 후 재시도합니다.")
-                firebase_is_connected = False
-                time.sleep(10)
+                    if value < stat[0]: stat[0] = value
+                    if value > stat[1]: stat[1] = value
+                    stat[2] += value
+                    stat[3] += 1
+
+    def roll(self):
+        """현재 구간의 로그 데이터를 반환하고 초기화. 샘플이 없으면 None.
+
+        앱 호환을 위해 sensor_XX에는 평균값을 두고, 상세 통계는 'stats' 아래에 둔다.
+        """
+        with self._lock:
+            stats, sample_count = self._stats, self._sample_count
+            self._stats, self._sample_count = {}, 0
+        if not sample_count:
+            return None
+
+        log_data = {}
+        detail = {'sample_count': sample_count}
+        for sensor_id, (lo, hi, total, count) in sorted(stats.items()):
+            mean = round(total / count, 2)
+            log_data[sensor_id] = mean
+            detail[sensor_id] = {'min': lo, 'max': hi, 'mean': mean, 'count': count}
+        log_data['stats'] = detail
+        return log_data
+
+def entry_stats(entry):
+    """로그 항목(원본 또는 롤업)에서 {sensor_id: {min, max, mean, count}}를 꺼낸다.
+
+    'stats'가 없는 이전 형식 항목은 센서 값 하나를 표본 1개로 본다.
+    """
+    detail = entry.get('stats') if isinstance(entry.get('stats'), dict) else {}
+    result = {}
+    for sensor_id, value in entry.items():
+        if sensor_id == 'stats' or not isinstance(value, (int, float)):
+            continue
+        stat = detail.get(sensor_id)
+        if isinstance(stat, dict) and stat.get('count'):
+            result[sensor_id] = stat
         else:
-            current_time = time.time()
+            result[sensor_id] = {'min': value, 'max': value, 'mean': value, 'count': 1}
+    return result
 
-            # 하트비트 전송
-            if current_time - last_heartbeat_time > HEARTBEAT_INTERVAL:
-                try:
-                    connection_ref = db.reference(f'devices/{device_id}/connection', app=firebase_app)
-                    local_timestamp_ms = int(time.time() * 1000)
-                    connection_ref.child('last_seen').set(local_timestamp_ms) 
-                    print("❤️  하트비트 전송 (last_seen 업데이트).")
-                    last_heartbeat_time = current_time
-                except Exception as e:
-                    print(f"하트비트 전송 실패, 연결을 재설정합니다: {e}")
-                    firebase_is_connected = False
-            
-            # 데이터 로깅
-            if current_time - last_log_time > LOG_INTERVAL:
-                try:
-                    # 현재 시간 포맷팅
-                    now = datetime.datetime.now()
-                    date_str = now.strftime("%Y%m%d")   # 예: 20251203
-                    time_str = now.strftime("%H%M%S")   # 예: 153000
-                    
-                    # 현재 센서 데이터 가져오기 (status 경로의 값 참조)
-                    status_ref = db.reference(f'devices/{device_id}/status/sensors', app=firebase_app)
-                    current_sensors_data = status_ref.get()
-
-                    if current_sensors_data:
-                        # 저장할 데이터 간소화 (temp 값만 추출)
-                        log_data = {}
-                        for s_id, s_data in current_sensors_data.items():
-                            if 'temp' in s_data:
-                                log_data[s_id] = s_data['temp']
-                        
-                        # /devices/{id}/logs/{date}/{time} 경로에 저장
-                        log_ref = db.reference(f'devices/{device_id}/logs/{date_str}/{time_str}', app=firebase_app)
-                        log_ref.set(log_data)
-                        
-                        print(f"📝 데이터 로그 저장 완료: {time_str}")
-                        last_log_time = current_time
+def merge_stats(acc, entry):
+    """acc({'sample_count', 'sensors': {id: [min, max, sum, count]}})에 로그 항목 하나를 합친다."""
+    detail = entry.get('stats') if isinstance(entry.get('stats'), dict) else {}
+    acc['sample_count'] = acc.get('sample_count', 0) + detail.get('sample_count', 1)
+    sensors = acc.setdefault('sensors', {})
+    for sensor_id, stat in entry_stats(entry).items():
+        cur = sensors.get(sensor_id)
+        total = stat['mean'] * stat['count']
+        if cur is None:
+            sensors[sensor_id] = [stat['min'], stat['max'], total, stat['count']]
+        else:
+            cur[0] = min(cur[0], stat['min'])
+            cur[1] = max(cur[1], stat['max'])
+            cur[2] += total
+            cur[3] += stat['count']
 
-                except Exception as e:
-                    print(f"로그 저장 실패: {e}")
+def rollup_node(acc):
+    """누적값을 원본 로그와 같은 모양({sensor_XX: 평균, 'stats': {...}})으로 변환."""
+    node = {}
+    detail = {'sample_count': acc.get('sample_count', 0)}
+    for sensor_id, (lo, hi, total, count) in sorted(acc.get('sensors', {}).items()):
+        mean = round(total / count, 2)
+        node[sensor_id] = mean
+        detail[sensor_id] = {'min': lo, 'max': hi, 'mean': mean, 'count': count}
+    node['stats'] = detail
+    return node
 
-            time.sleep(1)
+class LogRollup:
+    """분 단위 로그를 시간(logs_hourly/{date}/{HH})·일(logs_daily/{date}) 요약으로 누적.
+
+    앱이 몇 천 개의 원본 노드 대신 작은 요약 시계열을 읽을 수 있게 한다. 진행 중인 시간/일
+    누적값은 로컬 파일에 보관해 재시작해도 이어서 합산한다.
+    """
 
-def set_connection_status(status):
-    if firebase_is_connected and device_id:
+    def __init__(self, path):
+        self.store = ConfigStore(path)
+        self.state = {'hourly': {}, 'daily': {}}
         try:
-            connection_ref = db.reference(f'devices/{device_id}/connection', app=firebase_app)
-            local_timestamp_ms = int(time.time() * 1000)
+            with open(path, 'r', encoding='utf-8') as f:
+                self.state.update(json.load(f))
+            self.store.mark_clean(self.state)
+        except (OSError, ValueError):
+            pass
 
-            connection_ref.update({
-                'status': status,
-                'last_seen': local_timestamp_ms
-            })
-            print(f"✅ Firebase 연결 상태 '{status}'로 설정 완료.")
+    def add(self, date_str, hour_str, entry):
+        """로그 항목을 현재 시간/일 누적에 더하고, 기기 경로 기준 {경로: 요약 노드}를 반환."""
+        hour_key = f'{date_str}/{hour_str}'
+        hourly = {hour_key: self.state['hourly'].get(hour_key, {})}  # 지난 시간 누적은 버림
+        daily = {date_str: self.state['daily'].get(date_str, {})}
+        merge_stats(hourly[hour_key], entry)
+        merge_stats(daily[date_str], entry)
+        self.state = {'hourly': hourly, 'daily': daily}
+        self.store.save(self.state)
+        return {f'logs_hourly/{hour_key}': rollup_node(hourly[hour_key]),
+                f'logs_daily/{date_str}': rollup_node(daily[date_str])}
+
+def export_history(dev, path, since=None, until=None, step=None):
+    """--export-history: 로컬 시계열을 CSV로 저장. since/until은 ISO 시각 문자열(기본: 오늘 0시~지금)."""
+    if dev.history is None:
+        log.warning("%s⚠️ 로컬 시계열 저장소가 꺼져 있습니다 (config 'history').", dev.tag)
+        return 0
+    now = datetime.datetime.now()
+    start = datetime.datetime.fromisoformat(since) if since else now.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = datetime.datetime.fromisoformat(until) if until else now
+    step_ms = int(step * 1000) if step else None
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        count = dev.history.export_csv(f, int(start.timestamp() * 1000), int(end.timestamp() * 1000), step_ms)
+    log.info("%s💾 %s ~ %s 시계열 %d행을 '%s'에 저장했습니다.", dev.tag,
+             f'{start:%Y-%m-%d %H:%M:%S}', f'{end:%Y-%m-%d %H:%M:%S}', count, path)
+    return count
+
+def log_retention(dev):
+    """config.json의 'log_retention'으로 덮어쓸 수 있는 보관 기간 (raw_days, hourly_days)."""
+    retention = dev.config_data.get('log_retention', {})
+    return (retention.get('raw_days', LOG_RAW_RETENTION_DAYS),
+            retention.get('hourly_days', LOG_HOURLY_RETENTION_DAYS))
+
+def compact_device_logs(dev, today=None):
+    """요약이 없는 지난 날짜의 원본 로그로 시간/일 요약을 만들고, 보관 기간이 지난 데이터를 삭제.
+
+    날짜 목록은 shallow 조회로만 확인하며, 원본을 내려받는 것은 요약이 없는 날짜(기능 도입 이전
+    로그)에 한해 실행당 LOG_BACKFILL_DAYS_PER_RUN일까지다. 요약되지 않은 날짜는 삭제하지 않는다.
+    """
+    today = today or datetime.date.today()
+    today_str = today.strftime("%Y%m%d")
+    raw_days, hourly_days = log_retention(dev)
+    raw_cutoff = (today - datetime.timedelta(days=raw_days)).strftime("%Y%m%d")
+    hourly_cutoff = (today - datetime.timedelta(days=hourly_days)).strftime("%Y%m%d")
+
+    raw_dates = sorted(cloud.get(f'{dev.path}/logs', shallow=True) or {})
+    daily_dates = set(cloud.get(f'{dev.path}/logs_daily', shallow=True) or {})
+    hourly_dates = sorted(cloud.get(f'{dev.path}/logs_hourly', shallow=True) or {})
+
+    updates = {}
+    backfilled = 0
+    for date_str in raw_dates:
+        if date_str >= today_str or date_str in daily_dates:
+            continue
+        if backfilled >= LOG_BACKFILL_DAYS_PER_RUN:
+            break
+        entries = cloud.get(f'{dev.path}/logs/{date_str}') or {}
+        hours, day = {}, {}
+        for time_str, entry in sorted(entries.items()):
+            if isinstance(entry, dict):
+                merge_stats(hours.setdefault(time_str[:2], {}), entry)
+                merge_stats(day, entry)
+        for hour_str, acc in hours.items():
+            if date_str >= hourly_cutoff:
+                updates[f'{dev.path}/logs_hourly/{date_str}/{hour_str}'] = rollup_node(acc)
+        if day:
+            updates[f'{dev.path}/logs_daily/{date_str}'] = rollup_node(day)
+        daily_dates.add(date_str)
+        backfilled += 1
+
+    pruned = [d for d in raw_dates if d < raw_cutoff and d in daily_dates]
+    for date_str in pruned:
+        updates[f'{dev.path}/logs/{date_str}'] = None
+    for date_str in hourly_dates:
+        if date_str < hourly_cutoff:
+            updates[f'{dev.path}/logs_hourly/{date_str}'] = None
+
+    if updates:
+        write_scheduler.submit(updates, PRIORITY_LOG)
+        metrics.inc('logs.backfilled_days', backfilled)
+        metrics.inc('logs.pruned_days', len(pruned))
+        cloud_log.info("%s🗜️ 로그 정리: 요약 생성 %d일, 원본 삭제 %d일", dev.tag, backfilled, len(pruned))
+
+def compact_logs(targets):
+    if not firebase_is_connected:
+        return
+    for dev in targets:
+        try:
+            with metrics.timer('logs.compaction'):
+                compact_device_logs(dev)
         except Exception as e:
-            print(f"연결 상태 '{status}' 설정 실패: {e}")
-
-def setup_firebase_listeners():
-    global listener
-    print("Firebase 리스너 설정을 시작합니다.")
-    control_ref = db.reference(f'devices/{device_id}/control', app=firebase_app)
-    listener = control_ref.listen(control_listener)
-    print("📡 Firebase 제어 데이터 감시 시작...")
-
-def control_listener(event):
-    if not event.data: return
-    print(f"🔥 제어 변경 감지: {event.path} -> {event.data}")
-    
-    # 전체 데이터를 가져와서 처리
+            cloud_log.warning("%s로그 정리 실패: %s", dev.tag, e)
+
+def connect_firebase(targets, on_control_event=None):
+    """cloud_health.should_attempt()가 허용했을 때 한 번 호출하는 (재)연결 시도.
+
+    앱과 인증 정보는 처음 한 번만 초기화해 재사용한다. 먼저 기기 connection 노드를 shallow로
+    조회하는 가벼운 half-open 프로브로 연결을 확인하고, 성공한 경우에만 온라인 상태 기록, 설정
+    동기화, 리스너 등록을 한다. on_control_event(dev, event)를 주면 control_listener 대신 호출된다.
+    성공 여부를 반환.
+    """
+    try:
+        cloud_log.info("Firebase 연결을 시도합니다...")
+        cloud.connect()
+        if targets:
+            cloud.get(f'{targets[0].path}/connection', shallow=True)
+    except Exception as e:
+        metrics.inc('cloud.connect_failures')
+        record_cloud_result(False, e)
+        cloud_log.error("❌ Firebase 연결 실패: %s. %.0f초 후 재시도합니다.", e, cloud_health.retry_in())
+        return False
+
+    record_cloud_result(True)
+    cloud_log.info("✅ Firebase 연결 성공.")
+    startup.mark('cloud_connected')
+    for dev in targets:
+        set_connection_status(dev, "online")
+        sync_config_with_firebase(dev)
+        setup_firebase_listeners(dev, on_control_event)
+    return True
+
+def send_heartbeat(targets):
+    """모든 기기의 하트비트(last_seen)를 쓰기 스케줄러에 제출 (같은 틱의 다른 쓰기와 합쳐짐)."""
+    local_timestamp_ms = int(time.time() * 1000)
+    updates = {f'{dev.path}/connection/last_seen': local_timestamp_ms for dev in targets}
+    write_scheduler.submit(updates, PRIORITY_TELEMETRY)
+    heartbeat_log.info("❤️  하트비트 (last_seen 업데이트).")
+
+def write_log_entry(targets):
+    """기기별로 로컬에서 집계한 로그 주기 통계와 시간/일 요약을 쓰기 스케줄러에 제출."""
     try:
-        root_ref = db.reference(f'devices/{device_id}/control', app=firebase_app)
-        full_control = root_ref.get()
+        # 현재 시간 포맷팅
+        now = datetime.datetime.now()
+        date_str = now.strftime("%Y%m%d")   # 예: 20251203
+        time_str = now.strftime("%H%M%S")   # 예: 153000
         
-        if not full_control: return
+        updates = {}
+        logged = 0
+        for dev in targets:
+            log_data = dev.log_aggregator.roll()
+            if log_data:
+                # /devices/{id}/logs/{date}/{time} 경로에 저장
+                updates[f'{dev.path}/logs/{date_str}/{time_str}'] = log_data
+                # 같은 쓰기에 시간/일 요약 갱신 포함
+                for path, node in dev.log_rollup.add(date_str, time_str[:2], log_data).items():
+                    updates[f'{dev.path}/{path}'] = node
+                logged += 1
+        if updates:
+            write_scheduler.submit(updates, PRIORITY_LOG)
+            cloud_log.info("📝 데이터 로그 저장: %s (기기 %d대)", time_str, logged)
 
-        mode = full_control.get('global_mode', 'off').upper()
-        temp_g1 = full_control.get('groups', {}).get('group_1', {}).get('target_temp', 25)
-        temp_g2 = full_control.get('groups', {}).get('group_2', {}).get('target_temp', 25)
+    except Exception as e:
+        cloud_log.warning("로그 저장 실패: %s", e)
 
-        if arduino and arduino.is_open:
-            # 아두이노 프로토콜: CMD:그룹:모드:온도
-            cmd_a = f"CMD:A:{mode}:{temp_g1}\n"
-            cmd_b = f"CMD:B:{mode}:{temp_g2}\n"
-            
-            arduino.write(cmd_a.encode())
-            time.sleep(0.05)
-            arduino.write(cmd_b.encode())
-            print(f"-> 전송: {cmd_a.strip()}, {cmd_b.strip()}")
-            
+def print_device_metrics(targets):
+    for dev in targets:
+        log.info("📊 %s%s", dev.tag, dev.metrics())
+
+def collect_metrics():
+    """전역 지표(카운터/게이지/히스토그램)와 기기별 지표를 합친 스냅샷."""
+    snapshot = metrics.snapshot()
+    snapshot['firebase_connected'] = firebase_is_connected
+    snapshot['cloud_link'] = cloud_health.summary()
+    if cloud_worker is not None:
+        snapshot['cloud_worker'] = cloud_worker.summary()
+    snapshot['startup_ms'] = dict(startup.stages)
+    snapshot['devices'] = {dev.device_id: dev.metrics() for dev in devices}
+    return snapshot
+
+def write_metrics_file():
+    """지표 스냅샷을 METRICS_FILE에 한 줄(JSON)로 추가하고, 크기를 넘으면 파일을 회전."""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(script_dir, METRICS_FILE)
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > METRICS_FILE_MAX_BYTES:
+            for i in range(METRICS_FILE_BACKUPS - 1, 0, -1):
+                if os.path.exists(f'{path}.{i}'):
+                    os.replace(f'{path}.{i}', f'{path}.{i + 1}')
+            os.replace(path, f'{path}.1')
+        line = json.dumps({'time': int(time.time()), **collect_metrics()}, ensure_ascii=False)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except Exception as e:
+        log.warning("지표 파일 기록 실패: %s", e)
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path in ('/', '/metrics'):
+            data = collect_metrics()
+        elif path == '/logs':
+            data = log_ring.dump()  # 메모리에 보관한 최근 로그
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 요청마다 출력하지 않음
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """로컬 지표 엔드포인트(GET /metrics)를 데몬 스레드에서 시작. 실패하면 None."""
+    if not port:
+        return None
+    try:
+        server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as e:
+        log.warning("⚠️ 지표 엔드포인트를 열 수 없습니다 (%s:%s): %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    log.info("📈 지표 엔드포인트: http://%s:%s/metrics", host, port)
+    return server
+
+def firebase_thread_worker(targets):
+    last_heartbeat_time = 0
+    last_log_time = 0 
+    last_stats_time = time.time()
+    last_metrics_time = time.time()
+    last_compaction_time = 0
+
+    while main_loop_running:
+        current_time = time.time()
+
+        if not firebase_is_connected:
+            if cloud_health.should_attempt():
+                connect_firebase(targets)
+        else:
+            # 오프라인 동안 쌓인 쓰기 전송
+            drain_outbox()
+
+        if current_time - last_heartbeat_time > HEARTBEAT_INTERVAL:
+            send_heartbeat(targets)
+            last_heartbeat_time = current_time
+        
+        if current_time - last_log_time > LOG_INTERVAL:
+            write_log_entry(targets)
+            last_log_time = current_time
+
+        if len(targets) > 1 and current_time - last_stats_time > GATEWAY_STATS_INTERVAL:
+            print_device_metrics(targets)
+            last_stats_time = current_time
+
+        if firebase_is_connected and current_time - last_compaction_time > LOG_COMPACTION_INTERVAL:
+            compact_logs(targets)
+            last_compaction_time = current_time
+
+        if current_time - last_metrics_time > METRICS_FILE_INTERVAL:
+            write_metrics_file()
+            last_metrics_time = current_time
+
+        time.sleep(1)
+
+def set_connection_status(dev, status):
+    """연결 상태를 높은 우선순위로 제출 (종료 시에는 main에서 바로 flush한다)."""
+    if firebase_is_connected and dev.device_id:
+        local_timestamp_ms = int(time.time() * 1000)
+        write_scheduler.submit({f'{dev.path}/connection/status': status,
+                                f'{dev.path}/connection/last_seen': local_timestamp_ms}, PRIORITY_CONTROL)
+        cloud_log.info("%s✅ Firebase 연결 상태 '%s'로 설정.", dev.tag, status)
+
+class TreeMirror:
+    """Firebase 리스너 이벤트(put/patch)로 갱신되는 로컬 트리 사본.
+
+    첫 이벤트(path='/')로 전체 스냅샷을 받고, 이후에는 event.path/event.data 델타만 반영한다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tree = None
+        self.ready = False  # 첫 스냅샷 수신 여부
+        self.version = 0    # 변경될 때마다 증가
+
+    @staticmethod
+    def _split(path):
+        return [key for key in (path or '').split('/') if key]
+
+    def apply_event(self, event_type, path, data):
+        with self._lock:
+            if event_type == 'patch' and isinstance(data, dict):
+                base = self._split(path)
+                for key, value in data.items():
+                    self._put(base + self._split(key), value)
+            else:
+                self._put(self._split(path), data)
+            self.ready = True
+            self.version += 1
+
+    def _put(self, keys, value):
+        value = copy.deepcopy(value)
+        if not keys:
+            self._tree = value
+            return
+        if not isinstance(self._tree, dict):
+            if value is None:
+                return
+            self._tree = {}
+
+        # 경로를 따라 내려가며 중간 노드 생성 (삭제 시에는 생성하지 않음)
+        parents = []
+        node = self._tree
+        for key in keys[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[key] = {}
+            parents.append((node, key))
+            node = child
+
+        if value is None:
+            node.pop(keys[-1], None)
+            # Realtime Database처럼 비어버린 상위 노드는 제거
+            while parents and not node:
+                node, key = parents.pop()
+                node.pop(key, None)
+            if not self._tree:
+                self._tree = None
+        else:
+            node[keys[-1]] = value
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self._tree)
+
+def setup_firebase_listeners(dev, on_control_event=None):
+    cloud_log.info("%sFirebase 리스너 설정을 시작합니다.", dev.tag)
+    for listener in (dev.listener, dev.preset_listener):
+        if listener:
+            # 재연결 시 이전 리스너 정리 (새 리스너의 첫 이벤트가 미러를 다시 채움)
+            try:
+                listener.close()
+            except Exception:
+                pass
+    callback = on_control_event or control_listener
+    dev.listener = cloud.listen(f'{dev.path}/control', lambda event: callback(dev, event))
+    # 프리셋 변경은 미러와 설정 파일만 갱신하므로 SDK 스레드에서 바로 처리
+    dev.preset_listener = cloud.listen(f'{dev.path}/presets', lambda event: presets_listener(dev, event))
+    cloud_log.info("%s📡 Firebase 제어/프리셋 데이터 감시 시작...", dev.tag)
+
+def control_listener(dev, event):
+    if tracer is not None:
+        tracer.record_event('control', dev, event)
+    # 이벤트 델타를 로컬 미러에 반영 (추가 get() 호출 없음)
+    dev.control_mirror.apply_event(event.event_type, event.path, event.data)
+    dev.counters['control_events'] += 1
+    control_log.info("%s🔥 제어 변경 감지: %s -> %s", dev.tag, event.path, event.data)
+
+    full_control = dev.control_mirror.snapshot()
+    if not full_control: return
+    # 아직 Firebase에 반영되지 않은 로컬 변경이 이 이벤트보다 나중 값이므로 그대로 유지
+    overlay = dev.local_overrides.reconcile(full_control, firebase_is_connected)
+    if overlay:
+        dev.control_mirror.apply_event('patch', '/', overlay)
+        full_control = dev.control_mirror.snapshot()
+
+    try:
+        # 바뀐 그룹만 즉시 전송 (ACK가 오지 않으면 채널이 백오프로 재전송)
+        dev.command_channel.set_control(full_control)
+        pump_commands(dev)
     except Exception as e:
-        print(f"명령 처리 중 오류: {e}")
+        control_log.warning("%s명령 처리 중 오류: %s", dev.tag, e)
 
     try:
-        full_control = db.reference(f'devices/{device_id}/control', app=firebase_app).get()
-        if full_control:
-            config_data['last_control_state'] = full_control
-            save_config_to_file()
+        dev.config_data['last_control_state'] = full_control
+        save_config_to_file(dev)
     except Exception as e:
-        print(f"설정 저장 중 오류: {e}")
+        control_log.warning("%s설정 저장 중 오류: %s", dev.tag, e)
 
-def presets_listener(event):
-    if not event.data: return
-    
+def presets_listener(dev, event):
+    """presets 변경 델타를 미러에 반영하고 명령 상태를 다시 변환한 뒤 config.json에 저장 (추가 get() 없음)."""
+    if tracer is not None:
+        tracer.record_event('presets', dev, event)
     try:
-        print("📥 프리셋 변경 감지 -> 파일 저장")
-        # 전체 프리셋을 가져와서 config.json에 덮어쓰기
-        full_presets = db.reference(f'devices/{device_id}/presets', app=firebase_app).get()
-        if full_presets:
-            config_data['presets'] = full_presets
-            save_config_to_file()
+        presets = dev.presets.apply_event(event)
+        if not presets:
+            # 원격 프리셋이 비어 있어도 로컬 프리셋은 지우지 않음 (설정 검증에 필요)
+            dev.presets.load(dev.config_data.get('presets'))
+            return
+        if presets != dev.config_data.get('presets'):
+            control_log.info("%s📥 프리셋 변경 감지 (%s) -> 파일 저장", dev.tag, event.path)
+            dev.config_data['presets'] = presets
+            save_config_to_file(dev)
     except Exception as e:
-        print(f"프리셋 동기화 실패: {e}")
+        control_log.warning("%s프리셋 동기화 실패: %s", dev.tag, e)
 
-def apply_preset_to_arduino(preset_id):
-    if preset_id not in config_data.get('presets', {}): return
+def restore_control_state(dev):
+    """config.json에 저장된 마지막 제어 상태(없으면 기본 프리셋)를 명령 채널에 넣는다.
 
-    print(f"프리셋 '{preset_id}' 적용 중...")
-    preset_data = config_data['presets'][preset_id]
-    
+    클라우드 연결을 기다리지 않고 시리얼 세션이 열리자마자 전송되며, 이후 리스너의 첫 이벤트가
+    바뀐 그룹만 덮어쓴다. 적용한 출처('last_control_state' | 'default_preset')를 반환, 없으면 None.
+    """
+    source = 'last_control_state'
+    control = dev.config_data.get('last_control_state')
+    if not control:
+        source = 'default_preset'
+        control = dev.config_data.get('presets', {}).get(dev.config_data.get('default_preset'))
+    if not control:
+        return None
+    dev.command_channel.set_control(control)
+    control_log.info("%s♻️  저장된 제어 상태 복원 (%s)", dev.tag, source)
+    startup.mark(f'{dev.device_id}.control_restored', dev.tag)
+    return source
+
+def switch_preset(dev, preset_id):
+    """프리셋을 로컬에서 바로 적용 (미리 변환된 명령 상태 사용, 클라우드 조회 없음). 성공하면 True.
+
+    control과 last_control_state도 프리셋 내용으로 바꿔 앱·재시작 후 상태와 맞춘다. control 쓰기는
+    쓰기 스케줄러로 보내므로 오프라인이면 outbox에 보관됐다가 재연결 후 전송된다.
+    """
+    targets = dev.presets.compiled.get(preset_id)
+    if targets is None:
+        control_log.warning("%s⚠️ 알 수 없는 프리셋 '%s'", dev.tag, preset_id)
+        return False
+
+    control_log.info("%s프리셋 '%s' 적용 중...", dev.tag, preset_id)
+    dev.command_channel.set_targets(targets)
     try:
-        # 1. 데이터 파싱
-        mode = preset_data.get('global_mode', 'off').upper()
-        g1 = preset_data.get('groups', {}).get('group_1', {}).get('target_temp', 24)
-        g2 = preset_data.get('groups', {}).get('group_2', {}).get('target_temp', 24)
-
-        # 2. 아두이노 전송
-        if arduino and arduino.is_open:
-            cmd_a = f"CMD:A:{mode}:{g1}\n"
-            cmd_b = f"CMD:B:{mode}:{g2}\n"
-            arduino.write(cmd_a.encode())
-            time.sleep(0.05)
-            arduino.write(cmd_b.encode())
-            print(f"-> 프리셋 전송: {cmd_a.strip()} / {cmd_b.strip()}")
-            
+        pump_commands(dev)
     except Exception as e:
-        print(f"프리셋 적용 실패: {e}")
+        control_log.warning("%s프리셋 전송 실패 (재연결 후 다시 보냄): %s", dev.tag, e)
+    dev.active_preset = preset_id
+    metrics.inc('presets.switched')
+
+    preset = dev.config_data['presets'][preset_id]
+    # 앱(ControlActivity)이 control/preset_applied로 적용 중인 프리셋을 표시한다
+    changes = {'global_mode': preset.get('global_mode', 'off'), 'preset_applied': preset_id}
+    for group_key, group in (preset.get('groups') or {}).items():
+        if isinstance(group, dict) and 'target_temp' in group:
+            changes[f'groups/{group_key}/target_temp'] = group['target_temp']
+    record_local_control(dev, changes)
+    return True
+
+class LocalOverrides:
+    """로컬(LAN, 프리셋 전환)에서 바꾼 control 값 중 아직 Firebase에서 확인되지 않은 값.
+
+    last-writer-wins 조정: 로컬 변경은 control/updated_at(ms)과 함께 쓰기 스케줄러를 거쳐 Firebase에
+    나중에 도착한다. 클라우드 스냅샷의 updated_at이 로컬 변경 시각보다 나중이면 (다른 게이트웨이/LAN
+    클라이언트의 더 나중 쓰기) 클라우드 값을 따르고, 그렇지 않으면 (재연결 스냅샷, 늦게 온 이벤트,
+    updated_at을 쓰지 않는 앱의 쓰기) 로컬 쓰기가 Firebase에 도착하면 덮어쓸 값이므로 로컬 값을 유지한다.
+    같은 값이 보이면 확인된 것으로 지운다. 쓰기가 유실되어 에코가 오지 않는 경우를 위해, 연결된 상태에서
+    hold초가 지나면 클라우드 값으로 돌아간다.
+    """
+
+    def __init__(self, hold=LOCAL_CONTROL_HOLD):
+        self.hold = hold
+        self._lock = threading.Lock()
+        self._pending = {}  # control 기준 상대 경로 -> [값, 변경 시각 (ms), 만료 시각 (오프라인에서 쓴 값은 None)]
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, changes, connected, updated_at, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for path, value in changes.items():
+                self._pending[path] = [value, updated_at, now + self.hold if connected else None]
+
+    def reconcile(self, control, connected, now=None):
+        """클라우드 control 스냅샷에 덮어써야 할 로컬 값 {상대 경로: 값}을 반환."""
+        now = time.monotonic() if now is None else now
+        remote_at = control.get('updated_at')
+        if isinstance(remote_at, bool) or not isinstance(remote_at, (int, float)):
+            remote_at = None
+        overlay = {}
+        with self._lock:
+            for path, entry in list(self._pending.items()):
+                value, updated_at, deadline = entry
+                remote = control
+                for key in path.split('/'):
+                    remote = remote.get(key) if isinstance(remote, dict) else None
+                if remote == value:
+                    del self._pending[path]  # Firebase에 반영됨
+                elif remote_at is not None and remote_at > updated_at:
+                    del self._pending[path]  # 클라우드 쪽 쓰기가 더 나중
+                elif deadline is not None and now >= deadline:
+                    del self._pending[path]  # 에코 없이 시간이 지남 (쓰기 유실): 클라우드 값을 따름
+                else:
+                    if deadline is None and connected:
+                        entry[2] = now + self.hold  # 재연결 후 outbox가 보내질 때까지 유지
+                    overlay[path] = value
+        return overlay
+
+def record_local_control(dev, changes):
+    """로컬에서 적용한 control 변경({상대 경로: 값})을 미러·설정 파일에 반영하고 Firebase로 보낸다.
+
+    control/updated_at에 변경 시각(ms)을 함께 기록하며, 쓰기 스케줄러가 즉시 전송한다 (오프라인이면 outbox).
+    """
+    if not dev.control_mirror.snapshot() and dev.config_data.get('last_control_state'):
+        # 클라우드 스냅샷을 아직 못 받았으면 저장된 상태를 기준으로 부분 변경을 합침
+        dev.control_mirror.apply_event('put', '/', dev.config_data['last_control_state'])
+    updated_at = int(time.time() * 1000)
+    dev.control_mirror.apply_event('patch', '/', dict(changes, updated_at=updated_at))
+    dev.local_overrides.add(changes, firebase_is_connected, updated_at)
+    full_control = dev.control_mirror.snapshot() or {}
+    dev.config_data['last_control_state'] = full_control
+    save_config_to_file(dev)
+    updates = {f'{dev.path}/control/{path}': value for path, value in changes.items()}
+    updates[f'{dev.path}/control/updated_at'] = updated_at
+    write_scheduler.submit(updates, PRIORITY_CONTROL)
+    return full_control
+
+def apply_local_control(dev, changes):
+    """LAN 요청의 control 변경을 아두이노에 바로 쓰고, Firebase에는 비동기로 반영."""
+    full_control = record_local_control(dev, changes)
+    dev.command_channel.set_control(full_control)
+    pump_commands(dev)
+    metrics.inc('local.control_changes')
+    return full_control
+
+def run_preset_schedule(dev, now=None):
+    """예약 시각이 지났으면 해당 프리셋으로 전환. 전환했으면 True."""
+    schedule = dev.preset_schedule
+    if schedule is None:
+        return False
+    preset_id = schedule.due(now or datetime.datetime.now())
+    if preset_id is None:
+        return False
+    control_log.info("%s⏰ 예약된 프리셋 '%s' 적용", dev.tag, preset_id)
+    return switch_preset(dev, preset_id)
 
 # --- 4. 아두이노 통신 (백그라운드 스레드) ---
-def arduino_thread_worker():
-    global arduino, config_data
-    
-    last_resend_time = 0
-    RESEND_INTERVAL = 3
+class SensorRing:
+    """센서 하나의 고정 크기 이력 (array 기반 링 버퍼).
+
+    새 값마다 최근 median_window개의 중앙값과 비교해 spike_threshold 이상 튀는 값은 중앙값으로
+    대체(스파이크 제거)하고, 범위를 벗어난 값은 버린다. 필터를 거친 값으로 창 내 평균(누적 합),
+    최소/최대(단조 큐)를 O(1)로 갱신하며 EMA도 함께 유지한다. 프레임마다 리스트/딕셔너리를
+    새로 만들지 않는다.
+    """
+
+    __slots__ = ('capacity', 'values', 'pos', 'count', 'seq', 'total',
+                 'min_vals', 'min_seqs', 'min_head', 'min_len',
+                 'max_vals', 'max_seqs', 'max_head', 'max_len',
+                 'raw', 'raw_pos', 'raw_len', 'scratch', 'spike_threshold', 'valid_range',
+                 'alpha', 'ema', 'last', 'spikes', 'rejected')
+
+    def __init__(self, capacity=SENSOR_HISTORY_SIZE, median_window=SENSOR_MEDIAN_WINDOW,
+                 spike_threshold=SENSOR_SPIKE_THRESHOLD, alpha=SENSOR_EMA_ALPHA, valid_range=SENSOR_VALID_RANGE):
+        self.capacity = capacity
+        self.values = array('d', bytes(8 * capacity))
+        self.pos = 0
+        self.count = 0
+        self.seq = 0        # 지금까지 받은 (필터 통과) 표본 수
+        self.total = 0.0
+        self.min_vals = array('d', bytes(8 * capacity))
+        self.min_seqs = array('q', bytes(8 * capacity))
+        self.min_head = self.min_len = 0
+        self.max_vals = array('d', bytes(8 * capacity))
+        self.max_seqs = array('q', bytes(8 * capacity))
+        self.max_head = self.max_len = 0
+        self.raw = array('d', bytes(8 * median_window))
+        self.raw_pos = self.raw_len = 0
+        self.scratch = array('d', bytes(8 * median_window))
+        self.spike_threshold = spike_threshold
+        self.valid_range = valid_range
+        self.alpha = alpha
+        self.ema = None
+        self.last = None
+        self.spikes = 0
+        self.rejected = 0
+
+    def _median(self):
+        n = self.raw_len
+        s = self.scratch
+        # 창이 작으므로 미리 만든 배열에서 삽입 정렬
+        for i in range(n):
+            v = self.raw[i]
+            j = i - 1
+            while j >= 0 and s[j] > v:
+                s[j + 1] = s[j]
+                j -= 1
+            s[j + 1] = v
+        return s[n // 2] if n % 2 else (s[n // 2 - 1] + s[n // 2]) / 2
+
+    def add(self, value):
+        """원시 값 하나를 추가하고 필터를 거친 값을 반환. 범위를 벗어나면 None."""
+        lo, hi = self.valid_range
+        if not lo <= value <= hi:
+            self.rejected += 1
+            return None
+        filtered = value
+        if self.raw_len >= 3:
+            median = self._median()
+            if abs(value - median) > self.spike_threshold:
+                self.spikes += 1
+                filtered = median
+        raw = self.raw
+        raw[self.raw_pos] = value  # 원시 값은 그대로 남겨 실제 변화가 계속되면 중앙값이 따라감
+        self.raw_pos = (self.raw_pos + 1) % len(raw)
+        if self.raw_len < len(raw):
+            self.raw_len += 1
+
+        cap = self.capacity
+        seq = self.seq
+        if self.count == cap:
+            self.total -= self.values[self.pos]
+        else:
+            self.count += 1
+        self.values[self.pos] = filtered
+        self.pos = (self.pos + 1) % cap
+        self.total += filtered
+        if seq % cap == cap - 1:
+            self.total = sum(self.values)  # 부동소수 누적 오차 정리 (빈 칸은 0)
+        self.seq = seq + 1
+        oldest = seq + 1 - cap  # 이보다 작은 seq는 창 밖
+
+        # 최소값 단조 큐: 앞에서 창 밖 값을 빼고, 뒤에서 새 값보다 큰 값을 뺀 뒤 추가
+        while self.min_len and self.min_seqs[self.min_head] < oldest:
+            self.min_head = (self.min_head + 1) % cap
+            self.min_len -= 1
+        while self.min_len and self.min_vals[(self.min_head + self.min_len - 1) % cap] >= filtered:
+            self.min_len -= 1
+        idx = (self.min_head + self.min_len) % cap
+        self.min_vals[idx] = filtered
+        self.min_seqs[idx] = seq
+        self.min_len += 1
+
+        while self.max_len and self.max_seqs[self.max_head] < oldest:
+            self.max_head = (self.max_head + 1) % cap
+            self.max_len -= 1
+        while self.max_len and self.max_vals[(self.max_head + self.max_len - 1) % cap] <= filtered:
+            self.max_len -= 1
+        idx = (self.max_head + self.max_len) % cap
+        self.max_vals[idx] = filtered
+        self.max_seqs[idx] = seq
+        self.max_len += 1
+
+        self.ema = filtered if self.ema is None else self.ema + self.alpha * (filtered - self.ema)
+        self.last = filtered
+        return filtered
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def min(self):
+        return self.min_vals[self.min_head] if self.count else None
+
+    def max(self):
+        return self.max_vals[self.max_head] if self.count else None
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {'last': self.last, 'ema': round(self.ema, 2), 'mean': round(self.mean(), 2),
+                'min': self.min(), 'max': self.max(), 'count': self.count,
+                'spikes': self.spikes, 'rejected': self.rejected}
+
+class SensorStore:
+    """sensors_config의 센서 수만큼 SensorRing을 두고, 프레임 단위로 값을 넣는다.
+
+    센서 순서는 sensors_config 키(sensor_01, sensor_02 ...)의 정렬 순서이며 아두이노 값 순서와 같다.
+    """
+
+    def __init__(self, sensor_ids, capacity=SENSOR_HISTORY_SIZE):
+        self.ids = list(sensor_ids)
+        self.rings = [SensorRing(capacity) for _ in self.ids]
+        self.status_paths = [f'sensors/{sensor_id}/temp' for sensor_id in self.ids]
+        self.frames = 0
+
+    @classmethod
+    def from_config(cls, config_data):
+        sensor_ids = sorted(config_data.get('sensors_config') or {})
+        if not sensor_ids:
+            sensor_ids = [f'sensor_{i:02d}' for i in range(1, DEFAULT_SENSOR_COUNT + 1)]
+        return cls(sensor_ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_frame(self, values):
+        """센서 값 목록을 추가. 개수가 맞지 않으면 False."""
+        if len(values) != len(self.rings):
+            return False
+        for ring, value in zip(self.rings, values):
+            ring.add(value)
+        self.frames += 1
+        return True
+
+    def current_average(self):
+        """센서별 최신 필터 값의 평균. 값이 없으면 None."""
+        total = 0.0
+        n = 0
+        for ring in self.rings:
+            if ring.last is not None:
+                total += ring.last
+                n += 1
+        return total / n if n else None
+
+    def summary(self):
+        return {sensor_id: ring.summary() for sensor_id, ring in zip(self.ids, self.rings)}
+
+class TelemetryUploader:
+    """status 업로드용 델타/데드밴드 필터.
+
+    마지막으로 업로드한 값을 경로별로 기억해 두고, 데드밴드 이상 변한 경로만 골라낸다.
+    최소 업로드 간격을 지키며, max_staleness마다 한 번은 전체 값을 강제로 다시 쓴다.
+    """
+
+    def __init__(self, deadband=TELEMETRY_DEADBAND, min_interval=TELEMETRY_MIN_INTERVAL,
+                 max_staleness=TELEMETRY_MAX_STALENESS):
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.max_staleness = max_staleness
+        self._published = {}          # path -> 마지막 업로드 값
+        self._last_publish_time = None
+        self._last_full_time = None
+        self._full_pending = False
+
+    def _changed(self, path, value):
+        if path not in self._published:
+            return True
+        old = self._published[path]
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+            return abs(value - old) >= self.deadband
+        return value != old
+
+    def due(self, now=None):
+        """최소 업로드 간격이 지났는지 (업로드 값을 만들기 전에 확인용)."""
+        now = time.monotonic() if now is None else now
+        return self._last_publish_time is None or now - self._last_publish_time >= self.min_interval
+
+    def build_update(self, values, now=None):
+        """업로드할 {path: value}를 반환. 보낼 것이 없으면 None."""
+        now = time.monotonic() if now is None else now
+        if not self.due(now):
+            return None
+
+        self._full_pending = self._last_full_time is None or now - self._last_full_time >= self.max_staleness
+        if self._full_pending:
+            return dict(values)
+
+        updates = {path: value for path, value in values.items() if self._changed(path, value)}
+        return updates or None
+
+    def invalidate(self):
+        """업로드했다고 기록한 값이 클라우드에 반영되지 않았을 수 있을 때 호출. 다음 업로드는 전체 값."""
+        self._last_full_time = None
+
+    def mark_published(self, updates, now=None):
+        """업로드 값을 쓰기 스케줄러에 넘길 때 호출 (쓰기 완료를 기다리지 않음).
+
+        이후 전달은 write_or_enqueue/오프라인 큐가 책임지며, 값이 유실됐을 수 있으면 invalidate()로
+        다음 업로드를 전체 값으로 만든다. 호출하지 않은 변경은 다음 프레임에서 다시 나온다.
+        """
+        now = time.monotonic() if now is None else now
+        self._published.update(updates)
+        self._last_publish_time = now
+        if self._full_pending:
+            self._last_full_time = now
+            self._full_pending = False
+
+class PresetBook:
+    """presets 미러와, 프리셋마다 미리 변환해 둔 그룹별 명령 상태.
+
+    리스너 이벤트로 바뀐 부분만 미러에 반영하고 그때 다시 변환해 두므로, 프리셋 전환은 파싱이나
+    클라우드 조회 없이 명령 채널에 상태를 넣는 것으로 끝난다. SEQ/CRC를 뺀 명령 프레임도
+    command_payload 캐시에 미리 만들어 둔다.
+    """
+
+    def __init__(self, presets=None):
+        self.mirror = TreeMirror()
+        self.compiled = {}  # preset_id -> {group: (mode, temp)}
+        self.load(presets)
+
+    def load(self, presets):
+        if presets:
+            self.mirror.apply_event('put', '/', presets)
+        self._compile()
+
+    def apply_event(self, event):
+        """리스너 이벤트를 반영하고 전체 프리셋 사본을 반환."""
+        self.mirror.apply_event(event.event_type, event.path, event.data)
+        return self._compile()
+
+    def _compile(self):
+        presets = self.mirror.snapshot() or {}
+        compiled = {}
+        for preset_id, preset in presets.items():
+            if not isinstance(preset, dict):
+                continue
+            compiled[preset_id] = targets = compile_control(preset)
+            for group, (mode, temp) in targets.items():
+                for protocol in ('text', 'binary'):
+                    command_payload(group, mode, temp, protocol)
+        self.compiled = compiled
+        return presets
+
+class PresetSchedule:
+    """config.json 'preset_schedule'의 시각별 프리셋 전환 (라즈베리파이 로컬 시계 기준, 오프라인 동작).
+
+    형식: [{"at": "07:00", "preset": "preset_1", "days": [0, 1, 2, 3, 4]}, ...] (days는 선택, 0=월요일)
+    실행 중에 지나간 시각만 적용하며, 시작 전에 지난 항목은 적용하지 않는다 (저장된 제어 상태 유지).
+    """
+
+    def __init__(self, entries):
+        self.entries = sorted(entries)  # (분, preset_id, 요일 집합 또는 None)
+        self._last_check = None
+
+    @classmethod
+    def from_config(cls, config_data):
+        entries = []
+        for item in config_data.get('preset_schedule') or []:
+            try:
+                hour, minute = (int(part) for part in item['at'].split(':'))
+                if not (0 <= hour < 24 and 0 <= minute < 60):
+                    raise ValueError(item['at'])
+                days = frozenset(item['days']) if item.get('days') is not None else None
+                entries.append((hour * 60 + minute, item['preset'], days))
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                control_log.warning("⚠️ 잘못된 preset_schedule 항목을 건너뜁니다: %s (%s)", item, e)
+        return cls(entries) if entries else None
+
+    def due(self, now):
+        """직전 확인 이후 지나간 예약 중 가장 늦은 항목의 프리셋. 없으면 None."""
+        last, self._last_check = self._last_check, now
+        if last is None or now <= last:
+            return None
+        found = None
+        day = max(last.date(), now.date() - datetime.timedelta(days=1))  # 시계가 크게 바뀌어도 최근 하루만 확인
+        while day <= now.date():
+            for minutes, preset_id, days in self.entries:
+                if days is not None and day.weekday() not in days:
+                    continue
+                at = datetime.datetime.combine(day, datetime.time(minutes // 60, minutes % 60))
+                if last < at <= now and (found is None or at > found[0]):
+                    found = (at, preset_id)
+            day += datetime.timedelta(days=1)
+        return found[1] if found else None
+
+class EdgeController:
+    """측정 온도로 그룹별 명령 설정값을 보정하는 외부 PI 루프 (오프라인에서도 동작).
+
+    아두이노는 자체 P 제어로 목표 온도를 따라가지만 정상 상태 오차가 남는다. 일정 주기(tick)마다
+    그룹 센서의 EMA 평균과 미러링된 target_temp의 차이를 적분해 보정값(trim)을 만들고, 명령
+    채널에는 target + trim을 보낸다. 오차가 deadband 안이면 보정값을 유지하며(히스테리시스),
+    보정값은 ±limit로 제한하고 포화된 방향으로는 적분하지 않는다. 모드/목표가 바뀌면 초기화한다.
+    """
+
+    def __init__(self, group_sensors=EDGE_GROUP_SENSORS, kp=EDGE_KP, ki=EDGE_KI,
+                 limit=EDGE_TRIM_LIMIT, deadband=EDGE_DEADBAND):
+        self.group_sensors = group_sensors
+        self.kp = kp
+        self.ki = ki
+        self.limit = limit
+        self.deadband = deadband
+        self._integral = {}
+        self._reference = {}
+        self._indices = None
+        self._store = None
+        self.state = {}  # group -> {'measured', 'target', 'trim'} (지표용)
+
+    @classmethod
+    def from_config(cls, config_data):
+        """config.json의 'edge_control'로 설정을 덮어쓴다. enabled가 false면 None."""
+        options = config_data.get('edge_control', {})
+        if not options.get('enabled', EDGE_CONTROL_ENABLED):
+            return None
+        return cls(group_sensors=options.get('group_sensors', EDGE_GROUP_SENSORS),
+                   kp=options.get('kp', EDGE_KP), ki=options.get('ki', EDGE_KI),
+                   limit=options.get('limit', EDGE_TRIM_LIMIT), deadband=options.get('deadband', EDGE_DEADBAND))
+
+    def _group_rings(self, store):
+        if self._store is not store:
+            index = {sensor_id: ring for sensor_id, ring in zip(store.ids, store.rings)}
+            self._indices = {group_key: [index[s] for s in sensor_ids if s in index]
+                             for group_key, sensor_ids in self.group_sensors.items()}
+            self._store = store
+        return self._indices
+
+    def tick(self, store, channel, dt):
+        rings_by_group = self._group_rings(store)
+        for group, group_key in GROUP_CHANNELS.items():
+            reference = channel.target(group)
+            total, n = 0.0, 0
+            for ring in rings_by_group.get(group_key, ()):
+                if ring.ema is not None:
+                    total += ring.ema
+                    n += 1
+            if reference != self._reference.get(group):
+                self._reference[group] = reference
+                self._integral[group] = 0.0
+            if reference is None or reference[0] == 'OFF' or not n:
+                channel.set_trim(group, 0)
+                self.state.pop(group_key, None)
+                continue
+
+            target = float(reference[1])
+            measured = total / n
+            error = measured - target
+            if abs(error) < self.deadband:
+                error = 0.0
+            integral = self._integral[group] + error * dt
+            trim = -(self.kp * error + self.ki * integral)
+            if -self.limit < trim < self.limit:
+                self._integral[group] = integral
+            else:
+                trim = max(-self.limit, min(self.limit, trim))
+            channel.set_trim(group, trim)
+            self.state[group_key] = {'measured': round(measured, 2), 'target': target, 'trim': round(trim, 2) + 0.0}
+
+def edge_control_tick(dev, dt=EDGE_CONTROL_INTERVAL):
+    """기기의 외부 제어 루프를 한 번 실행 (제어기가 꺼져 있으면 아무것도 하지 않음)."""
+    if dev.edge is None:
+        return
+    with metrics.timer('edge.tick'):
+        dev.edge.tick(dev.sensors, dev.command_channel, dt)
+
+def pump_commands(dev):
+    """아두이노가 연결되어 있으면 명령 채널의 대기 중인 명령을 전송."""
+    port = dev.arduino
+    if port and port.is_open:
+        dev.command_channel.pump(port)
+
+def open_serial_port(dev):
+    return serial.Serial(dev.port_name, BAUD_RATE, timeout=SERIAL_READ_TIMEOUT, write_timeout=0)
+
+def wait_for_serial_ready(port, timeout=None):
+    """포트를 연 뒤 아두이노 스케치가 첫 데이터를 보낼 때까지 (최대 timeout초) 대기.
+
+    포트를 열면 아두이노가 리셋되고 부트로더가 도는 동안 보낸 바이트는 버려지므로 기다려야 하지만,
+    고정 시간 대신 스케치가 살아난 것을 확인하는 즉시 진행한다. 데이터가 오면 True.
+    """
+    port.reset_input_buffer()  # 리셋 이전에 버퍼에 남은 바이트로 오판하지 않도록
+    deadline = time.monotonic() + (SERIAL_SETTLE_TIME if timeout is None else timeout)
+    while time.monotonic() < deadline:
+        if port.in_waiting:
+            return True
+        time.sleep(0.02)
+    return False
+
+def start_serial_session(dev, port):
+    """포트 안정화(wait_for_serial_ready) 이후 호출. 버퍼 정리, 프로토콜 협상 후 명령을 재동기화하고 리더를 반환."""
+    startup.mark(f'{dev.device_id}.serial_ready', dev.tag)
+    port.reset_input_buffer()
+    port.reset_output_buffer()
+    # 새 연결마다 프로토콜 협상 (협상 전에는 텍스트로 명령 전송)
+    channel = dev.command_channel
+    channel.protocol = 'text'
+    reader = SerialFrameReader(port, tracer=tracer, trace_id=dev.device_id, sensor_count=len(dev.sensors))
+    channel.protocol = reader.negotiate()
+    serial_log.info("%s🔗 시리얼 프로토콜: %s", dev.tag, channel.protocol)
+    if tracer is not None:
+        tracer.record(TRACE_SESSION, dev.device_id, channel.protocol.encode())
+    # 아두이노가 리셋됐을 수 있으므로 현재 상태(시작 직후라면 저장된 상태)를 바로 다시 보냄
+    channel.reset()
+    if channel.pump(port):
+        startup.mark(f'{dev.device_id}.first_command', dev.tag)
+    dev.reader = reader
+    return reader
+
+def close_arduino(dev):
+    if dev.arduino:
+        try: dev.arduino.close()
+        except: pass
+    dev.arduino = None
+
+def process_serial_frames(dev, reader):
+    """리더에 쌓인 프레임을 처리하고, 업로드할 status 쓰기({절대 경로: 값})를 반환. 없으면 None."""
+    # 쌓여있던 것 중 가장 최신 것 하나만 처리 (파이어베이스 부하 감소)
+    with metrics.timer('serial.parse'):
+        parts = reader.latest_sensor_frame()
+    applied = {}
+    for group, seq in reader.pop_acks():
+        state = dev.command_channel.on_ack(group, seq)
+        if state is not None:
+            # 앱이 실제로 적용된 설정값(로컬 보정 포함)을 볼 수 있도록 제어 ACK를 먼저 업로드
+            applied[f'{dev.path}/status/applied/{GROUP_CHANNELS[group]}'] = {
+                'mode': state[0].lower(), 'target_temp': state[1], 'at': int(time.time() * 1000)}
+    if applied:
+        write_scheduler.submit(applied, PRIORITY_CONTROL)
+    if not parts:
+        return None
+
+    # [RX]는 프레임마다 호출되므로 레벨을 먼저 확인하고, 출력량은 LOGGING_SAMPLE_LIMITS로 제한 (분당 N개)
+    if rx_log.isEnabledFor(logging.INFO):
+        rx_log.info("%s[RX] SENSORS:%s", dev.tag, ','.join(f'{p:g}' for p in parts))
+    store = dev.sensors
+    if not store.add_frame(parts):
+        dev.counters['frames_mismatched'] += 1
+        return None
+    if dev.history is not None:
+        dev.history.append(parts)  # 필터 전 원본 값을 전체 속도로 보관
+    if dev.feed.active:
+        dev.feed.publish({'t': int(time.time() * 1000),
+                          'sensors': {sensor_id: round(ring.last, 2)
+                                      for sensor_id, ring in zip(store.ids, store.rings) if ring.last is not None}})
+    dev.counters['frames_processed'] += 1
+    dev.log_aggregator.add_store(store)
+
+    # 업로드 간격이 되지 않았으면 업로드 값을 만들지 않음
+    now = time.monotonic()
+    if not dev.telemetry.due(now):
+        return None
+    avg_temp = store.current_average()
+    if avg_temp is None:
+        return None
+
+    # 앱이 정수(Long)로 읽으므로 필터를 거친 값을 반올림해서 업로드
+    values = {'current_temp': round(avg_temp)}
+    for path, ring in zip(store.status_paths, store.rings):
+        if ring.last is not None:
+            values[path] = round(ring.last)
     
+    # 데드밴드를 넘은 경로만 업로드
+    updates = dev.telemetry.build_update(values, now)
+    if not updates:
+        return None
+    # 제출 시점에 기록: 실패한 쓰기는 오프라인 큐가 재전송하므로 같은 델타를 다시 만들지 않음
+    dev.telemetry.mark_published(updates, now)
+    dev.counters['status_writes'] += 1
+    return {f'{dev.path}/status/{path}': value for path, value in updates.items()}
+
+def arduino_thread_worker(dev):
     last_data_received_time = time.time()
-    DATA_TIMEOUT = 15 
+    reader = None
+    next_edge_tick = time.monotonic() + EDGE_CONTROL_INTERVAL
+    next_schedule_check = time.monotonic()
 
-    print("🔌 아두이노 스레드 시작됨")
+    serial_log.info("%s🔌 아두이노 스레드 시작됨", dev.tag)
 
+    health = dev.serial_health
     while main_loop_running:
         try:
-            # 1. 연결 확인 및 재연결 로직
-            if arduino is None or not arduino.is_open:
-                print("🔄 아두이노 연결 시도 중...")
+            # 1. 연결 확인 및 재연결 로직 (지수 백오프 + jitter)
+            if dev.arduino is None or not dev.arduino.is_open:
+                if health.connected:
+                    health.disconnect('포트 닫힘')
+                if not health.should_attempt():
+                    time.sleep(min(1.0, max(health.retry_in(), SERIAL_READ_TIMEOUT)))
+                    continue
+                serial_log.info("%s🔄 아두이노 연결 시도 중...", dev.tag)
                 try:
-                    arduino = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=0, write_timeout=0)
-                    time.sleep(2) 
-                    arduino.reset_input_buffer()
-                    arduino.reset_output_buffer()
-                    print(f"✅ 아두이노 연결 성공 ({ARDUINO_PORT})")
-                    last_data_received_time = time.time() 
-                except serial.SerialException as e:
-                    print(f"⚠️ 연결 실패: {e}")
-                    time.sleep(3)
+                    dev.arduino = open_serial_port(dev)
+                    wait_for_serial_ready(dev.arduino)
+                    serial_log.info("%s✅ 아두이노 연결 성공 (%s)", dev.tag, dev.port_name)
+                except (serial.SerialException, OSError) as e:
+                    # 포트는 열렸지만 대기 중 실패했으면 반쯤 초기화된 포트로 세션을 시작하지 않도록 닫음
+                    close_arduino(dev)
+                    health.record_failure(e)
+                    serial_log.warning("%s⚠️ 연결 실패: %s (%.1f초 후 재시도)", dev.tag, e, health.retry_in())
                     continue
+            if reader is None or reader.port is not dev.arduino:
+                reader = start_serial_session(dev, dev.arduino)
+                dev.counters['serial_reconnects'] += 1
+                metrics.inc('serial.sessions')
+                last_data_received_time = time.time()
+                next_edge_tick = time.monotonic() + EDGE_CONTROL_INTERVAL  # 새 측정값이 들어온 뒤 첫 보정
 
             # 2. 수신 감시 (Watchdog)
-            if time.time() - last_data_received_time > DATA_TIMEOUT:
-                print(f"🚨 {DATA_TIMEOUT}초간 데이터 없음! 연결 재설정...")
-                try:
-                    arduino.close()
-                except:
-                    pass
-                arduino = None 
-                time.sleep(1)
+            silence = time.time() - last_data_received_time
+            if silence > DATA_TIMEOUT:
+                serial_log.error("%s🚨 %d초간 데이터 없음! 연결 재설정...", dev.tag, DATA_TIMEOUT)
+                close_arduino(dev)
+                health.disconnect('수신 없음')
                 continue
+            if silence > SERIAL_DEGRADED_TIMEOUT and health.degrade('수신 없음'):
+                # half-open 프로브: 명령을 다시 보내 펌웨어가 응답(ACK/프레임)하는지 확인
+                dev.command_channel.reset()
+
+            # 3. 로컬 제어 루프 (고정 주기, 클라우드 연결과 무관)
+            # 연결이 끊겼거나 루프가 밀렸다면 밀린 주기를 몰아서 실행하지 않도록 현재 시각 기준으로 다시 잡음
+            now = time.monotonic()
+            if now >= next_edge_tick:
+                next_edge_tick = now + EDGE_CONTROL_INTERVAL
+                edge_control_tick(dev)
+            if now >= next_schedule_check:
+                next_schedule_check = now + PRESET_SCHEDULE_INTERVAL
+                run_preset_schedule(dev)
 
-            # 3. 상태 재전송 (동기화)
-            if firebase_is_connected and (time.time() - last_resend_time > RESEND_INTERVAL):
+            # 4. 명령 전송 - 변경된 그룹과 ACK가 오지 않은 명령만 (백오프 재전송)
+            dev.command_channel.pump(dev.arduino)
+
+            # 5. 데이터 수신 로직
+            # 데이터가 올 때까지 최대 SERIAL_READ_TIMEOUT 동안 대기 (별도 sleep 없음)
+            if reader.fill() > 0:
+                last_data_received_time = time.time() # 시간 갱신
+                health.record_success()
                 try:
-                    control_ref = db.reference(f'devices/{device_id}/control', app=firebase_app)
-                    current_state = control_ref.get()
-                    if current_state:
-                        mode = current_state.get('global_mode', 'off').upper()
-                        g1_node = current_state.get('groups', {}).get('group_1', {})
-                        g2_node = current_state.get('groups', {}).get('group_2', {})
-                        
-                        t1 = g1_node.get('target_temp', 24)
-                        t2 = g2_node.get('target_temp', 24)
-                        
-                        cmd_a = f"CMD:A:{mode}:{t1}\n"
-                        cmd_b = f"CMD:B:{mode}:{t2}\n"
-                        
-                        arduino.write(cmd_a.encode())
-                        time.sleep(0.01) # 딜레이 최소화
-                        arduino.write(cmd_b.encode())
-                    last_resend_time = time.time()
+                    with metrics.timer('serial.process'):
+                        updates = process_serial_frames(dev, reader)
+                    if updates:
+                        submit_status(updates)
                 except Exception as e:
-                    print(f"통신 동기화 경고: {e}")
+                    serial_log.exception("%s데이터 처리 오류: %s", dev.tag, e)
 
-            # 4. 데이터 수신 로직
-            # while 루프를 써서 쌓인 데이터를 싹 다 읽어버림
-            if arduino.in_waiting > 0:
-                last_data_received_time = time.time() # 시간 갱신
-                
-                # 가장 최근 데이터만 남기기 위한 변수
-                last_valid_line = None
-                
-                # 버퍼에 있는 모든 줄을 읽음
-                while arduino.in_waiting > 0:
+        except Exception as e:
+            serial_log.warning("%s⚠️ 스레드 예외: %s", dev.tag, e)
+            close_arduino(dev)
+            health.disconnect(e)
+
+# --- 5. asyncio 런타임 ---
+class AsyncRuntime:
+    """스레드 대신 하나의 이벤트 루프에서 동작하는 런타임 (--runtime asyncio).
+
+    시리얼 수신은 loop.add_reader로 처리하고, 하트비트/로그/명령 재전송은 데드라인 기반 태스크로
+    실행한다. 블로킹 Firebase SDK 호출은 크기가 제한된 executor에서 실행하며, SDK 스레드에서
+    호출되는 리스너 콜백은 call_soon_threadsafe로 루프에 전달한다. 기기마다 시리얼 태스크가
+    하나씩 생기고 executor와 status 업로드는 모든 기기가 공유한다.
+    """
+
+    def __init__(self, targets, max_workers=ASYNC_EXECUTOR_WORKERS):
+        self.devices = list(targets)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cloud-io')
+        self.loop = None
+        self._stop = None
+        self._wake = {}                # 기기별: 새 명령이 생겼을 때 시리얼 세션을 깨움
+        self._control_events = None
+
+    async def _offload(self, fn, *args):
+        return await self.loop.run_in_executor(self.executor, fn, *args)
+
+    # Firebase SDK 스레드에서 호출됨
+    def _on_control_event(self, dev, event):
+        self.loop.call_soon_threadsafe(self._control_events.put_nowait, (dev, event))
+
+    async def _control_task(self):
+        while True:
+            dev, event = await self._control_events.get()
+            control_listener(dev, event)
+            self._wake[dev].set()
+
+    async def _cloud_task(self):
+        while True:
+            if not firebase_is_connected:
+                if cloud_health.should_attempt():
+                    await self._offload(connect_firebase, self.devices, self._on_control_event)
+                else:
+                    await asyncio.sleep(max(cloud_health.retry_in(), 0.1))
+                continue
+            if outbox is not None and len(outbox):
+                await self._offload(drain_outbox)
+            await asyncio.sleep(1)
+
+    async def _periodic(self, interval, fn, first_delay=0):
+        """interval마다 fn(기기 목록)을 executor에서 실행. 데드라인을 누적해 드리프트가 없다."""
+        deadline = self.loop.time() + first_delay
+        while True:
+            await asyncio.sleep(max(0, deadline - self.loop.time()))
+            await self._offload(fn, self.devices)
+            deadline += interval
+            if deadline < self.loop.time():
+                deadline = self.loop.time()  # 밀린 주기는 건너뜀
+
+    async def _edge_task(self, dev):
+        """기기별 로컬 제어 루프. 이벤트 루프에서 직접 실행하고 (짧은 계산) 시리얼 세션을 깨운다."""
+        while True:
+            await asyncio.sleep(EDGE_CONTROL_INTERVAL)
+            if not dev.serial_health.connected:
+                continue  # 시리얼이 끊긴 동안의 오래된 측정값은 적분하지 않음
+            edge_control_tick(dev)
+            if dev.command_channel.next_deadline() == 0:
+                self._wake[dev].set()
+
+    async def _schedule_task(self):
+        """모든 기기의 프리셋 예약을 PRESET_SCHEDULE_INTERVAL마다 확인 (로컬 시계 기준)."""
+        while True:
+            for dev in self.devices:
+                if run_preset_schedule(dev):
+                    self._wake[dev].set()
+            await asyncio.sleep(PRESET_SCHEDULE_INTERVAL)
+
+    async def _writer_task(self):
+        """쓰기 스케줄러의 틱마다 (제어 쓰기는 즉시) 모인 쓰기를 executor에서 하나의 update()로 전송."""
+        ready = asyncio.Event()
+        write_scheduler.on_submit = lambda: self.loop.call_soon_threadsafe(ready.set)
+        try:
+            while True:
+                delay = write_scheduler.next_delay()
+                if delay is None or delay > 0:
                     try:
-                        raw = arduino.readline()
-                        decoded = raw.decode('utf-8', errors='ignore').strip()
-                        if decoded.startswith("SENSORS:"):
-                            last_valid_line = decoded
-                    except:
+                        await asyncio.wait_for(ready.wait(), delay)  # 제어 쓰기가 오면 일찍 깨어남
+                    except asyncio.TimeoutError:
                         pass
-                
-                # 쌓여있던 것 중 가장 최신 것 하나만 처리 (파이어베이스 부하 감소)
-                if last_valid_line and firebase_is_connected:
-                    try:
-                        # [RX] 로그는 너무 많으면 주석 처리
-                        print(f"[RX] {last_valid_line}")
-                        
-                        parts = last_valid_line.split(":")[1].split(",")
-                        if len(parts) == 5:
-                            temps = [int(float(p)) for p in parts]
-                            avg_temp = sum(temps) // 5
-                            
-                            updates = {'current_temp': avg_temp}
-                            for i in range(5):
-                                sensor_key = f'sensor_{i+1:02d}'
-                                updates[f'sensors/{sensor_key}/temp'] = temps[i]
-                            
-                            db.reference(f'devices/{device_id}/status', app=firebase_app).update(updates)
-                    except Exception as e:
-                        print(f"데이터 처리 오류: {e}")
+                    ready.clear()
+                    continue
+                await self._offload(write_scheduler.flush)
+        finally:
+            write_scheduler.on_submit = None
 
-        except Exception as e:
-            print(f"⚠️ 스레드 예외: {e}")
-            if arduino:
-                try: arduino.close()
-                except: pass
-            arduino = None
-            time.sleep(5)
-        
-        time.sleep(0.1)
+    async def _serial_task(self, dev):
+        health = dev.serial_health
+        while True:
+            if dev.arduino is None or not dev.arduino.is_open:
+                if health.connected:
+                    health.disconnect('포트 닫힘')
+                if not health.should_attempt():
+                    await asyncio.sleep(max(health.retry_in(), 0.05))
+                    continue
+                serial_log.info("%s🔄 아두이노 연결 시도 중...", dev.tag)
+                try:
+                    dev.arduino = await self._offload(open_serial_port, dev)
+                    await self._offload(wait_for_serial_ready, dev.arduino)
+                except (serial.SerialException, OSError) as e:
+                    # 포트는 열렸지만 대기 중 실패했으면 반쯤 초기화된 포트로 세션을 시작하지 않도록 닫음
+                    close_arduino(dev)
+                    health.record_failure(e)
+                    serial_log.warning("%s⚠️ 연결 실패: %s (%.1f초 후 재시도)", dev.tag, e, health.retry_in())
+                    continue
+                serial_log.info("%s✅ 아두이노 연결 성공 (%s)", dev.tag, dev.port_name)
+            try:
+                reader = await self._offload(start_serial_session, dev, dev.arduino)
+                dev.counters['serial_reconnects'] += 1
+                metrics.inc('serial.sessions')
+                await self._serial_session(dev, dev.arduino, reader)
+            except Exception as e:
+                serial_log.warning("%s⚠️ 시리얼 태스크 예외: %s", dev.tag, e)
+            close_arduino(dev)
+            health.disconnect('세션 종료')
 
-# --- 5. 프로그램 종료 처리 ---
+    async def _serial_session(self, dev, port, reader):
+        """연결이 끊기거나 워치독이 만료될 때까지 수신 처리와 명령 재전송을 수행."""
+        fd = port.fileno()
+        lost = self.loop.create_future()
+        last_rx = self.loop.time()
+        channel = dev.command_channel
+        health = dev.serial_health
+        wake_event = self._wake[dev]
+
+        def on_readable():
+            nonlocal last_rx
+            try:
+                received = reader.fill(0)
+            except Exception as e:
+                if not lost.done():
+                    lost.set_exception(e)
+                return
+            if received:
+                last_rx = self.loop.time()
+                health.record_success()
+                try:
+                    with metrics.timer('serial.process'):
+                        updates = process_serial_frames(dev, reader)
+                    if updates:
+                        submit_status(updates)
+                except Exception as e:
+                    serial_log.exception("%s데이터 처리 오류: %s", dev.tag, e)
+
+        self.loop.add_reader(fd, on_readable)
+        try:
+            while True:
+                channel.pump(port)
+                silence = self.loop.time() - last_rx
+                if silence >= DATA_TIMEOUT:
+                    serial_log.error("%s🚨 %d초간 데이터 없음! 연결 재설정...", dev.tag, DATA_TIMEOUT)
+                    health.disconnect('수신 없음')
+                    return
+                if silence >= SERIAL_DEGRADED_TIMEOUT and health.degrade('수신 없음'):
+                    channel.reset()  # half-open 프로브: 명령을 다시 보내 응답을 확인
+                    continue
+                limit = SERIAL_DEGRADED_TIMEOUT if health.state == LinkHealth.CONNECTED else DATA_TIMEOUT
+                wait = limit - silence
+                next_retry = channel.next_deadline()
+                if next_retry is not None:
+                    wait = min(wait, max(0, next_retry - time.monotonic()))
+
+                wake_event.clear()
+                wake = self.loop.create_task(wake_event.wait())
+                try:
+                    await asyncio.wait({lost, wake}, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    wake.cancel()
+                if lost.done():
+                    lost.result()  # 연결 오류를 다시 발생시킴
+        finally:
+            self.loop.remove_reader(fd)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._wake = {dev: asyncio.Event() for dev in self.devices}
+        self._control_events = asyncio.Queue()
+        metrics.gauge('async.control_events', self._control_events.qsize)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        tasks = [self.loop.create_task(self._serial_task(dev), name=f'serial-{dev.device_id}')
+                 for dev in self.devices]
+        tasks += [self.loop.create_task(self._edge_task(dev), name=f'edge-{dev.device_id}')
+                  for dev in self.devices]
+        tasks += [
+            self.loop.create_task(self._cloud_task(), name='cloud'),
+            self.loop.create_task(self._control_task(), name='control'),
+            self.loop.create_task(self._writer_task(), name='writer'),
+            self.loop.create_task(self._schedule_task(), name='preset-schedule'),
+            self.loop.create_task(self._periodic(HEARTBEAT_INTERVAL, send_heartbeat), name='heartbeat'),
+            self.loop.create_task(self._periodic(LOG_INTERVAL, write_log_entry, LOG_INTERVAL), name='log'),
+        ]
+        tasks.append(self.loop.create_task(
+            self._periodic(LOG_COMPACTION_INTERVAL, compact_logs, HEARTBEAT_INTERVAL), name='log-compaction'))
+        tasks.append(self.loop.create_task(
+            self._periodic(METRICS_FILE_INTERVAL, lambda _: write_metrics_file(), METRICS_FILE_INTERVAL), name='metrics'))
+        if len(self.devices) > 1:
+            tasks.append(self.loop.create_task(
+                self._periodic(GATEWAY_STATS_INTERVAL, print_device_metrics, GATEWAY_STATS_INTERVAL), name='stats'))
+        stop_task = self.loop.create_task(self._stop.wait())
+        log.info("⚙️ asyncio 런타임 시작")
+        try:
+            done, _ = await asyncio.wait(tasks + [stop_task], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stop_task and not task.cancelled() and task.exception():
+                    log.error("오류: '%s' 태스크가 예기치 않게 종료되었습니다: %s", task.get_name(), task.exception())
+        finally:
+            for task in tasks + [stop_task]:
+                task.cancel()
+            await asyncio.gather(*tasks, stop_task, return_exceptions=True)
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+# --- 6. 프로그램 종료 처리 ---
 def cleanup():
-    global main_loop_running, listener, arduino
+    global main_loop_running
     if not main_loop_running:
         return  # 이미 종료 절차가 시작되었으면 중복 실행 방지
         
-    print("\n--- 최후의 종료 처리 시작 (atexit) ---")
+    log.info("--- 최후의 종료 처리 시작 (atexit) ---")
     main_loop_running = False # 모든 스레드에 종료 신호
 
-    if listener:
-        try:
-            listener.close()
-        except Exception:
-            pass # 오류가 나도 무시
+    for dev in devices:
+        for listener in (dev.listener, dev.preset_listener):
+            if listener:
+                try:
+                    listener.close()
+                except Exception:
+                    pass # 오류가 나도 무시
 
-    if arduino and arduino.is_open:
-        arduino.close()
+        if dev.arduino and dev.arduino.is_open:
+            dev.arduino.close()
+        dev.config_store.flush()
+        dev.log_rollup.store.flush()
+        if dev._history:
+            dev.history.flush()
     
-    print("--- 종료 처리 완료 ---")
+    log.info("--- 종료 처리 완료 ---")
 
 atexit.register(cleanup)
 
-# --- 6. 메인 로직 ---
-def main():
-    global device_id, config_data, firebase_app, arduino, main_loop_running
+# --- 7. 메인 로직 ---
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='웨어러블 컨트롤러 (Raspberry Pi)')
+    parser.add_argument('--runtime', choices=['threads', 'asyncio'], default=RUNTIME,
+                        help="실행 방식: 'threads'(기본) 또는 'asyncio'")
+    parser.add_argument('--backend', choices=['firebase', 'memory'], default=BACKEND,
+                        help="클라우드 백엔드: 'firebase'(기본) 또는 'memory'(오프라인 테스트/벤치마크용)")
+    parser.add_argument('--cloud-process', action='store_true', default=CLOUD_PROCESS,
+                        help='클라우드 SDK 호출을 별도 워커 프로세스에서 실행 (시리얼 루프와 GIL을 나누지 않음)')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help=f'로컬 지표 엔드포인트 포트 (기본 {METRICS_PORT}, 0이면 비활성화)')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default=LOGGING_LEVEL,
+                        help=f'로그 레벨 (기본 {LOGGING_LEVEL})')
+    parser.add_argument('--log-json', action='store_true', help='로그를 한 줄에 JSON 하나로 출력')
+    parser.add_argument('--log-sample', action='append', default=[], metavar='LOGGER=N',
+                        help="로거별 분당 최대 기록 수 (예: wearable.serial.rx=60, 0이면 끔, 여러 번 지정 가능)")
+    parser.add_argument('--local-port', type=int, default=LOCAL_API_PORT,
+                        help='LAN 제어 엔드포인트 포트 (기본 0 = 비활성화)')
+    parser.add_argument('--local-host',
+                        help=f"LAN 제어 엔드포인트 주소 (기본: config 'local_api.host', 없으면 {LOCAL_API_HOST} = 로컬 전용; "
+                             "LAN에 공개하려면 0.0.0.0이나 wlan0의 IP를 지정)")
+    parser.add_argument('--gateway', metavar='FILE',
+                        help='게이트웨이 모드: 여러 기기(config + 포트)를 나열한 JSON 파일')
+    parser.add_argument('--export-history', metavar='FILE',
+                        help='로컬 시계열을 CSV로 내보내고 종료 (게이트웨이 모드에서는 FILE에 기기 ID를 붙임)')
+    parser.add_argument('--since', help="내보낼 시작 시각 (예: '2024-05-01 09:00', 기본: 오늘 0시)")
+    parser.add_argument('--until', help='내보낼 끝 시각 (기본: 지금)')
+    parser.add_argument('--step', type=float, help='다운샘플링 간격 (초, 기본: 원본 전체)')
+    parser.add_argument('--record-trace', metavar='FILE',
+                        help='시리얼 송수신과 리스너 이벤트를 기록할 트레이스 파일 (replay.py로 재생)')
+    return parser.parse_args(argv)
+
+def discover_serial_ports():
+    ports = []
+    for pattern in SERIAL_PORT_PATTERNS:
+        ports.extend(sorted(glob.glob(pattern)))
+    return ports
+
+def load_gateway_devices(gateway_path):
+    """게이트웨이 파일을 읽어 Device 목록을 만든다.
+
+    형식: {"devices": [{"config": "config_a.json", "port": "/dev/ttyACM0"}, {"config": "config_b.json"}]}
+    상대 경로는 게이트웨이 파일 위치 기준이며, port가 없으면 남은 포트를 자동으로 할당한다.
+    설정이 올바르지 않은 기기는 건너뛴다 (게이트웨이 모드에서는 대화형 최초 설정을 하지 않음).
+    """
+    base_dir = os.path.dirname(os.path.abspath(gateway_path))
+    with open(gateway_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    raw_entries = data.get('devices') if isinstance(data, dict) else None
+    if not isinstance(raw_entries, list):
+        log.error("❌ 게이트웨이 파일 '%s'에 'devices' 목록이 없습니다.", gateway_path)
+        return []
+
+    # 형식이 잘못된 항목은 몇 번째인지 알려주고 건너뜀 (나머지 기기는 계속 시작)
+    entries = []
+    for index, entry in enumerate(raw_entries):
+        if (not isinstance(entry, dict) or not isinstance(entry.get('config'), str) or not entry['config']
+                or not isinstance(entry.get('port') or '', str)):
+            log.error("❌ 게이트웨이 항목 #%d이(가) 올바르지 않아 건너뜁니다 "
+                      "(config 문자열과 선택적 port 문자열 필요): %r", index, entry)
+            continue
+        entries.append(entry)
+
+    claimed = {entry['port'] for entry in entries if entry.get('port')}
+    free_ports = [p for p in discover_serial_ports() if p not in claimed]
+
+    result = []
+    seen_ids = set()
+    for entry in entries:
+        dev = Device(os.path.join(base_dir, entry['config']), entry.get('port'))
+        if not os.path.exists(dev.config_path) or not validate_and_load_config(dev):
+            log.error("❌ 기기 설정 '%s'을(를) 사용할 수 없어 건너뜁니다.", dev.config_path)
+            continue
+        if dev.device_id in seen_ids:
+            log.error("❌ 중복된 기기 ID '%s' 설정을 건너뜁니다.", dev.device_id)
+            continue
+        if not dev.port_name:
+            if not free_ports:
+                log.error("❌ 기기 %s에 할당할 시리얼 포트가 없어 건너뜁니다.", dev.device_id)
+                continue
+            dev.port_name = free_ports.pop(0)
+        seen_ids.add(dev.device_id)
+        dev.tag = f'[{dev.device_id}] '
+        dev.command_channel.tag = dev.tag
+        result.append(dev)
+    return result
+
+def main(argv=None):
+    global cloud, main_loop_running, outbox, devices, tracer, cloud_worker
     
+    args = parse_args(argv)
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, CONFIG_FILE)
+    sample_limits = dict(LOGGING_SAMPLE_LIMITS)
+    for item in args.log_sample:
+        name, _, limit = item.partition('=')
+        sample_limits[name] = int(limit)
+    log_listener = setup_logging(args.log_level, args.log_json, sample_limits)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda *_: dump_log_ring(os.path.join(script_dir, LOGGING_DUMP_FILE)))
+    key_path = os.path.join(script_dir, FIREBASE_KEY_FILE)
+    if args.cloud_process:
+        cloud_worker = ProcessBackend(args.backend, key_path)
+        cloud_worker.on_spill = enqueue_writes
+        cloud_worker.on_status_result = record_cloud_result
+        cloud = MeteredBackend(cloud_worker)
+    elif args.backend == 'memory':
+        cloud = MeteredBackend(InMemoryBackend())
+    else:
+        cloud = MeteredBackend(FirebaseBackend(key_path))
     
     # 백그라운드 스레드 객체를 미리 선언
     firebase_thread = None
-    arduino_thread = None
+    writer_thread = None
+    arduino_threads = []
+    metrics_server = None
+    local_server = None
     
     try:
-        if not os.path.exists(config_path) or not validate_and_load_config(config_path):
-            print("최초 설정이 필요합니다.")
-            try:
-                key_path = os.path.join(script_dir, FIREBASE_KEY_FILE)
-                cred = credentials.Certificate(key_path)
-                database_url = f'https://{cred.project_id}-default-rtdb.firebaseio.com/'
-                firebase_app = firebase_admin.initialize_app(cred, {'databaseURL': database_url})
-                setup_device_and_config()
-            except Exception as e:
-                print(f"❌ 최초 설정 중 치명적 오류: {e}"); return # 함수 종료
-        
-        print(f"--- 기기 {device_id} 컨트롤러 시작 ---")
+        if args.gateway:
+            devices = load_gateway_devices(args.gateway)
+            if not devices:
+                log.error("❌ 게이트웨이에서 실행할 기기가 없습니다."); return
+            log.info("--- 게이트웨이 시작: 기기 %d대 (%s) ---", len(devices), ', '.join(d.device_id for d in devices))
+        else:
+            dev = Device(os.path.join(script_dir, CONFIG_FILE))
+            if not os.path.exists(dev.config_path) or not validate_and_load_config(dev):
+                log.info("최초 설정이 필요합니다.")
+                try:
+                    cloud.connect()
+                    setup_device_and_config(dev)
+                except Exception as e:
+                    log.exception("❌ 최초 설정 중 치명적 오류: %s", e); return # 함수 종료
+            devices = [dev]
+            log.info("--- 기기 %s 컨트롤러 시작 ---", dev.device_id)
 
-        try:
-            print("기본 프리셋 적용을 위해 아두이노 연결을 시도합니다...")
-            arduino = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=1)
-            time.sleep(2)
-            print(f"✅ 아두이노 연결 성공 ({ARDUINO_PORT})")
-            default_preset_id = config_data.get('default_preset')
-            if default_preset_id:
-                apply_preset_to_arduino(default_preset_id)
-        except serial.SerialException as e:
-            print(f"⚠️ 아두이노 초기 연결 실패: {e}. 스레드에서 재시도합니다.")
-            arduino = None
-
-        firebase_thread = threading.Thread(target=firebase_thread_worker)
-        arduino_thread = threading.Thread(target=arduino_thread_worker)
-        
-        firebase_thread.start()
-        arduino_thread.start()
-        
-        while main_loop_running:
-            time.sleep(1)
-            if not firebase_thread.is_alive() or not arduino_thread.is_alive():
-                print("오류: 백그라운드 스레드 중 하나가 예기치 않게 종료되었습니다.")
-                main_loop_running = False
+        if args.export_history:
+            for dev in devices:
+                path = args.export_history
+                if len(devices) > 1:
+                    path = f'{os.path.splitext(path)[0]}_{dev.device_id}{os.path.splitext(path)[1]}'
+                export_history(dev, path, args.since, args.until, args.step)
+            return
+
+        outbox = OutboundQueue(os.path.join(script_dir, OUTBOX_FILE))
+        if len(outbox):
+            log.info("📦 전송되지 않은 오프라인 큐 항목 %d개가 있습니다.", len(outbox))
+        metrics.gauge('outbox.depth', lambda: len(outbox) if outbox is not None else 0)
+        metrics.gauge('threads', threading.active_count)
+        metrics.gauge('writes.pending', lambda: len(write_scheduler))
+        metrics_server = start_metrics_server(args.metrics_port)
+        local_server = start_local_api(devices, apply_local_control, switch_preset, lambda: main_loop_running,
+                                       args.local_port, args.local_host or local_api_host(devices))
+        startup.mark('config_loaded')
+
+        # 마지막 제어 상태를 먼저 채널에 넣어 두면, 시리얼 연결(기기별 스레드/태스크)과
+        # 클라우드 연결이 동시에 진행되는 동안 세션이 열리는 즉시 아두이노로 전송된다
+        for dev in devices:
+            restore_control_state(dev)
+        if cloud_worker is not None:
+            cloud_worker.register_devices(devices)
+            # 런타임과 관계없이 워커를 감시 (죽거나 멈추면 재시작, 시리얼 루프에는 영향 없음)
+            threading.Thread(target=cloud_worker_supervisor, name='cloud-supervisor', daemon=True).start()
+        if args.record_trace:
+            tracer = TraceRecorder(args.record_trace)
+            for dev in devices:
+                tracer.add_device(dev)
+            log.info("📼 트레이스 기록 중: %s", args.record_trace)
+
+        if args.runtime == 'asyncio':
+            asyncio.run(AsyncRuntime(devices).run())
+        else:
+            firebase_thread = threading.Thread(target=firebase_thread_worker, args=(devices,))
+            writer_thread = threading.Thread(target=write_scheduler_worker)
+            arduino_threads = [threading.Thread(target=arduino_thread_worker, args=(dev,)) for dev in devices]
+            
+            firebase_thread.start()
+            writer_thread.start()
+            for thread in arduino_threads:
+                thread.start()
+            
+            while main_loop_running:
+                time.sleep(1)
+                if not all(t.is_alive() for t in [firebase_thread, writer_thread] + arduino_threads):
+                    log.error("오류: 백그라운드 스레드 중 하나가 예기치 않게 종료되었습니다.")
+                    main_loop_running = False
 
     except KeyboardInterrupt:
-        print("\nCtrl+C 감지. 프로그램을 종료합니다.")
+        log.info("Ctrl+C 감지. 프로그램을 종료합니다.")
     finally:
         # 1. 모든 스레드에 종료 신호를 보냅니다.
         main_loop_running = False
-        print("백그라운드 스레드 종료를 기다리는 중...")
+        log.info("백그라운드 스레드 종료를 기다리는 중...")
         
         # 2. 스레드가 종료될 때까지 기다립니다.
-        if firebase_thread and firebase_thread.is_alive():
-            firebase_thread.join(timeout=5)
-        if arduino_thread and arduino_thread.is_alive():
-            arduino_thread.join(timeout=5)
+        for thread in (firebase_thread, writer_thread):
+            if thread and thread.is_alive():
+                thread.join(timeout=5)
+        for thread in arduino_threads:
+            if thread.is_alive():
+                thread.join(timeout=5)
         
         # 3. 모든 스레드가 종료된 '후'에 리소스를 해제합니다.
-        if listener:
-            print("Firebase 리스너를 종료합니다...")
-            listener.close()
-        if arduino and arduino.is_open:
-            print("아두이노 연결을 닫습니다...")
-            arduino.close()
+        for dev in devices:
+            if dev.listener:
+                log.info("%sFirebase 리스너를 종료합니다...", dev.tag)
+                dev.listener.close()
+            if dev.preset_listener:
+                dev.preset_listener.close()
+            if dev.arduino and dev.arduino.is_open:
+                log.info("%s아두이노 연결을 닫습니다...", dev.tag)
+                dev.arduino.close()
+            dev.config_store.flush()  # 지연 중인 설정 저장
+            dev.log_rollup.store.flush()
+            if dev._history:
+                dev.history.flush()
 
-        # 4. 마지막으로 Firebase 상태를 업데이트합니다.
+        # 4. 마지막으로 Firebase 상태를 업데이트하고 남은 쓰기를 보냅니다 (오프라인이면 outbox에 보관).
         if firebase_is_connected:
-            set_connection_status("offline")
-            # Firebase와 통신할 시간을 약간 줍니다.
-            time.sleep(2)
+            for dev in devices:
+                set_connection_status(dev, "offline")
+        if outbox is not None:
+            while write_scheduler.flush():
+                pass
+        if cloud_worker is not None:
+            cloud_worker.stop()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if local_server is not None:
+            local_server.shutdown()
+        if outbox is not None:
+            write_metrics_file()
+            outbox.close()
+        if tracer is not None:
+            tracer.close()
+            log.info("📼 트레이스 레코드 %d개 저장: %s", tracer.records, tracer.path)
         
-        print("--- 모든 작업이 정상적으로 종료되었습니다. ---")
+        log.info("--- 모든 작업이 정상적으로 종료되었습니다. ---")
+        log_listener.stop()  # 큐에 남은 로그를 모두 출력
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()